@@ -0,0 +1,279 @@
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from synthetic import SRC_DIR, generate
+
+PROJECT_ROOT = os.path.dirname(SRC_DIR)
+BACKEND_DIR = os.path.join(PROJECT_ROOT, "dashboard", "backend")
+
+# Command of every stage, run from a work directory laid out like the project
+STAGES = {
+    "cleaning": lambda fmt: [os.path.join(SRC_DIR, "cleaning.py"), "data/raw/dataset.csv"],
+    "prepare": lambda fmt: [os.path.join(SRC_DIR, "prepare.py"), "data/prep/dataset_cleaned.{}".format(fmt)],
+    "train": lambda fmt: [os.path.join(SRC_DIR, "train.py"), "data/train", "models/model.pkl"],
+}
+# Features sent to /api/predict (fields of SongFeatures)
+API_FEATURES = ["danceability", "energy", "acousticness", "instrumentalness", "valence", "speechiness",
+                "liveness", "tempo", "duration_ms", "loudness", "explicit", "key", "mode",
+                "time_signature", "track_genre"]
+
+
+def environment():
+    """
+    Describe the machine and the code version of a run, to compare results.
+
+    Returns:
+        dict: Python, platform, CPU count and git commit.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "git_commit": commit,
+    }
+
+
+def run_stages(workdir, stages, fmt):
+    """
+    Run pipeline stages one after the other and time them.
+
+    Every stage runs in its own process with ``workdir`` as working directory,
+    so the relative paths of ``params.yaml`` resolve inside it. The step
+    profile written by the stage (``metrics/profile_<stage>.json``) is
+    included in the result.
+
+    Args:
+        workdir (str): Directory with ``params.yaml`` and ``data/raw/dataset.csv``.
+        stages (list): Stage names (keys of ``STAGES``).
+        fmt (str): Storage format of the intermediate tables.
+
+    Returns:
+        dict: Wall time, exit code and step profile of every stage run; stops at the first failure.
+    """
+    results = {}
+    for stage in stages:
+        sys.stderr.write("  {}...\n".format(stage))
+        with open(os.path.join(workdir, "{}.log".format(stage)), "w") as log:
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable] + STAGES[stage](fmt), cwd=workdir, stdout=log, stderr=log)
+            wall = time.perf_counter() - start
+
+        result = {"wall_time_s": round(wall, 4), "returncode": process.returncode}
+        profile_path = os.path.join(workdir, "metrics", "profile_{}.json".format(stage))
+        if os.path.exists(profile_path):
+            with open(profile_path) as f:
+                profile = json.load(f)
+            result["peak_rss_mb"] = profile["total"]["peak_rss_mb"]
+            result["steps"] = profile["steps"]
+        results[stage] = result
+        if process.returncode != 0:
+            sys.stderr.write("  {} failed, see {}.log\n".format(stage, stage))
+            break
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request(connection, method, path, payload=None):
+    body = None if payload is None else json.dumps(payload)
+    connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def _send(port, path, payloads):
+    # One keep-alive connection per client thread
+    latencies, errors = [], 0
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        for payload in payloads:
+            start = time.perf_counter()
+            try:
+                ok = _request(connection, "POST", path, payload)[0] == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+    finally:
+        connection.close()
+    return latencies, errors
+
+
+def _get_json(port, path):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        status, body = _request(connection, "GET", path)
+        return status, json.loads(body)
+    finally:
+        connection.close()
+
+
+def load_test(port, path, payloads, concurrency):
+    """
+    Send the payloads to an endpoint from ``concurrency`` clients at the same time.
+
+    Args:
+        port (int): Port of the API on localhost.
+        path (str): Endpoint.
+        payloads (list): Request bodies, split evenly between the clients.
+        concurrency (int): Number of concurrent clients.
+
+    Returns:
+        dict: Requests, errors, throughput and latency percentiles in milliseconds.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: _send(port, path, payloads[i::concurrency]), range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.concatenate([latency for latency, _ in results]) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(payloads),
+        "errors": sum(errors for _, errors in results),
+        "throughput_rps": round(len(payloads) / elapsed, 2),
+        "latency_ms": {
+            "mean": round(float(latencies.mean()), 3),
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p95": round(float(np.percentile(latencies, 95)), 3),
+            "p99": round(float(np.percentile(latencies, 99)), 3),
+            "max": round(float(latencies.max()), 3),
+        },
+    }
+
+
+def benchmark_api(workdir, config, seed):
+    """
+    Start the API on the model trained in ``workdir`` and load-test ``/api/predict``.
+
+    Args:
+        workdir (str): Work directory where the train stage saved the model.
+        config (dict): ``benchmark.api`` section of ``params.yaml``.
+        seed (int): Seed used to sample the songs sent.
+
+    Returns:
+        dict: Results of the sequential and the concurrent load tests.
+    """
+    songs = pd.read_csv(os.path.join(workdir, "data", "raw", "dataset.csv"), usecols=API_FEATURES,
+                        nrows=100_000).dropna()
+    # Distinct songs for the warm-up and each test, so the prediction cache is not hit
+    n_warm_up, n_single = 20, config["single_requests"]
+    n_songs = n_warm_up + n_single + config["requests"]
+    songs = songs.sample(n_songs, replace=n_songs > len(songs), random_state=seed)
+    payloads = songs[API_FEATURES].to_dict("records")
+    warm_up = payloads[:n_warm_up]
+    single = payloads[n_warm_up:n_warm_up + n_single]
+    concurrent = payloads[n_warm_up + n_single:]
+
+    port = _free_port()
+    with open(os.path.join(workdir, "api.log"), "w") as log:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+            cwd=BACKEND_DIR, stdout=log, stderr=log,
+            env=dict(os.environ, MODEL_PATH=os.path.join(workdir, "models", "model.pkl"),
+                     PREPROCESSOR_PATH=os.path.join(workdir, "data", "train", "preprocessor.joblib"),
+                     BUNDLE_PATH=os.path.join(workdir, "models", "bundle")),
+        )
+        try:
+            deadline = time.monotonic() + config["startup_timeout"]
+            while True:
+                try:
+                    if _get_json(port, "/api/ready")[0] == 200:
+                        break
+                except (OSError, http.client.HTTPException, ValueError):
+                    pass
+                if server.poll() is not None or time.monotonic() > deadline:
+                    # The work directory is removed afterwards: keep the end of the log in the error
+                    with open(log.name) as f:
+                        tail = "".join(f.readlines()[-20:])
+                    raise RuntimeError("The API did not start:\n{}".format(tail))
+                time.sleep(0.2)
+
+            # Warm-up, not measured
+            _send(port, "/api/predict", warm_up)
+            return {
+                "single": load_test(port, "/api/predict", single, 1),
+                "concurrent": load_test(port, "/api/predict", concurrent, config["concurrency"]),
+                "stats": _get_json(port, "/api/stats")[1],
+            }
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    params = yaml.safe_load(open("params.yaml"))
+    config = params["benchmark"]
+
+    if len(sys.argv) != 2:
+        sys.stderr.write("Arguments error. Usage:\n")
+        sys.stderr.write("\tpython benchmarks/run.py results.json\n")
+        sys.exit(1)
+
+    output = sys.argv[1]
+    seed = config["seed"]
+    fmt = params["data"]["format"]
+
+    # Every size runs from scratch with the current parameters of the pipeline
+    stage_params = dict(params)
+    stage_params["cleaning"] = dict(params["cleaning"], incremental=False)
+    stage_params["prepare"] = dict(params["prepare"], incremental=False)
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "params": {key: stage_params[key] for key in ["data", "cleaning", "prepare", "train"]},
+        "sizes": {},
+        "api": None,
+    }
+    for n_rows in config["sizes"]:
+        with tempfile.TemporaryDirectory(prefix="benchmark_", dir=config.get("workdir")) as workdir:
+            sys.stderr.write("{:,} rows: generating the dataset\n".format(n_rows))
+            with open(os.path.join(workdir, "params.yaml"), "w") as f:
+                yaml.dump(stage_params, f, default_flow_style=False)
+            start = time.perf_counter()
+            rows = generate(os.path.join(workdir, "data", "raw", "dataset.csv"), n_rows, seed)
+            size = {"raw_rows": rows, "generate_time_s": round(time.perf_counter() - start, 4)}
+
+            size["stages"] = run_stages(workdir, config["stages"], fmt)
+            trained = size["stages"].get("train", {}).get("returncode") == 0
+            if config["api"]["rows"] == n_rows and trained:
+                sys.stderr.write("  /api/predict load test\n")
+                results["api"] = dict(benchmark_api(workdir, config["api"], seed), model_rows=n_rows)
+            results["sizes"][str(n_rows)] = size
+
+        # Saved after every size, so the smaller sizes are kept if a larger one is interrupted
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    sys.stderr.write("Results saved to {}\n".format(output))
+
+
+if __name__ == "__main__":
+    main()
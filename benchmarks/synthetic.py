@@ -0,0 +1,91 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# The column order and dtypes come from the pipeline sources (src/schema.py)
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC_DIR)
+
+from schema import SCHEMA
+
+# Same number of genres as dataset.csv; names are synthetic
+GENRES = np.array(["genre_{:03d}".format(i) for i in range(114)])
+# Fraction of rows repeated and of rows with a missing artist, as in dataset.csv
+DUPLICATE_FRACTION = 0.004
+MISSING_FRACTION = 0.00001
+
+
+def generate_chunk(rng, start, n_rows):
+    """
+    Generate Spotify-like tracks with the columns and value ranges of ``dataset.csv``.
+
+    Args:
+        rng (numpy.random.Generator): Random generator.
+        start (int): Index of the first row.
+        n_rows (int): Rows to generate.
+
+    Returns:
+        pandas.DataFrame: Tracks, with a few duplicated rows and missing values.
+    """
+    index = np.arange(start, start + n_rows)
+    df = pd.DataFrame({
+        "index": index,
+        "track_id": pd.Series(index).map("{:022x}".format),
+        "artists": rng.integers(0, 30_000, n_rows).astype(str),
+        "album_name": rng.integers(0, 45_000, n_rows).astype(str),
+        "track_name": rng.integers(0, 70_000, n_rows).astype(str),
+        "popularity": np.clip(rng.gamma(2.0, 17.0, n_rows), 0, 100).astype(int),
+        "duration_ms": np.clip(rng.lognormal(12.3, 0.4, n_rows), 8_000, 5_300_000).astype(int),
+        "explicit": rng.random(n_rows) < 0.09,
+        "danceability": rng.beta(5, 3, n_rows).round(3),
+        "energy": rng.beta(3, 2, n_rows).round(3),
+        "key": rng.integers(0, 12, n_rows),
+        "loudness": np.clip(rng.normal(-8.3, 5.0, n_rows), -50, 5).round(3),
+        "mode": (rng.random(n_rows) < 0.64).astype(int),
+        "speechiness": rng.beta(1, 10, n_rows).round(4),
+        "acousticness": rng.beta(0.7, 1.5, n_rows).round(4),
+        "instrumentalness": np.where(rng.random(n_rows) < 0.6, 0.0, rng.random(n_rows)).round(4),
+        "liveness": rng.beta(1.5, 5, n_rows).round(4),
+        "valence": rng.beta(2, 2, n_rows).round(3),
+        "tempo": np.clip(rng.normal(122, 30, n_rows), 0, 243).round(3),
+        "time_signature": rng.choice([0, 1, 3, 4, 5], n_rows, p=[0.001, 0.008, 0.08, 0.895, 0.016]),
+        "track_genre": rng.choice(GENRES, n_rows),
+    }, columns=list(SCHEMA))
+
+    missing = rng.random(n_rows) < MISSING_FRACTION
+    df.loc[missing, "artists"] = np.nan
+    duplicates = df.iloc[rng.choice(n_rows, int(n_rows * DUPLICATE_FRACTION), replace=False)]
+    return pd.concat([df, duplicates], ignore_index=True)
+
+
+def generate(path, n_rows, seed, chunksize=1_000_000):
+    """
+    Write a synthetic raw dataset with the schema of ``dataset.csv``, chunk by chunk.
+
+    Args:
+        path (str): Output CSV file.
+        n_rows (int): Distinct rows (the duplicates come on top).
+        seed (int): Seed of the generator.
+        chunksize (int): Rows generated and written at a time.
+
+    Returns:
+        int: Rows written.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    written = 0
+    for start in range(0, n_rows, chunksize):
+        chunk = generate_chunk(rng, start, min(chunksize, n_rows - start))
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+        written += len(chunk)
+    return written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.stderr.write("Arguments error. Usage:\n")
+        sys.stderr.write("\tpython synthetic.py rows output.csv\n")
+        sys.exit(1)
+    generate(sys.argv[2], int(sys.argv[1]), seed=20250901)
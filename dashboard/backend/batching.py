@@ -0,0 +1,110 @@
+import asyncio
+
+
+def score_records(model, records):
+    """
+    Score a batch in one model call, falling back to one call per record if it fails.
+
+    Runs in a worker thread, so isolating a failing request does not block the event loop.
+
+    Args:
+        model (PopularityModel): Model to score with.
+        records (list): Raw features of every request.
+
+    Returns:
+        list: Score of every record, or the exception raised for its features.
+    """
+    try:
+        return [float(score) for score in model.predict_records(records)]
+    except Exception:
+        # Isolate the failing request(s): score the batch one by one
+        results = []
+        for features in records:
+            try:
+                results.append(model.predict_one(features))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+class MicroBatcher:
+    """
+    Merge concurrent single predictions into one vectorized model call.
+
+    Requests are queued; the first one opens a window of ``max_wait`` seconds
+    (or until ``max_size`` requests are queued) and everything collected in it is
+    scored together. Each caller awaits its own future and gets back its score,
+    or the error raised for its own features.
+    """
+
+    def __init__(self, get_model, max_wait=0.002, max_size=64):
+        self.get_model = get_model
+        self.max_wait = max_wait
+        self.max_size = max_size
+        self.batches = 0
+        self.requests = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+    async def predict(self, features):
+        """
+        Queue a single prediction and wait for its batch to be scored.
+
+        Args:
+            features (dict): Raw value of every input feature.
+
+        Returns:
+            float: Popularity score.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._score(batch)
+
+    async def _score(self, batch):
+        model = self.get_model()
+        records = [features for features, _ in batch]
+        self.batches += 1
+        self.requests += len(batch)
+        try:
+            results = await asyncio.to_thread(score_records, model, records)
+        except Exception as e:
+            # The batch could not be scored at all (e.g. no model during a shutdown):
+            # every caller gets the error instead of waiting forever
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
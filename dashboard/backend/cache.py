@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """
+    In-process LRU cache of scores with a time-to-live per entry.
+
+    Keys are the feature values in a fixed order. When ``decimals`` is set,
+    float features are rounded first so nearly identical songs (e.g. slider
+    moves below the display precision) share the same entry.
+    """
+
+    def __init__(self, max_size=10_000, ttl=300.0, decimals=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, features):
+        """
+        Build the cache key of a feature dict.
+
+        Args:
+            features (dict): Raw value of every input feature.
+
+        Returns:
+            tuple: Hashable key.
+        """
+        if self.decimals is None:
+            return tuple(features.values())
+        return tuple(
+            round(value, self.decimals) if isinstance(value, float) else value
+            for value in features.values()
+        )
+
+    def get(self, key):
+        """Return the cached score of ``key``, or None when missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, score):
+        with self._lock:
+            self._entries[key] = (score, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every entry, e.g. after the model is reloaded."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -1,7 +1,75 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import numpy as np
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, model_validator
 from fastapi.middleware.cors import CORSMiddleware
-app = FastAPI()
+from sklearn import set_config
+
+from batching import MicroBatcher
+from cache import PredictionCache
+from model import BUNDLE_PATH, FEATURE_STORE_PATH, SCORE_TABLE_PATH, PopularityModel
+from registry import ValidationError, load_candidate, read_version
+
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 100_000))
+# Window used to merge concurrent /api/predict calls (0 disables micro-batching)
+MICROBATCH_WINDOW_MS = float(os.environ.get("MICROBATCH_WINDOW_MS", 2))
+MICROBATCH_MAX_SIZE = int(os.environ.get("MICROBATCH_MAX_SIZE", 64))
+# Prediction cache (size 0 disables it); decimals quantize the float features of the key
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 10_000))
+PREDICTION_CACHE_TTL = float(os.environ.get("PREDICTION_CACHE_TTL", 300))
+PREDICTION_CACHE_DECIMALS = os.environ.get("PREDICTION_CACHE_DECIMALS")
+
+# Seconds between checks for a new feature store or score table (0 disables the reload)
+TABLE_RELOAD_SECONDS = float(os.environ.get("TABLE_RELOAD_SECONDS", 5))
+
+# Seconds between checks for a new model bundle (0 disables the hot swap)
+MODEL_RELOAD_SECONDS = float(os.environ.get("MODEL_RELOAD_SECONDS", 10))
+# Checks in a row a new bundle may fail to load (not to validate) before it is no longer retried
+MODEL_RELOAD_ATTEMPTS = int(os.environ.get("MODEL_RELOAD_ATTEMPTS", 5))
+
+state = {"model": None, "features": None, "scores": None}
+# Hot swaps done, versions rejected (with the reason), failed load attempts by version and last validation result
+registry = {"swaps": 0, "rejected": {}, "failures": {}, "validation": None}
+cache = PredictionCache(
+    max_size=PREDICTION_CACHE_SIZE,
+    ttl=PREDICTION_CACHE_TTL,
+    decimals=int(PREDICTION_CACHE_DECIMALS) if PREDICTION_CACHE_DECIMALS else None,
+)
+batcher = MicroBatcher(
+    lambda: state["model"], max_wait=MICROBATCH_WINDOW_MS / 1000, max_size=MICROBATCH_MAX_SIZE
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm the model once per process, before serving requests
+    set_config(assume_finite=True)
+    model = PopularityModel.load()
+    model.warm_up()
+    set_model(model)
+    set_tables(*load_tables(model))
+    if MICROBATCH_WINDOW_MS > 0:
+        batcher.start()
+    watchers = []
+    if TABLE_RELOAD_SECONDS > 0:
+        watchers.append(asyncio.create_task(watch_tables()))
+    if MODEL_RELOAD_SECONDS > 0:
+        watchers.append(asyncio.create_task(watch_model()))
+    yield
+    for watcher in watchers:
+        watcher.cancel()
+    await batcher.stop()
+    set_model(None)
+    set_tables(None, None)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,18 +85,307 @@ class SongFeatures(BaseModel):
     acousticness: float
     instrumentalness: float
     valence: float
+    speechiness: float
+    liveness: float
     tempo: float
+    duration_ms: float
+    loudness: float
+    explicit: bool
+    key: int
+    mode: int
+    time_signature: int
+    track_genre: str
+
+
+class SongFeaturesBatch(BaseModel):
+    """Columnar batch of songs: one list per feature, all of the same length."""
+
+    danceability: list[float]
+    energy: list[float]
+    acousticness: list[float]
+    instrumentalness: list[float]
+    valence: list[float]
+    speechiness: list[float]
+    liveness: list[float]
+    tempo: list[float]
+    duration_ms: list[float]
+    loudness: list[float]
+    explicit: list[bool]
+    key: list[int]
+    mode: list[int]
+    time_signature: list[int]
+    track_genre: list[str]
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        lengths = {len(values) for values in self.__dict__.values()}
+        if len(lengths) != 1:
+            raise ValueError("All feature lists must have the same length")
+        if lengths.pop() > MAX_BATCH_SIZE:
+            raise ValueError(f"Batches are limited to {MAX_BATCH_SIZE} songs")
+        return self
+
+
+class TrackId(BaseModel):
+    track_id: str
+
+
+class TrackIdBatch(BaseModel):
+    track_ids: list[str]
+
+    @model_validator(mode="after")
+    def check_size(self):
+        if len(self.track_ids) > MAX_BATCH_SIZE:
+            raise ValueError(f"Batches are limited to {MAX_BATCH_SIZE} songs")
+        return self
+
+
+def set_model(model):
+    # Scores cached for the previous model are no longer valid
+    state["model"] = model
+    cache.invalidate()
+
+
+def get_model():
+    model = state["model"]
+    if model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+    return model
+
+
+def load_tables(model):
+    store = model.load_feature_store()
+    return store, model.load_score_table(store)
+
+
+def set_tables(store, table):
+    # Each is replaced by a single assignment: requests in flight keep the objects they already read
+    state["features"] = store
+    state["scores"] = table
+
+
+def tables_signature():
+    # The stages write their outputs to a temporary directory and rename it, so a new
+    # store or table always comes with a new inode
+    signature = []
+    for path in (FEATURE_STORE_PATH, SCORE_TABLE_PATH):
+        try:
+            info = os.stat(path)
+            signature.append((info.st_ino, info.st_mtime_ns))
+        except OSError:
+            signature.append(None)
+    return signature
+
+
+async def watch_tables():
+    """Reload the feature store and the score table in the background when `dvc repro` replaces them."""
+    signature = tables_signature()
+    while True:
+        await asyncio.sleep(TABLE_RELOAD_SECONDS)
+        current = tables_signature()
+        if current == signature or state["model"] is None:
+            continue
+        signature = current
+        try:
+            tables = await asyncio.to_thread(load_tables, state["model"])
+        except (OSError, ValueError) as e:
+            sys.stderr.write(f"Feature store or score table not reloaded: {e}\n")
+            continue
+        set_tables(*tables)
+
+
+async def watch_model():
+    """
+    Serve the model of a new bundle once it is loaded, warmed up and validated, without a restart.
+
+    The new model is prepared in a worker thread while the current one keeps
+    answering; the swap is a single assignment, so requests in flight finish
+    with the model they started with and the next ones get the new one.
+
+    A model that fails the validation is rejected at once. Any other error
+    (I/O, a bundle still being copied, a feature store being rebuilt...) is
+    retried on the next checks, up to ``MODEL_RELOAD_ATTEMPTS`` times in a row.
+    """
+    while True:
+        await asyncio.sleep(MODEL_RELOAD_SECONDS)
+        await check_model()
+
+
+async def check_model():
+    """Load, validate and serve the bundle of ``BUNDLE_PATH`` if it holds a new model (see :func:`watch_model`)."""
+    current = state["model"]
+    version = read_version(BUNDLE_PATH)
+    if version is None or version in registry["rejected"] or (current is not None and version == current.version):
+        return
+    try:
+        model, result = await asyncio.to_thread(load_candidate, BUNDLE_PATH, current)
+        tables = await asyncio.to_thread(load_tables, model)
+    except ValidationError as e:
+        # The served model stays and this version is not retried
+        registry["rejected"][version] = f"{type(e).__name__}: {e}"
+        registry["failures"].pop(version, None)
+        sys.stderr.write(f"Model {version} rejected: {e}\n")
+        return
+    except Exception as e:
+        attempts = registry["failures"].get(version, 0) + 1
+        registry["failures"][version] = attempts
+        if attempts >= MODEL_RELOAD_ATTEMPTS:
+            registry["rejected"][version] = f"{type(e).__name__}: {e} (after {attempts} attempts)"
+            registry["failures"].pop(version)
+            sys.stderr.write(f"Model {version} rejected after {attempts} attempts: {e}\n")
+        else:
+            sys.stderr.write(f"Model {version} not loaded (attempt {attempts} of {MODEL_RELOAD_ATTEMPTS}): {e}\n")
+        return
+    registry["failures"].clear()
+    set_model(model)
+    set_tables(*tables)
+    registry["swaps"] += 1
+    registry["validation"] = dict(result, model_version=version)
+
+
+def get_feature_store():
+    store = state["features"]
+    if store is None:
+        raise HTTPException(status_code=503, detail="Feature store not available")
+    return store
+
+
+def get_score_table(model):
+    # Only scores computed by the model being served
+    table = state["scores"]
+    if table is None or table.model_version != model.version:
+        return None
+    return table
+
+
+def scoring_error(model, error):
+    """
+    HTTP error of a prediction that raised ``error``.
+
+    503 (retry) when the model was replaced while the request was scored, e.g.
+    by a hot swap or a shutdown; 422 for features the model rejects
+    (``ValueError``); 500 otherwise, logged with the model version.
+
+    Args:
+        model (PopularityModel): Model the request started with.
+        error (Exception): Error raised while scoring.
+
+    Returns:
+        HTTPException: Error to raise.
+    """
+    if state["model"] is not model:
+        return HTTPException(status_code=503, detail="The model was replaced during the request, retry it",
+                             headers={"Retry-After": "1"})
+    if isinstance(error, ValueError):
+        return HTTPException(status_code=422, detail=str(error))
+    sys.stderr.write(f"Prediction failed with model {model.version}: {type(error).__name__}: {error}\n")
+    return HTTPException(status_code=500, detail=f"Prediction failed ({type(error).__name__})")
+
+
+def score_vectors(model, X):
+    # Rows found in the score table are read from it, the rest go through the model
+    table = get_score_table(model)
+    if table is None:
+        return model.predict_vectors(X)
+    rows = table.rows(X)
+    known = rows >= 0
+    scores = np.empty(len(X))
+    scores[known] = table.scores[rows[known]]
+    if not known.all():
+        scores[~known] = model.predict_vectors(X[~known])
+    return scores
+
+
+@app.get("/api/ready")
+def ready():
+    if state["model"] is None:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {"status": "ready", "model_version": state["model"].version}
+
+
+@app.get("/api/stats")
+def stats():
+    return {
+        "cache": cache.stats(),
+        "microbatching": {"batches": batcher.batches, "requests": batcher.requests},
+        "feature_store": {"tracks": len(state["features"]) if state["features"] is not None else 0},
+        "score_table": state["scores"].header if state["scores"] is not None else None,
+        "model": dict(registry, version=state["model"].version if state["model"] is not None else None),
+    }
+
 
 @app.post("/api/predict")
-def predict(features: SongFeatures):
-    # Mock simple scoring logic
-    score = (
-        features.danceability * 0.35
-        + features.energy * 0.25
-        + features.valence * 0.20
-        + (1 - features.acousticness) * 0.10
-        + (1 - features.instrumentalness) * 0.07
-        + ((features.tempo - 50) / 150) * 0.03
-    )
-    score = max(0, min(1, score))
+async def predict(features: SongFeatures):
+    model = get_model()
+    values = features.model_dump()
+    if PREDICTION_CACHE_SIZE > 0:
+        key = cache.key(values)
+        score = cache.get(key)
+        if score is not None:
+            return {"score": score}
+    score = None
+    table = get_score_table(model)
+    try:
+        if table is not None:
+            score = table.lookup(model.prepare_one(values)[0])
+        if score is None and MICROBATCH_WINDOW_MS > 0:
+            score = await batcher.predict(values)
+        elif score is None:
+            # Off the event loop, as the micro-batches
+            score = await asyncio.to_thread(model.predict_one, values)
+    except Exception as e:
+        raise scoring_error(model, e)
+    # A swap during the await cleared the cache (and the batch may have used the new
+    # model): the score is only cached if the model it was requested from is still served
+    if PREDICTION_CACHE_SIZE > 0 and state["model"] is model:
+        cache.put(key, score)
     return {"score": score}
+
+
+@app.post("/api/predict/batch")
+def predict_batch(batch: SongFeaturesBatch):
+    model = get_model()
+    try:
+        scores = score_vectors(model, model.prepare(batch.__dict__))
+    except Exception as e:
+        raise scoring_error(model, e)
+    return {"scores": scores.tolist()}
+
+
+@app.post("/api/predict/by-id")
+def predict_by_id(track: TrackId):
+    model = get_model()
+    table = get_score_table(model)
+    store = table.store if table is not None else get_feature_store()
+    try:
+        row = store.row(track.track_id)
+        if row >= 0 and table is not None:
+            score = float(table.scores[row])
+        elif row >= 0:
+            score = float(model.predict_vectors(store.vectors[row:row + 1])[0])
+    except Exception as e:
+        raise scoring_error(model, e)
+    if row < 0:
+        raise HTTPException(status_code=404, detail=f"Unknown track_id {track.track_id}")
+    return {"track_id": track.track_id, "score": score}
+
+
+@app.post("/api/predict/by-id/batch")
+def predict_by_id_batch(batch: TrackIdBatch):
+    model = get_model()
+    table = get_score_table(model)
+    store = table.store if table is not None else get_feature_store()
+    try:
+        rows = store.rows(batch.track_ids)
+        known = rows >= 0
+        if table is not None:
+            known_scores = table.scores[rows[known]]
+        else:
+            known_scores = model.predict_vectors(store.vectors[rows[known]]) if known.any() else []
+    except Exception as e:
+        raise scoring_error(model, e)
+    # Unknown ids get a null score
+    scores = [None] * len(batch.track_ids)
+    for i, score in zip(known.nonzero()[0], np.asarray(known_scores, dtype=float).tolist()):
+        scores[i] = score
+    return {"scores": scores}
@@ -0,0 +1,222 @@
+import os
+import pickle
+import sys
+import threading
+import warnings
+
+import joblib
+import numpy as np
+
+# Models fitted on DataFrames warn on every call when given a plain array
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+PROJECT_ROOT = os.environ.get(
+    "POPULARITY_ROOT", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+)
+MODEL_PATH = os.environ.get("MODEL_PATH", os.path.join(PROJECT_ROOT, "models", "model.pkl"))
+PREPROCESSOR_PATH = os.environ.get(
+    "PREPROCESSOR_PATH", os.path.join(PROJECT_ROOT, "data", "train", "preprocessor.joblib")
+)
+# Artifact bundle written by train.py, preferred over the two files above when present
+BUNDLE_PATH = os.environ.get("BUNDLE_PATH", os.path.join(PROJECT_ROOT, "models", "bundle"))
+# Feature store written by src/features.py (prepared vectors of the known tracks, by track_id)
+FEATURE_STORE_PATH = os.environ.get("FEATURE_STORE_PATH", os.path.join(PROJECT_ROOT, "data", "features"))
+# Score table written by src/catalog.py (precomputed score of every track of the feature store)
+SCORE_TABLE_PATH = os.environ.get("SCORE_TABLE_PATH", os.path.join(PROJECT_ROOT, "models", "scores"))
+# Batches up to this size are scored by the compiled forest, larger ones by the
+# original estimator (its compiled loops are faster on many rows); 0 disables it
+COMPILED_MAX_ROWS = int(os.environ.get("COMPILED_MAX_ROWS", 128))
+
+# The fitted preprocessor is defined in the pipeline sources (src/preprocessing.py)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "src"))
+
+
+class PopularityModel:
+    """
+    Trained model plus its fitted preprocessor, loaded once and kept in memory.
+
+    Single predictions reuse a preallocated feature row per thread, so the
+    request path does no allocation besides the model call itself. Tree
+    ensembles are also compiled to flat arrays (``forest.CompiledForest``),
+    which score single rows and micro-batches without the per-call overhead of
+    scikit-learn.
+    """
+
+    def __init__(self, model, preprocessor, header=None, compiled=None):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.header = header or {}
+        self.compiled = compiled
+        self.n_features = preprocessor.n_features_
+        self._local = threading.local()
+
+        # Single rows are faster without the joblib thread pool of the forest
+        if hasattr(model, "n_jobs"):
+            model.n_jobs = 1
+
+    @classmethod
+    def load(cls, model_path=MODEL_PATH, preprocessor_path=PREPROCESSOR_PATH, bundle_path=BUNDLE_PATH):
+        if bundle_path and os.path.isdir(bundle_path):
+            return cls.load_bundle(bundle_path)
+        from forest import compile_model
+
+        with open(model_path, "rb") as fd:
+            model = pickle.load(fd)
+        try:
+            compiled = compile_model(model)
+        except TypeError:
+            compiled = None
+        return cls(model, joblib.load(preprocessor_path), compiled=compiled)
+
+    @classmethod
+    def load_bundle(cls, bundle_path=BUNDLE_PATH):
+        """Load the model from an artifact bundle, with its arrays memory-mapped (see ``bundle.load_bundle``)."""
+        from bundle import load_bundle, load_forest
+
+        model, preprocessor, header = load_bundle(bundle_path, mmap_mode="r")
+        return cls(model, preprocessor, header, compiled=load_forest(bundle_path, mmap_mode="r"))
+
+    @property
+    def version(self):
+        """Short id of the loaded model (hash of its bundle), None when loaded from a pickle."""
+        return self.header.get("model_version")
+
+    def _row(self):
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = self._local.row = np.empty((1, self.n_features), dtype=np.float32)
+        return row
+
+    def _score(self, X):
+        scorer = self.compiled if self.compiled is not None and len(X) <= COMPILED_MAX_ROWS else self.model
+        if hasattr(self.model, "predict_proba"):
+            return scorer.predict_proba(X)[:, -1]
+        return scorer.predict(X)
+
+    def prepare_one(self, features):
+        """
+        Feature vector of a single song, written to the preallocated row of the thread.
+
+        Args:
+            features (dict): Raw value of every input feature.
+
+        Returns:
+            numpy.ndarray: Row of shape (1, n_features), reused by the next call of the thread.
+        """
+        row = self._row()
+        self.preprocessor.transform_one(features, out=row[0])
+        return row
+
+    def predict_one(self, features):
+        """
+        Score a single song.
+
+        Args:
+            features (dict): Raw value of every input feature.
+
+        Returns:
+            float: Popularity score.
+        """
+        return float(self._score(self.prepare_one(features))[0])
+
+    def prepare(self, columns):
+        """
+        Feature matrix of a batch of songs.
+
+        Args:
+            columns (dict): One array-like per input feature, all of the same length.
+
+        Returns:
+            numpy.ndarray: Feature matrix (float32), shape (n_rows, n_features).
+        """
+        n_rows = len(columns[self.preprocessor.input_columns_[0]])
+        X = np.empty((n_rows, self.n_features), dtype=np.float32)
+        return self.preprocessor.transform(columns, out=X)
+
+    def predict(self, columns):
+        """
+        Score a batch of songs with a single model call.
+
+        Args:
+            columns (dict): One array-like per input feature, all of the same length.
+
+        Returns:
+            numpy.ndarray: Popularity score of every song.
+        """
+        return self._score(self.prepare(columns))
+
+    def predict_vectors(self, X):
+        """
+        Score rows that are already prepared (e.g. taken from the feature store).
+
+        Args:
+            X (numpy.ndarray): Feature matrix in the order of the preprocessor, shape (n_rows, n_features).
+
+        Returns:
+            numpy.ndarray: Popularity score of every row.
+        """
+        return self._score(X)
+
+    def predict_records(self, records):
+        """
+        Score a list of songs given as one feature dict per song.
+
+        Args:
+            records (list): Raw features of every song.
+
+        Returns:
+            numpy.ndarray: Popularity score of every song.
+        """
+        columns = {col: [features[col] for features in records] for col in self.preprocessor.input_columns_}
+        return self.predict(columns)
+
+    def load_feature_store(self, path=FEATURE_STORE_PATH):
+        """
+        Load the feature store of the known tracks, if it matches this model.
+
+        Args:
+            path (str): Store directory.
+
+        Returns:
+            features.FeatureStore: Memory-mapped store, None when it does not exist or
+            was built with a preprocessor of another feature order.
+        """
+        if not path or not os.path.isdir(path):
+            return None
+        from features import FeatureStore
+
+        store = FeatureStore.load(path, mmap_mode="r")
+        if store.feature_names != list(self.preprocessor.feature_names_):
+            sys.stderr.write("Feature store {} ignored: built with another preprocessor\n".format(path))
+            return None
+        return store
+
+    def load_score_table(self, store, path=SCORE_TABLE_PATH):
+        """
+        Load the score table of the feature store, if it was computed by this model.
+
+        Args:
+            store (features.FeatureStore): Loaded feature store.
+            path (str): Table directory.
+
+        Returns:
+            catalog.ScoreTable: Memory-mapped table, None when it does not exist or was
+            computed by another model or from another version of the store.
+        """
+        if store is None or not path or not os.path.isdir(path):
+            return None
+        from catalog import ScoreTable, read_header
+
+        header = read_header(path)
+        if header["model_version"] != self.version or header["store_version"] != store.version:
+            sys.stderr.write("Score table {} ignored: computed by another model or store\n".format(path))
+            return None
+        return ScoreTable.load(path, store, mmap_mode="r")
+
+    def warm_up(self, rounds=20):
+        """Run a few predictions so the first real request does not pay for lazy initialization."""
+        features = {col: 0.0 for col in self.preprocessor.input_columns_}
+        for col, (values, _) in self.preprocessor.label_lookup_.items():
+            features[col] = values[0]
+        for _ in range(rounds):
+            self.predict_one(features)
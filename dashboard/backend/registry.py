@@ -0,0 +1,179 @@
+import os
+import sys
+
+import numpy as np
+
+from model import BUNDLE_PATH, PROJECT_ROOT, PopularityModel
+
+# Held-out split written by src/prepare.py, used to validate a new model before serving it
+TEST_PATH = os.environ.get("TEST_PATH", os.path.join(PROJECT_ROOT, "data", "test"))
+VALIDATION_ROWS = int(os.environ.get("VALIDATION_ROWS", 2000))
+# Largest drop of the validation metric (accuracy, R² for regressors) accepted against the served model
+VALIDATION_MAX_DROP = float(os.environ.get("VALIDATION_MAX_DROP", 0.02))
+# Largest difference between the compiled forest and the original estimator on the sample
+COMPILED_TOLERANCE = 1e-4
+
+
+class ValidationError(ValueError):
+    """A new model failed the checks on the held-out sample and is not served."""
+
+
+def read_version(bundle_path=BUNDLE_PATH):
+    """
+    Version of the model in the bundle directory, without loading it.
+
+    Args:
+        bundle_path (str): Bundle directory.
+
+    Returns:
+        str: ``model_version`` of its header, None when there is no valid bundle.
+    """
+    from bundle import BundleError, read_header
+
+    try:
+        return read_header(bundle_path).get("model_version")
+    except (OSError, ValueError, BundleError):
+        return None
+
+
+def load_sample(preprocessor, test_path=TEST_PATH, rows=VALIDATION_ROWS, seed=0):
+    """
+    Random sample of the held-out split, in the feature order of a preprocessor.
+
+    Args:
+        preprocessor (preprocessing.SongPreprocessor): Preprocessor of the model to validate.
+        test_path (str): Directory with ``X_test`` and ``y_test``.
+        rows (int): Rows of the sample.
+        seed (int): Seed of the sample, the same rows for every model.
+
+    Returns:
+        tuple: (X, y), X as a float32 matrix and y the popularity of every row.
+
+    Raises:
+        ValidationError: If the split is missing or does not have the features of the model.
+    """
+    from storage import FORMATS, read_sparse, read_table, table_path
+
+    stems = {name: os.path.join(test_path, name) for name in ("X_test", "y_test")}
+    formats = [fmt for fmt in FORMATS if os.path.exists(table_path(stems["X_test"], fmt))]
+    if not formats:
+        raise ValidationError("No held-out split in {}".format(test_path))
+    fmt = formats[0]
+
+    try:
+        X = read_table(table_path(stems["X_test"], fmt), columns=preprocessor.dense_feature_names_)
+    except (KeyError, ValueError) as e:
+        raise ValidationError("The held-out split does not have the features of the model: {}".format(e))
+    y = read_table(table_path(stems["y_test"], fmt)).iloc[:, 0].to_numpy()
+    picked = np.sort(np.random.default_rng(seed).permutation(len(y))[:rows])
+
+    blocks, names = [X.to_numpy(dtype=np.float32)[picked]], list(preprocessor.dense_feature_names_)
+    if preprocessor.sparse_feature_names_:
+        # One-hot block stored apart by prepare (high_cardinality_encoding: onehot)
+        blocks.append(read_sparse(os.path.join(test_path, "X_test_onehot.npz"))[picked].toarray().astype(np.float32))
+        names += preprocessor.sparse_feature_names_
+    position = {name: i for i, name in enumerate(names)}
+    order = [position[name] for name in preprocessor.feature_names_]
+    return np.ascontiguousarray(np.hstack(blocks)[:, order]), y[picked]
+
+
+def _scores(estimator, X):
+    if hasattr(estimator, "predict_proba"):
+        return estimator.predict_proba(X)[:, -1]
+    return estimator.predict(X)
+
+
+def evaluate(model, X, y, threshold):
+    """
+    Validation metric of a model on the sample, and the metric of a trivial baseline.
+
+    Args:
+        model (PopularityModel): Model to evaluate.
+        X (numpy.ndarray): Sample features.
+        y (numpy.ndarray): Popularity of every row.
+        threshold (int): Popularity from which a track is popular (classifiers).
+
+    Returns:
+        tuple: (metric, baseline, scores); accuracy against the majority class for
+        classifiers, R² against the mean (0) for regressors.
+    """
+    scores = model.predict_vectors(X)
+    if hasattr(model.model, "predict_proba"):
+        labels = y >= threshold
+        return float(np.mean((scores >= 0.5) == labels)), float(max(labels.mean(), 1 - labels.mean())), scores
+    total = np.sum((y - y.mean()) ** 2)
+    return float(1 - np.sum((y - scores) ** 2) / total) if total else 0.0, 0.0, scores
+
+
+def validate(candidate, current, test_path=TEST_PATH, rows=VALIDATION_ROWS, max_drop=VALIDATION_MAX_DROP):
+    """
+    Check a new model on a held-out sample before it replaces the served one.
+
+    The new model must give finite scores (probabilities in [0, 1] for
+    classifiers), its compiled forest must agree with the original estimator
+    and it must beat a trivial baseline. When the served model uses the same
+    preprocessor (so the prepared split means the same to both), the metric
+    of the new model must also not be lower than the served model's on the
+    same rows by more than ``max_drop``.
+
+    Args:
+        candidate (PopularityModel): New model.
+        current (PopularityModel): Served model, None to skip the comparison.
+        test_path (str): Directory of the held-out split.
+        rows (int): Rows of the sample.
+        max_drop (float): Largest accepted drop of the metric.
+
+    Returns:
+        dict: Rows of the sample, metric of the new model, of the baseline and of the served model.
+
+    Raises:
+        ValidationError: If the new model fails a check.
+    """
+    X, y = load_sample(candidate.preprocessor, test_path, rows)
+    threshold = candidate.header.get("train_params", {}).get("threshold", 30)
+    metric, baseline, scores = evaluate(candidate, X, y, threshold)
+
+    if not np.isfinite(scores).all():
+        raise ValidationError("The new model gives non-finite scores")
+    if hasattr(candidate.model, "predict_proba") and ((scores < 0) | (scores > 1)).any():
+        raise ValidationError("The new model gives probabilities outside [0, 1]")
+    if candidate.compiled is not None:
+        if np.abs(_scores(candidate.compiled, X) - _scores(candidate.model, X)).max() > COMPILED_TOLERANCE:
+            raise ValidationError("The compiled forest of the new model does not match its estimator")
+    if metric <= baseline:
+        raise ValidationError("Metric {:.4f} of the new model does not beat the baseline {:.4f}".format(
+            metric, baseline))
+
+    result = {"rows": len(y), "metric": metric, "baseline": baseline, "current_metric": None}
+    same_preprocessor = (current is not None and current.header.get("sha256", {}).get("preprocessor")
+                         == candidate.header["sha256"]["preprocessor"])
+    if same_preprocessor:
+        result["current_metric"], _, _ = evaluate(current, X, y, threshold)
+        if metric < result["current_metric"] - max_drop:
+            raise ValidationError("Metric {:.4f} of the new model is below the {:.4f} of the served model".format(
+                metric, result["current_metric"]))
+    return result
+
+
+def load_candidate(bundle_path=BUNDLE_PATH, current=None):
+    """
+    Load, warm up and validate the model of the bundle directory.
+
+    Runs in a worker thread: the served model keeps answering requests meanwhile.
+
+    Args:
+        bundle_path (str): Bundle directory.
+        current (PopularityModel): Served model.
+
+    Returns:
+        tuple: (model, validation result).
+
+    Raises:
+        ValidationError: If the new model fails the validation.
+    """
+    candidate = PopularityModel.load_bundle(bundle_path)
+    candidate.warm_up()
+    result = validate(candidate, current)
+    sys.stderr.write("Model {} validated on {} rows (metric {:.4f}, served model {})\n".format(
+        candidate.version, result["rows"], result["metric"], result["current_metric"]))
+    return candidate, result
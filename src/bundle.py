@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import platform
+import shutil
+from datetime import datetime
+
+import joblib
+
+from forest import CompiledForest, compile_model
+
+# Bumped when the layout of the bundle changes; older readers refuse newer bundles
+BUNDLE_VERSION = 2
+HEADER_FILE = "header.json"
+# Artifacts of the bundle, each pickled by joblib in its own file
+ARTIFACT_FILES = {"model": "model.joblib", "preprocessor": "preprocessor.joblib"}
+# Compiled tree ensemble (forest.CompiledForest), one .npy file per array (version 2)
+FOREST_DIR = "forest"
+
+
+class BundleError(ValueError):
+    """The bundle is missing, of an unsupported version or does not match its header."""
+
+
+def _file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for block in iter(lambda: fd.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _library_versions():
+    import numpy as np
+    import sklearn
+
+    return {"python": platform.python_version(), "numpy": np.__version__, "scikit-learn": sklearn.__version__}
+
+
+def save_bundle(path, model, preprocessor, extra=None):
+    """
+    Save a model and its fitted preprocessor as a single artifact bundle.
+
+    The bundle is a directory with the model and the preprocessor (scalers,
+    encoders and feature order), each pickled by joblib without compression so
+    its NumPy arrays can be memory-mapped when loaded, and ``header.json``
+    (bundle version, SHA-256 and size of every artifact, library versions and
+    feature names). Tree ensembles are also saved compiled (``forest/``, see
+    :func:`forest.compile_model`) for the low-latency inference path. It is
+    written to a temporary directory first and renamed, so a reader never sees
+    a half-written bundle.
+
+    Args:
+        path (str): Bundle directory; replaced if it exists.
+        model: Fitted estimator.
+        preprocessor (preprocessing.SongPreprocessor): Preprocessor the model was trained with.
+        extra (dict): Additional fields for the header (training parameters...).
+
+    Returns:
+        dict: Header of the bundle.
+    """
+    path = os.path.normpath(path)
+    tmp_path = "{}.tmp".format(path)
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    hashes, sizes = {}, {}
+    for name, value in [("model", model), ("preprocessor", preprocessor)]:
+        artifact_path = os.path.join(tmp_path, ARTIFACT_FILES[name])
+        joblib.dump(value, artifact_path, compress=0)
+        hashes[name] = _file_hash(artifact_path)
+        sizes[name] = os.path.getsize(artifact_path)
+
+    try:
+        compiled = compile_model(model)
+    except TypeError:
+        compiled = None
+    if compiled is not None:
+        for forest_path in compiled.save(os.path.join(tmp_path, FOREST_DIR)):
+            hashes[os.path.relpath(forest_path, tmp_path)] = _file_hash(forest_path)
+            sizes[os.path.relpath(forest_path, tmp_path)] = os.path.getsize(forest_path)
+
+    # Short id of the model, changes with any byte of the artifacts
+    model_version = hashlib.sha256("".join(hashes[name] for name in sorted(hashes)).encode()).hexdigest()[:12]
+    header = {
+        "format": "popularity-bundle",
+        "bundle_version": BUNDLE_VERSION,
+        "model_version": model_version,
+        "sha256": hashes,
+        "sizes": sizes,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "model_class": "{}.{}".format(type(model).__module__, type(model).__name__),
+        "compiled": compiled is not None,
+        "n_features": len(preprocessor.feature_names_),
+        "feature_names": list(preprocessor.feature_names_),
+        "libraries": _library_versions(),
+    }
+    header.update(extra or {})
+    with open(os.path.join(tmp_path, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+
+    # Swap the directories; the old bundle is removed once the new one is in place
+    old_path = "{}.old".format(path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return header
+
+
+def read_header(path):
+    """
+    Read and check the header of a bundle without loading the model.
+
+    Args:
+        path (str): Bundle directory.
+
+    Returns:
+        dict: Header of the bundle.
+
+    Raises:
+        BundleError: If the directory is not a bundle or its version is not supported.
+    """
+    header_path = os.path.join(path, HEADER_FILE)
+    if not os.path.exists(header_path):
+        raise BundleError("{} is not a model bundle (no {})".format(path, HEADER_FILE))
+    with open(header_path) as f:
+        header = json.load(f)
+    if header.get("bundle_version", 0) > BUNDLE_VERSION:
+        raise BundleError(
+            "Bundle version {} is newer than the supported version {}".format(header["bundle_version"], BUNDLE_VERSION)
+        )
+    return header
+
+
+def _artifact_path(path, name):
+    # Artifacts by name, the files of the compiled forest by path
+    return os.path.join(path, ARTIFACT_FILES.get(name, name))
+
+
+def verify_bundle(path):
+    """
+    Check the SHA-256 of every artifact of a bundle against its header.
+
+    Reads every byte of the bundle, so it is meant for an explicit check (e.g.
+    after copying a bundle between machines); :func:`load_bundle` only checks
+    the sizes.
+
+    Args:
+        path (str): Bundle directory.
+
+    Returns:
+        dict: Header of the bundle.
+
+    Raises:
+        BundleError: If the bundle is not valid or an artifact does not match its hash.
+    """
+    header = read_header(path)
+    for name, sha256 in header["sha256"].items():
+        if _file_hash(_artifact_path(path, name)) != sha256:
+            raise BundleError("The {} of {} does not match the hash of its header".format(name, path))
+    return header
+
+
+def load_bundle(path, mmap_mode="r", verify=True):
+    """
+    Load a bundle written by :func:`save_bundle`.
+
+    With ``mmap_mode="r"`` the NumPy arrays of the artifacts are memory-mapped
+    read-only instead of read into memory. Arrays that unpickling keeps as they
+    are stay mapped, and processes loading the same bundle (e.g. several
+    uvicorn workers) share their pages through the OS cache. This is not the
+    case of scikit-learn trees: ``Tree.__setstate__`` copies the node arrays
+    into memory owned by every process. Among the arrays of a tree model, only
+    the compiled forest (:func:`load_forest`) is shared.
+
+    The hashes of the header are computed once, when the bundle is saved.
+    Loading only compares the size of every artifact with the header, which
+    catches truncated or partly copied bundles without reading them twice;
+    :func:`verify_bundle` checks the hashes.
+
+    Args:
+        path (str): Bundle directory.
+        mmap_mode (str): Memory-map mode of the arrays, None to read them into memory.
+        verify (bool): Check that every artifact of the header is present, with its size.
+
+    Returns:
+        tuple: (model, preprocessor, header).
+
+    Raises:
+        BundleError: If the bundle is not valid or does not match its header.
+    """
+    header = read_header(path)
+    if verify:
+        # Bundles saved before the sizes were recorded only get the presence check
+        sizes = header.get("sizes", {})
+        for name in header["sha256"]:
+            artifact_path = _artifact_path(path, name)
+            if not os.path.exists(artifact_path):
+                raise BundleError("The {} of {} is missing".format(name, path))
+            if name in sizes and os.path.getsize(artifact_path) != sizes[name]:
+                raise BundleError("The {} of {} does not have the size of its header".format(name, path))
+
+    artifacts = {name: joblib.load(os.path.join(path, file_name), mmap_mode=mmap_mode)
+                 for name, file_name in ARTIFACT_FILES.items()}
+
+    preprocessor = artifacts["preprocessor"]
+    if list(preprocessor.feature_names_) != header["feature_names"]:
+        raise BundleError("The feature order of the preprocessor does not match the header of {}".format(path))
+    return artifacts["model"], preprocessor, header
+
+
+def load_forest(path, mmap_mode="r"):
+    """
+    Load the compiled tree ensemble of a bundle, if it has one.
+
+    Args:
+        path (str): Bundle directory (checked by :func:`load_bundle`).
+        mmap_mode (str): Memory-map mode of the arrays, None to read them into memory.
+
+    Returns:
+        forest.CompiledForest: Compiled model, None when the model is not a tree ensemble.
+    """
+    if not read_header(path).get("compiled"):
+        return None
+    return CompiledForest.load(os.path.join(path, FOREST_DIR), mmap_mode=mmap_mode)
@@ -0,0 +1,230 @@
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+import numpy as np
+import yaml
+
+from bundle import load_bundle
+from features import FNV_OFFSET, FNV_PRIME, MASK_64, FeatureStore, HashIndex, mix64
+
+TABLE_FILE = "table.json"
+# Score of every row of the feature store, in its order
+SCORES_FILE = "scores.npy"
+
+
+def hash_vector(row):
+    """
+    64-bit hash of a prepared feature vector, the key of the score table.
+
+    Args:
+        row (numpy.ndarray): Feature vector (float32).
+
+    Returns:
+        int: Mixed FNV-1a hash of the 32-bit words of the vector.
+    """
+    value = FNV_OFFSET
+    for word in np.ascontiguousarray(row, dtype=np.float32).view(np.uint32).tolist():
+        value = ((value ^ word) * FNV_PRIME) & MASK_64
+    return mix64(value)
+
+
+def hash_vectors(X):
+    """
+    Vectorized :func:`hash_vector` of the rows of a matrix.
+
+    Args:
+        X (numpy.ndarray): Feature matrix, shape (n_rows, n_features).
+
+    Returns:
+        numpy.ndarray: Hash of every row (``uint64``).
+    """
+    words = np.ascontiguousarray(X, dtype=np.float32).view(np.uint32)
+    values = np.full(len(words), FNV_OFFSET, dtype=np.uint64)
+    for j in range(words.shape[1]):
+        values = (values ^ words[:, j]) * np.uint64(FNV_PRIME)
+    return mix64(values)
+
+
+class ScoreTable:
+    """
+    Popularity score of every track of a feature store, precomputed by one model.
+
+    Scores are read by the row of a track in the store (its ``track_id``) or by
+    its prepared feature vector, through a :class:`features.HashIndex` of the
+    vectors; both in O(1) and without calling the model. Candidates of the
+    index are confirmed against the vectors of the store, so only bit-identical
+    vectors hit the table.
+    """
+
+    def __init__(self, scores, index, store, header):
+        self.scores = scores
+        self.index = index
+        self.store = store
+        self.header = header
+
+    @property
+    def model_version(self):
+        """Version of the model that produced the scores (``model_version`` of its bundle)."""
+        return self.header["model_version"]
+
+    @classmethod
+    def load(cls, path, store, mmap_mode="r"):
+        """
+        Load a table written by :func:`build_table`.
+
+        Args:
+            path (str): Table directory.
+            store (features.FeatureStore): Feature store the table was built from.
+            mmap_mode (str): Memory-map mode of the arrays, None to read them into memory.
+
+        Returns:
+            ScoreTable: Loaded table.
+
+        Raises:
+            ValueError: If the table was built from another version of the store.
+        """
+        header = read_header(path)
+        if header["store_version"] != store.version:
+            raise ValueError("The score table {} was built from another feature store".format(path))
+        scores = np.asarray(np.load(os.path.join(path, SCORES_FILE), mmap_mode=mmap_mode))
+        return cls(scores, HashIndex.load(path, mmap_mode=mmap_mode), store, header)
+
+    def lookup(self, row):
+        """
+        Score of a single prepared feature vector.
+
+        Args:
+            row (numpy.ndarray): Feature vector (float32).
+
+        Returns:
+            float: Score, None when the vector is not in the table.
+        """
+        key = row.tobytes()
+        found = self.index.find(hash_vector(row), lambda i: self.store.vectors[i].tobytes() == key)
+        return None if found < 0 else float(self.scores[found])
+
+    def rows(self, X):
+        """
+        Locate a batch of prepared feature vectors.
+
+        Args:
+            X (numpy.ndarray): Feature matrix (float32), shape (n_rows, n_features).
+
+        Returns:
+            numpy.ndarray: Row of every vector in the table, -1 for unseen vectors.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        words = X.view(np.uint32)
+        # Bitwise comparison, as the hash: no NaN != NaN or -0.0 == 0.0 surprises
+        vectors = self.store.vectors.view(np.uint32)
+        return self.index.find_many(
+            hash_vectors(X), lambda rows, positions: (vectors[rows] == words[positions]).all(axis=1)
+        )
+
+
+def read_header(path):
+    """
+    Read the header of a score table without loading it.
+
+    Args:
+        path (str): Table directory.
+
+    Returns:
+        dict: Header of the table.
+    """
+    with open(os.path.join(path, TABLE_FILE)) as f:
+        return json.load(f)
+
+
+def build_table(store_path, bundle_path, output_path, chunksize):
+    """
+    Score every track of the feature store with the model of a bundle.
+
+    The vectors are scored in chunks straight from the memory-mapped store,
+    and the scores saved in its row order, with an index of the vectors so
+    requests that send the features of a known track also find its score.
+    Tracks with identical vectors share the first one's entry of the index.
+
+    The table is written to a temporary directory first and renamed, so a
+    reader never sees a half-written table.
+
+    Args:
+        store_path (str): Feature store written by ``features.py``.
+        bundle_path (str): Model bundle written by ``train.py``.
+        output_path (str): Table directory; replaced if it exists.
+        chunksize (int): Rows scored at a time.
+
+    Returns:
+        dict: Header of the table.
+
+    Raises:
+        ValueError: If the store was built with a preprocessor of another feature order.
+    """
+    store = FeatureStore.load(store_path)
+    model, _, bundle_header = load_bundle(bundle_path)
+    if store.feature_names != bundle_header["feature_names"]:
+        raise ValueError("The feature store {} does not match the features of the model".format(store_path))
+
+    scores = np.empty(len(store))
+    hashes = np.empty(len(store), dtype=np.uint64)
+    for start in range(0, len(store), chunksize):
+        X = store.vectors[start:start + chunksize]
+        end = start + len(X)
+        if hasattr(model, "predict_proba"):
+            scores[start:end] = model.predict_proba(X)[:, -1]
+        else:
+            scores[start:end] = model.predict(X)
+        hashes[start:end] = hash_vectors(X)
+        sys.stderr.write("{:,} tracks scored\n".format(end))
+    _, first = np.unique(hashes, return_index=True)
+
+    output_path = os.path.normpath(output_path)
+    tmp_path = "{}.tmp".format(output_path)
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, SCORES_FILE), scores)
+    HashIndex.build(hashes[first], rows=first).save(tmp_path)
+
+    header = {
+        "model_version": bundle_header["model_version"],
+        "store_version": store.version,
+        "tracks": len(store),
+        "vectors": len(first),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(tmp_path, TABLE_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+
+    # Swap the directories; the old table is removed once the new one is in place
+    old_path = "{}.old".format(output_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(output_path):
+        os.rename(output_path, old_path)
+    os.rename(tmp_path, output_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return header
+
+
+def main():
+    params = yaml.safe_load(open("params.yaml"))["catalog"]
+
+    if len(sys.argv) != 3:
+        sys.stderr.write("Arguments error. Usage:\n")
+        sys.stderr.write("\tpython catalog.py store table\n")
+        sys.exit(1)
+
+    header = build_table(
+        store_path=sys.argv[1],
+        bundle_path=params["bundle_path"],
+        output_path=sys.argv[2],
+        chunksize=params["chunksize"],
+    )
+    sys.stderr.write("Score table of model {} saved to {} ({:,} tracks)\n".format(
+        header["model_version"], sys.argv[2], header["tracks"]))
+
+
+if __name__ == "__main__":
+    main()
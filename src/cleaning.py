@@ -1,290 +1,625 @@
 # %% [markdown]
 # # Preparación de los datos
-# 
+#
 # En este notebook se realiza las siguientes acciones de limpieza de datos sobre el conjunto de datos base:
-# 
+#
 # - Cargar el conjunto de datos desde archivos .csv
 # - Identificar y remover duplicados.
 # - Identificar y remover registros con valores nulos.
 # - Remover variables con información sensible o fuera del alcance en futuras etapas.
 # - Verificaciones de calidad sobre el conjunto de datos de salida.
+#
+# Cada paso es una función que puede importarse sin efectos secundarios
+# (`from cleaning import clean_dataframe`); la etapa completa se ejecuta con
+# `python src/cleaning.py data/raw/dataset.csv [--full]`.
 
 # %% [markdown]
 # ## 1. Importar librerías requeridas
-# 
-# Importar pandas y otras librerías necesarias para la manipulación y análisis de datos.
+#
+# Al importar el módulo solo se cargan librerías ligeras: pandas, numpy y los módulos del pipeline se importan dentro de las funciones que los usan.
 
 # %%
-import pandas as pd
-import numpy as np
 import os
-import warnings
-import yaml
+import sys
 
-# Suprimir los warnings para una salida más limpia
-warnings.filterwarnings('ignore')
+# Columns with sensitive information or out of scope for later stages
+COLUMNS_TO_REMOVE = ['index', 'artists', 'album_name', 'track_name']
+# Identifiers kept to place each track in the hash split (prepare.split_key), never used as features
+ID_COLUMNS = ['track_id']
 
-# Opciones para una mejor visualización
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', None)
-pd.set_option('display.max_colwidth', 50)
 
-print("¡Bibliotecas importadas con éxito!")
+def cleaning_settings(params):
+    """
+    Settings recorded with the cleaned dataset (a change forces a full cleaning).
+
+    Args:
+        params (dict): Pipeline parameters.
+
+    Returns:
+        dict: Storage format, cleaning flags and columns removed.
+    """
+    config = params["cleaning"]
+    return {
+        'format': params["data"]["format"],
+        'remove_duplicates': config["remove_duplicates"],
+        'remove_na': config["remove_na"],
+        'columns_to_remove': COLUMNS_TO_REMOVE,
+    }
 
 # %% [markdown]
 # ## 2. Carga del conjunto de datos
 
 # %%
-# Define the path to the dataset
-config = yaml.safe_load(open("params.yaml"))["cleaning"]
-dataset_path = config["input_path"]
-
-# Check if the file exists
-if os.path.exists(dataset_path):
-    print(f"✓ Dataset found at: {dataset_path}")
-else:
-    print(f"✗ Dataset not found at: {dataset_path}")
-    print("Please ensure the dataset.csv file is in the correct location.")
-
-# Load the dataset
-try:
-    df = pd.read_csv(dataset_path)
-    print(f"\n✓ Dataset loaded successfully!")
-    print(f"Dataset shape: {df.shape}")
-except Exception as e:
-    print(f"✗ Error loading dataset: {e}")
+def load_dataset(path):
+    """
+    Load the raw dataset with the dtypes (float32, int8, category...) of ``schema.SCHEMA``.
+
+    Integer and boolean columns stay nullable until the rows with missing values are dropped.
+
+    Args:
+        path (str): Raw CSV file.
+
+    Returns:
+        pandas.DataFrame: Raw tracks.
+    """
+    from schema import read_csv
+
+    return read_csv(path)
+
+
+def clean_incremental(params, quality_report_path):
+    """
+    Clean only the raw rows added since the last run and append them to the cleaned dataset.
+
+    Args:
+        params (dict): Pipeline parameters.
+        quality_report_path (str): Output file of the quality report.
+
+    Returns:
+        dict: Row counts of the run, or None when a full cleaning is required.
+    """
+    from incremental import clean_new_rows
+    from quality import write_report
+
+    config = params["cleaning"]
+    print("\nIncremental mode enabled")
+    summary = clean_new_rows(
+        config["input_path"],
+        config["output_path"],
+        chunksize=config["chunksize"],
+        columns_to_remove=COLUMNS_TO_REMOVE,
+        settings=cleaning_settings(params),
+    )
+
+    if summary is None:
+        print("✗ No reusable previous run (first run, settings changed or raw rows modified), running a full cleaning")
+        return None
+
+    print(f"\n✓ Records read: {summary['rows_read']:,}")
+    print(f"✓ New records: {summary['new_rows']:,}")
+    print(f"✓ Duplicate records removed: {summary['duplicates_removed']:,}")
+    print(f"✓ Records with missing values removed: {summary['missing_removed']:,}")
+    print(f"✓ Records appended: {summary['rows_saved']:,} (total: {summary['rows_total']:,})")
+    write_report(dict(summary, mode="incremental"), quality_report_path)
+    print(f"✓ Quality report saved to: {quality_report_path}")
+    return summary
+
+
+def clean_streaming(params, quality_report_path):
+    """
+    Clean the dataset chunk by chunk without loading it in memory.
+
+    Args:
+        params (dict): Pipeline parameters.
+        quality_report_path (str): Output file of the quality report.
+
+    Returns:
+        dict: Row counts of the run and output path.
+    """
+    from incremental import save_cleaning_state
+    from quality import QualityReport
+    from streaming import RowHashSet, clean_in_chunks
+
+    config = params["cleaning"]
+    print(f"\nStreaming mode enabled (chunks of {config['chunksize']:,} rows)")
+    seen = RowHashSet()
+    report = QualityReport()
+    summary = clean_in_chunks(
+        config["input_path"],
+        os.path.join(config["output_path"], 'dataset_cleaned'),
+        params["data"]["format"],
+        chunksize=config["chunksize"],
+        columns_to_remove=COLUMNS_TO_REMOVE,
+        remove_duplicates=config["remove_duplicates"],
+        remove_na=config["remove_na"],
+        seen=seen,
+        report=report,
+        n_jobs=config.get("n_jobs", -1),
+    )
+    save_cleaning_state(config["output_path"], seen, summary['rows_saved'], cleaning_settings(params))
+    report.save(quality_report_path, mode="streaming")
+
+    print(f"\n✓ Records read: {summary['rows_read']:,} ({summary['chunks']} chunks)")
+    print(f"✓ Duplicate records removed: {summary['duplicates_removed']:,}")
+    print(f"✓ Records with missing values removed: {summary['missing_removed']:,}")
+    print(f"✓ Cleaned dataset saved to: {summary['output_path']}")
+    print(f"✓ Records saved: {summary['rows_saved']:,}")
+    print(f"✓ Quality report saved to: {quality_report_path}")
+    return summary
 
 # %% [markdown]
 # ## 3. Exploración de la estructura del conjunto de datos.
-# 
+#
 # Muestra información acerca del conjunto de datos cargado como son: forma, nombres de columnas, tipos de datos y estadísticas generales.
-# 
+#
 
 # %%
-# Store original dataset information for comparison
-original_shape = df.shape
-print(f"Original Dataset Shape: {original_shape}")
-print(f"Total records: {original_shape[0]:,}")
-print(f"Total features: {original_shape[1]}")
-print("\n" + "="*50)
+def scan_dataset(df, n_jobs=None):
+    """
+    Scan the dataset once: row hashes, duplicates and missing values of every column.
+
+    Args:
+        df (pandas.DataFrame): Raw tracks.
+        n_jobs (int): Threads used to scan the column shards.
+
+    Returns:
+        dict: ``report`` (quality.QualityReport), ``seen`` (streaming.RowHashSet
+        with the hash of every raw row), ``row_hashes``, ``is_first`` (first
+        occurrence of every row) and ``keep`` (rows kept by the cleaning).
+    """
+    from quality import QualityReport
+    from streaming import RowHashSet
+
+    report = QualityReport()
+    seen = RowHashSet()
+    row_hashes, is_first, keep = report.update(df, seen, n_jobs=n_jobs)
+    return {"report": report, "seen": seen, "row_hashes": row_hashes, "is_first": is_first, "keep": keep}
+
+
+def print_overview(df):
+    """
+    Print the shape, first rows and dtypes of the dataset.
+
+    Args:
+        df (pandas.DataFrame): Raw tracks.
+    """
+    # Store original dataset information for comparison
+    print(f"Original Dataset Shape: {df.shape}")
+    print(f"Total records: {df.shape[0]:,}")
+    print(f"Total features: {df.shape[1]}")
+    print("\n" + "="*50)
+
+    # Display first few rows
+    print("First 5 rows of the dataset:")
+    print("="*50)
+    print(df.head())
+
+    # Display dataset information
+    print("Dataset Information:")
+    print("="*50)
+    print(df.info())
+    print("\nColumn names:")
+    print(df.columns.tolist())
+
+
+def print_quality_analysis(df, scan):
+    """
+    Print the missing values and duplicates found by :func:`scan_dataset`.
+
+    Args:
+        df (pandas.DataFrame): Raw tracks.
+        scan (dict): Result of :func:`scan_dataset`.
+    """
+    import pandas as pd
+
+    quality = scan["report"].stats
+
+    # Check for missing values
+    print("Missing Values Analysis:")
+    print("="*50)
+    missing_values = pd.Series(quality['missing_by_column'])
+    missing_percentage = (missing_values / len(df)) * 100
+
+    missing_df = pd.DataFrame({
+        'Column': missing_values.index,
+        'Missing Count': missing_values.values,
+        'Missing Percentage': missing_percentage.values
+    })
+
+    # Show only columns with missing values
+    missing_with_nulls = missing_df[missing_df['Missing Count'] > 0]
+    if len(missing_with_nulls) > 0:
+        print(missing_with_nulls)
+    else:
+        print("✓ No missing values found in the dataset!")
+
+    print(f"\nTotal missing values: {missing_values.sum():,}")
+
+    # Check for duplicate records
+    print("Duplicate Records Analysis:")
+    print("="*50)
+    duplicate_count = quality['duplicate_rows']
+    duplicate_percentage = (duplicate_count / len(df)) * 100
+
+    print(f"Number of duplicate records: {duplicate_count:,}")
+    print(f"Percentage of duplicate records: {duplicate_percentage:.2f}%")
+
+    if duplicate_count > 0:
+        print("\nExample of duplicate records:")
+        duplicates = df[pd.Series(scan["row_hashes"]).duplicated(keep=False).to_numpy()]
+        print(duplicates.head(10))
+    else:
+        print("✓ No duplicate records found!")
 
-# %%
-# Display first few rows
-print("First 5 rows of the dataset:")
-print("="*50)
-df.head()
+# %% [markdown]
+# ## 4. Remover registros duplicados
+#
+# Identificar y remover los registros duplicados.
 
 # %%
-# Display dataset information
-print("Dataset Information:")
-print("="*50)
-print(df.info())
-print("\nColumn names:")
-print(df.columns.tolist())
+def remove_duplicates(df, scan):
+    """
+    Keep the first occurrence of every row.
 
-# %%
-# Check for missing values
-print("Missing Values Analysis:")
-print("="*50)
-missing_values = df.isnull().sum()
-missing_percentage = (missing_values / len(df)) * 100
-
-missing_df = pd.DataFrame({
-    'Column': missing_values.index,
-    'Missing Count': missing_values.values,
-    'Missing Percentage': missing_percentage.values
-})
-
-# Show only columns with missing values
-missing_with_nulls = missing_df[missing_df['Missing Count'] > 0]
-if len(missing_with_nulls) > 0:
-    print(missing_with_nulls)
-else:
-    print("✓ No missing values found in the dataset!")
-
-print(f"\nTotal missing values: {missing_values.sum():,}")
+    Args:
+        df (pandas.DataFrame): Raw tracks.
+        scan (dict): Result of :func:`scan_dataset` on ``df``.
 
-# %%
-# Check for duplicate records
-print("Duplicate Records Analysis:")
-print("="*50)
-duplicate_count = df.duplicated().sum()
-duplicate_percentage = (duplicate_count / len(df)) * 100
-
-print(f"Number of duplicate records: {duplicate_count:,}")
-print(f"Percentage of duplicate records: {duplicate_percentage:.2f}%")
-
-if duplicate_count > 0:
-    print("\nExample of duplicate records:")
-    duplicates = df[df.duplicated(keep=False)]
-    print(duplicates.head(10))
-else:
-    print("✓ No duplicate records found!")
+    Returns:
+        pandas.DataFrame: Deduplicated tracks.
+    """
+    return df[scan["is_first"]]
 
-# %% [markdown]
-# ## 4. Remover registros duplicados
-# 
-# Identificar y remover los registros duplicados.
 
-# %%
-# Remove duplicate records
-print("Removing Duplicate Records...")
-print("="*50)
+def print_duplicates_removal(df, df_cleaned, scan):
+    """
+    Print the duplicates before and after :func:`remove_duplicates`.
 
-# Count duplicates before removal
-duplicates_before = df.duplicated().sum()
-print(f"Duplicates before removal: {duplicates_before:,}")
+    Args:
+        df (pandas.DataFrame): Raw tracks.
+        df_cleaned (pandas.DataFrame): Deduplicated tracks.
+        scan (dict): Result of :func:`scan_dataset`.
+    """
+    import numpy as np
 
-# Remove duplicates
-df_cleaned = df.drop_duplicates()
+    print("Removing Duplicate Records...")
+    print("="*50)
 
-# Count duplicates after removal
-duplicates_after = df_cleaned.duplicated().sum()
-records_removed = len(df) - len(df_cleaned)
+    # Count duplicates before removal
+    duplicates_before = scan["report"].stats['duplicate_rows']
+    print(f"Duplicates before removal: {duplicates_before:,}")
 
-print(f"Duplicates after removal: {duplicates_after:,}")
-print(f"Records removed: {records_removed:,}")
+    # Count duplicates after removal
+    duplicates_after = len(df_cleaned) - len(np.unique(scan["row_hashes"][scan["is_first"]]))
+    records_removed = len(df) - len(df_cleaned)
 
-if records_removed > 0:
-    print(f"✓ Successfully removed {records_removed:,} duplicate records!")
-else:
-    print("✓ No duplicate records found to remove.")
+    print(f"Duplicates after removal: {duplicates_after:,}")
+    print(f"Records removed: {records_removed:,}")
+
+    if records_removed > 0:
+        print(f"✓ Successfully removed {records_removed:,} duplicate records!")
+    else:
+        print("✓ No duplicate records found to remove.")
 
 # %% [markdown]
 # ## 5. Remover valores faltantes.
-# 
+#
 # Identificar los registros con valores faltantes y removerlos.
 
 # %%
-# Remove records with missing values
-print("Removing Records with Missing Values...")
-print("="*50)
+def remove_missing(df, scan):
+    """
+    Keep the deduplicated rows without missing values.
 
-# Count missing values before removal
-missing_before = df_cleaned.isnull().sum().sum()
-records_with_nulls_before = df_cleaned.isnull().any(axis=1).sum()
+    Args:
+        df (pandas.DataFrame): Raw tracks.
+        scan (dict): Result of :func:`scan_dataset` on ``df``.
 
-print(f"Total missing values before removal: {missing_before:,}")
-print(f"Records with at least one missing value: {records_with_nulls_before:,}")
+    Returns:
+        pandas.DataFrame: Deduplicated tracks without missing values, with the compact dtypes.
+    """
+    from schema import compact
 
-# Remove records with any missing values
-df_final = df_cleaned.dropna()
+    return compact(df[scan["keep"]])
 
-# Count missing values after removal
-missing_after = df_final.isnull().sum().sum()
-records_with_nulls_after = df_final.isnull().any(axis=1).sum()
-null_records_removed = len(df_cleaned) - len(df_final)
 
-print(f"\nTotal missing values after removal: {missing_after:,}")
-print(f"Records with missing values after removal: {records_with_nulls_after:,}")
-print(f"Records removed due to missing values: {null_records_removed:,}")
+def print_missing_removal(df_cleaned, df_final, scan):
+    """
+    Print the missing values before and after :func:`remove_missing`.
 
-if null_records_removed > 0:
-    print(f"✓ Successfully removed {null_records_removed:,} records with missing values!")
-else:
-    print("✓ No records with missing values found to remove.")
+    Args:
+        df_cleaned (pandas.DataFrame): Deduplicated tracks.
+        df_final (pandas.DataFrame): Tracks without missing values.
+        scan (dict): Result of :func:`scan_dataset`.
+    """
+    quality = scan["report"].stats
+    print("Removing Records with Missing Values...")
+    print("="*50)
 
-# %% [markdown]
-# # 6. Remover varaibles que no serán usadas.
+    # Count missing values before removal
+    missing_before = quality['missing_values_after_deduplication']
+    records_with_nulls_before = quality['rows_with_missing_after_deduplication']
 
-# %%
-# Remove specified columns before saving
-columns_to_remove = ['index', 'track_id', 'artists', 'album_name', 'track_name']
-print(f"Removing columns: {columns_to_remove}")
+    print(f"Total missing values before removal: {missing_before:,}")
+    print(f"Records with at least one missing value: {records_with_nulls_before:,}")
 
-# Check which columns exist in the dataset
-existing_columns_to_remove = [col for col in columns_to_remove if col in df_final.columns]
-missing_columns = [col for col in columns_to_remove if col not in df_final.columns]
+    # Count missing values after removal
+    missing_after = quality['remaining_missing']
+    records_with_nulls_after = quality['remaining_rows_with_missing']
+    null_records_removed = len(df_cleaned) - len(df_final)
 
-if existing_columns_to_remove:
-    print(f"Columns found and will be removed: {existing_columns_to_remove}")
-    df_final_for_saving = df_final.drop(columns=existing_columns_to_remove)
-    print(f"✓ Successfully removed {len(existing_columns_to_remove)} columns")
-else:
-    df_final_for_saving = df_final.copy()
-    print("✓ No specified columns found to remove")
+    print(f"\nTotal missing values after removal: {missing_after:,}")
+    print(f"Records with missing values after removal: {records_with_nulls_after:,}")
+    print(f"Records removed due to missing values: {null_records_removed:,}")
 
-if missing_columns:
-    print(f"Columns not found in dataset: {missing_columns}")
+    if null_records_removed > 0:
+        print(f"✓ Successfully removed {null_records_removed:,} records with missing values!")
+    else:
+        print("✓ No records with missing values found to remove.")
 
-print(f"Shape after column removal: {df_final_for_saving.shape}")
-print(f"Remaining columns: {list(df_final_for_saving.columns)}")
+# %% [markdown]
+# # 6. Remover varaibles que no serán usadas.
+
+# %%
+def remove_columns(df, columns_to_remove=COLUMNS_TO_REMOVE, verbose=False):
+    """
+    Remove the columns with sensitive information or out of scope for later stages.
+
+    Args:
+        df (pandas.DataFrame): Tracks.
+        columns_to_remove (list): Columns to drop; the ones not in ``df`` are ignored.
+        verbose (bool): Print the columns removed.
+
+    Returns:
+        pandas.DataFrame: Tracks without the columns.
+    """
+    # Check which columns exist in the dataset
+    existing_columns_to_remove = [col for col in columns_to_remove if col in df.columns]
+    missing_columns = [col for col in columns_to_remove if col not in df.columns]
+
+    if verbose:
+        print(f"Removing columns: {columns_to_remove}")
+    if existing_columns_to_remove:
+        df = df.drop(columns=existing_columns_to_remove)
+    else:
+        df = df.copy()
+
+    if verbose:
+        if existing_columns_to_remove:
+            print(f"Columns found and will be removed: {existing_columns_to_remove}")
+            print(f"✓ Successfully removed {len(existing_columns_to_remove)} columns")
+        else:
+            print("✓ No specified columns found to remove")
+        if missing_columns:
+            print(f"Columns not found in dataset: {missing_columns}")
+        print(f"Shape after column removal: {df.shape}")
+        print(f"Remaining columns: {list(df.columns)}")
+    return df
+
+
+def clean_dataframe(df, columns_to_remove=COLUMNS_TO_REMOVE, n_jobs=None):
+    """
+    Apply the whole cleaning to a DataFrame in memory, without printing or writing anything.
+
+    Args:
+        df (pandas.DataFrame): Raw tracks.
+        columns_to_remove (list): Columns dropped at the end.
+        n_jobs (int): Threads used to scan the column shards.
+
+    Returns:
+        pandas.DataFrame: Cleaned tracks.
+    """
+    scan = scan_dataset(df, n_jobs=n_jobs)
+    return remove_columns(remove_missing(df, scan), columns_to_remove)
 
 # %% [markdown]
 # ## 7. Revisar los resultados de la limpieza.
-# 
+#
 # Muestra el resultados final de la limpieza y compara el antes y después para verificar que haya sido existosa.
 
 # %%
-# Create comprehensive cleaning summary
-print("DATA CLEANING SUMMARY")
-print("="*60)
+def print_cleaning_summary(df, df_cleaned, df_final, scan):
+    """
+    Print the records removed by every step and the quality checks of the cleaned dataset.
+
+    Args:
+        df (pandas.DataFrame): Raw tracks.
+        df_cleaned (pandas.DataFrame): Deduplicated tracks.
+        df_final (pandas.DataFrame): Tracks without missing values.
+        scan (dict): Result of :func:`scan_dataset`.
+    """
+    quality = scan["report"].stats
+
+    # Create comprehensive cleaning summary
+    print("DATA CLEANING SUMMARY")
+    print("="*60)
+
+    # Calculate total records removed
+    records_removed = len(df) - len(df_cleaned)
+    null_records_removed = len(df_cleaned) - len(df_final)
+    total_records_removed = len(df) - len(df_final)
+    percentage_removed = (total_records_removed / len(df)) * 100
+    percentage_retained = ((len(df_final)) / len(df)) * 100
+
+    print(f"Original dataset shape: {df.shape}")
+    print(f"Final dataset shape: {df_final.shape}")
+    print(f"\nRecords removed: {total_records_removed:,} ({percentage_removed:.2f}%)")
+    print(f"Records retained: {len(df_final):,} ({percentage_retained:.2f}%)")
+
+    print(f"\nBreakdown of records removed:")
+    print(f"  - Duplicate records: {records_removed:,}")
+    print(f"  - Records with missing values: {null_records_removed:,}")
+    print(f"  - Total removed: {total_records_removed:,}")
+
+    # Verify final dataset quality
+    print("FINAL DATASET QUALITY CHECK")
+    print("="*60)
+
+    # Check for duplicates in final dataset
+    final_duplicates = quality['remaining_duplicates']
+    print(f"Duplicate records in final dataset: {final_duplicates:,}")
+
+    # Check for missing values in final dataset
+    final_missing = quality['remaining_missing']
+    print(f"Missing values in final dataset: {final_missing:,}")
+
+    # Data quality status
+    if final_duplicates == 0 and final_missing == 0:
+        print("\n✅ DATA CLEANING SUCCESSFUL!")
+        print("✓ No duplicate records")
+        print("✓ No missing values")
+        print("✓ Dataset is ready for analysis and modeling")
+    else:
+        print("\n⚠️ WARNING: Data cleaning may not be complete")
+        if final_duplicates > 0:
+            print(f"⚠️ Still {final_duplicates:,} duplicate records remain")
+        if final_missing > 0:
+            print(f"⚠️ Still {final_missing:,} missing values remain")
+
+# %% [markdown]
+# ## 8. Guardar el conjunto de datos limpio.
+
+# %%
+def save_cleaned(df, output_dir, storage_format, scan, settings, quality_report_path):
+    """
+    Save the cleaned dataset, the fingerprints of the raw rows and the quality report.
+
+    Args:
+        df (pandas.DataFrame): Cleaned tracks.
+        output_dir (str): Output directory of the stage.
+        storage_format (str): Storage format of the cleaned dataset.
+        scan (dict): Result of :func:`scan_dataset` on the raw tracks.
+        settings (dict): Settings recorded with the dataset (:func:`cleaning_settings`).
+        quality_report_path (str): Output file of the quality report.
+
+    Returns:
+        str: Path of the cleaned dataset.
+    """
+    from incremental import save_cleaning_state
+    from storage import write_table
+
+    # Create output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Save the cleaned dataset
+    output_path = write_table(df, os.path.join(output_dir, 'dataset_cleaned'), storage_format)
+
+    # Fingerprints of every raw row (the hashes of the quality scan), used by the
+    # incremental mode to skip them next time
+    save_cleaning_state(output_dir, scan["seen"], len(df), settings)
+    scan["report"].save(quality_report_path, mode="in-memory")
+    return output_path
+
+
+def run(params, full_refit=False):
+    """
+    Run the cleaning stage with the given parameters.
+
+    Args:
+        params (dict): Pipeline parameters (``params.yaml``).
+        full_refit (bool): Rebuild everything even in incremental mode.
+
+    Returns:
+        dict: Row counts of the run.
+    """
+    from profiling import StageProfiler
+
+    # Wall time, CPU time and peak memory of every step, saved to metrics/profile_cleaning.json
+    profiler = StageProfiler("cleaning")
+
+    config = params["cleaning"]
+    storage_format = params["data"]["format"]
+    dataset_path = config["input_path"]
+    # Data-quality report (DVC metric) and threads used to compute it
+    quality_report_path = config.get("quality_report", "metrics/quality.json")
+    n_jobs = config.get("n_jobs", -1)
+
+    # Check if the file exists
+    if os.path.exists(dataset_path):
+        print(f"✓ Dataset found at: {dataset_path}")
+    else:
+        print(f"✗ Dataset not found at: {dataset_path}")
+        print("Please ensure the dataset.csv file is in the correct location.")
+
+    # Incremental mode: only clean the raw rows added since the last run
+    if config.get("incremental", False) and not full_refit:
+        profiler.start("incremental")
+        summary = clean_incremental(params, quality_report_path)
+        if summary is not None:
+            print(f"✓ Profile saved to: {profiler.save()}")
+            print("\n🎉 Data preprocessing completed successfully!")
+            return summary
+
+    # Streaming mode: clean the dataset chunk by chunk without loading it in memory
+    if config.get("streaming", False):
+        profiler.start("streaming")
+        summary = clean_streaming(params, quality_report_path)
+        print(f"✓ Profile saved to: {profiler.save()}")
+        print("\n🎉 Data preprocessing completed successfully!")
+        return summary
+
+    profiler.start("load")
+    df = load_dataset(dataset_path)
+    print(f"\n✓ Dataset loaded successfully!")
+    print(f"Dataset shape: {df.shape}")
+    print_overview(df)
 
-# Calculate total records removed
-total_records_removed = len(df) - len(df_final)
-percentage_removed = (total_records_removed / len(df)) * 100
-percentage_retained = ((len(df_final)) / len(df)) * 100
+    profiler.start("quality_scan")
+    scan = scan_dataset(df, n_jobs=n_jobs)
+    print(f"✓ Quality statistics computed in a single pass over {scan['report'].stats['columns']} columns")
+    print_quality_analysis(df, scan)
 
-print(f"Original dataset shape: {df.shape}")
-print(f"Final dataset shape: {df_final.shape}")
-print(f"\nRecords removed: {total_records_removed:,} ({percentage_removed:.2f}%)")
-print(f"Records retained: {len(df_final):,} ({percentage_retained:.2f}%)")
+    profiler.start("dedup")
+    df_cleaned = remove_duplicates(df, scan)
+    print_duplicates_removal(df, df_cleaned, scan)
 
-print(f"\nBreakdown of records removed:")
-print(f"  - Duplicate records: {records_removed:,}")
-print(f"  - Records with missing values: {null_records_removed:,}")
-print(f"  - Total removed: {total_records_removed:,}")
+    profiler.start("dropna")
+    df_final = remove_missing(df, scan)
+    print_missing_removal(df_cleaned, df_final, scan)
 
-# %%
-# Verify final dataset quality
-print("FINAL DATASET QUALITY CHECK")
-print("="*60)
-
-# Check for duplicates in final dataset
-final_duplicates = df_final.duplicated().sum()
-print(f"Duplicate records in final dataset: {final_duplicates:,}")
-
-# Check for missing values in final dataset
-final_missing = df_final.isnull().sum().sum()
-print(f"Missing values in final dataset: {final_missing:,}")
-
-# Data quality status
-if final_duplicates == 0 and final_missing == 0:
-    print("\n✅ DATA CLEANING SUCCESSFUL!")
-    print("✓ No duplicate records")
-    print("✓ No missing values")
-    print("✓ Dataset is ready for analysis and modeling")
-else:
-    print("\n⚠️ WARNING: Data cleaning may not be complete")
-    if final_duplicates > 0:
-        print(f"⚠️ Still {final_duplicates:,} duplicate records remain")
-    if final_missing > 0:
-        print(f"⚠️ Still {final_missing:,} missing values remain")
+    profiler.start("drop_columns")
+    df_final_for_saving = remove_columns(df_final, COLUMNS_TO_REMOVE, verbose=True)
+    print_cleaning_summary(df, df_cleaned, df_final, scan)
 
-# %% [markdown]
-# ## 8. Guardar el conjunto de datos limpio.
+    profiler.start("write")
+    print("SAVE CLEANED DATASET")
+    print("="*60)
+    output_path = save_cleaned(df_final_for_saving, config["output_path"], storage_format, scan,
+                               cleaning_settings(params), quality_report_path)
 
-# %%
-# Optional: Save the cleaned dataset
-print("SAVE CLEANED DATASET")
-print("="*60)
+    print(f"\n✓ Cleaned dataset saved to: {output_path}")
+    print(f"✓ File size: {os.path.getsize(output_path):,} bytes")
+    print(f"✓ Records saved: {len(df_final_for_saving):,}")
+    print(f"✓ Features saved: {len(df_final_for_saving.columns)}")
+    print(f"✓ Quality report saved to: {quality_report_path}")
+    print(f"✓ Profile saved to: {profiler.save()}")
 
-# Create output directory if it doesn't exist
-output_dir = config["output_path"]
-os.makedirs(output_dir, exist_ok=True)
+    print("\n🎉 Data preprocessing completed successfully!")
+    return {"rows_read": len(df), "duplicates_removed": len(df) - len(df_cleaned),
+            "missing_removed": len(df_cleaned) - len(df_final), "rows_saved": len(df_final_for_saving),
+            "output_path": output_path}
 
-# Save the cleaned dataset
-output_path = os.path.join(output_dir, 'dataset_cleaned.csv')
-df_final_for_saving.to_csv(output_path, index=False)
 
-print(f"\n✓ Cleaned dataset saved to: {output_path}")
-print(f"✓ File size: {os.path.getsize(output_path):,} bytes")
-print(f"✓ Records saved: {len(df_final_for_saving):,}")
-print(f"✓ Features saved: {len(df_final_for_saving.columns)}")
+def main():
+    import warnings
 
-print("\n🎉 Data preprocessing completed successfully!")
+    import pandas as pd
+    import yaml
 
-# %%
+    # Suprimir los warnings para una salida más limpia
+    warnings.filterwarnings('ignore')
 
+    # Opciones para una mejor visualización
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', None)
+    pd.set_option('display.max_colwidth', 50)
 
+    print("¡Bibliotecas importadas con éxito!")
 
+    # `python src/cleaning.py ... --full` rebuilds everything even in incremental mode
+    params = yaml.safe_load(open("params.yaml"))
+    run(params, full_refit='--full' in sys.argv[1:])
+
+# %%
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import joblib
+import numpy as np
+import yaml
+
+from schema import compact, read_chunks
+from streaming import RowHashSet
+
+STORE_FILE = "store.json"
+# Prepared feature vectors (float32, one row per track) and the id of every row
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+# Open-addressing hash table (HashIndex): row of every slot (-1 when empty) and hash of its key
+INDEX_ROWS_FILE = "index_rows.npy"
+INDEX_HASHES_FILE = "index_hashes.npy"
+
+
+# 64-bit FNV-1a, computed the same way for one id (hash_id) and for arrays of ids (hash_ids)
+FNV_OFFSET = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+
+def mix64(value):
+    """
+    Final avalanche of a 64-bit hash (MurmurHash3 fmix64), for a Python int or a ``uint64`` array.
+
+    FNV only carries the low bits of its input upwards, and the index slots
+    are the low bits of the hash, so the hash is mixed before being used.
+    """
+    value = value ^ (value >> 33)
+    value = (value * 0xFF51AFD7ED558CCD) & MASK_64
+    value = value ^ (value >> 33)
+    value = (value * 0xC4CEB9FE1A85EC53) & MASK_64
+    return value ^ (value >> 33)
+
+
+def hash_id(track_id):
+    """
+    64-bit hash of a track id, the key of the index.
+
+    Args:
+        track_id (str): Track id.
+
+    Returns:
+        int: Mixed FNV-1a hash of its UTF-8 bytes.
+    """
+    value = FNV_OFFSET
+    for byte in str(track_id).encode():
+        value = ((value ^ byte) * FNV_PRIME) & MASK_64
+    return mix64(value)
+
+
+def encode_ids(ids):
+    """
+    Track ids as a fixed-width bytes array (UTF-8), the format of the stored ids.
+
+    Args:
+        ids (array-like): Track ids.
+
+    Returns:
+        numpy.ndarray: Encoded ids (``S`` dtype).
+    """
+    return np.char.encode(np.asarray(ids, dtype=str), "utf-8")
+
+
+def hash_ids(encoded):
+    """
+    Vectorized :func:`hash_id` of an array of encoded ids.
+
+    Args:
+        encoded (numpy.ndarray): Ids encoded by :func:`encode_ids`.
+
+    Returns:
+        numpy.ndarray: Hash of every id (``uint64``).
+    """
+    width = encoded.dtype.itemsize
+    data = np.frombuffer(np.ascontiguousarray(encoded).tobytes(), dtype=np.uint8).reshape(len(encoded), width)
+    lengths = np.char.str_len(encoded)
+    values = np.full(len(encoded), FNV_OFFSET, dtype=np.uint64)
+    # One byte position of every id at a time; ids shorter than the position keep their value
+    for i in range(width):
+        active = lengths > i
+        values[active] = (values[active] ^ data[active, i]) * np.uint64(FNV_PRIME)
+    return mix64(values)
+
+
+def build_index(hashes, rows=None):
+    """
+    Build an open-addressing hash table (linear probing) over a set of distinct hashes.
+
+    The table has a power of two of slots, at least twice the number of keys,
+    so lookups probe a couple of slots on average. Keys are inserted for all
+    the rows at once: in every round each free slot goes to the first key
+    that probes it and the others move on to the next slot.
+
+    Args:
+        hashes (numpy.ndarray): Distinct hashes (``uint64``).
+        rows (numpy.ndarray): Row of every hash, its position when None.
+
+    Returns:
+        tuple: Row of every slot (-1 when empty) and hash of every slot.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    capacity = 1 << max(int(2 * len(hashes) - 1).bit_length(), 4)
+    mask = np.uint64(capacity - 1)
+    positions = np.full(capacity, -1, dtype=np.int64)
+
+    pending = np.arange(len(hashes))
+    slots = (hashes & mask).astype(np.intp)
+    while len(pending):
+        free = np.flatnonzero(positions[slots] == -1)
+        _, first = np.unique(slots[free], return_index=True)
+        claimed = free[first]
+        positions[slots[claimed]] = pending[claimed]
+
+        left = np.ones(len(pending), dtype=bool)
+        left[claimed] = False
+        pending, slots = pending[left], (slots[left] + 1) & (capacity - 1)
+
+    used = positions >= 0
+    slot_hashes = np.zeros(capacity, dtype=np.uint64)
+    slot_hashes[used] = hashes[positions[used]]
+    if rows is not None:
+        positions[used] = np.asarray(rows, dtype=np.int64)[positions[used]]
+    return positions, slot_hashes
+
+
+class HashIndex:
+    """
+    Open-addressing hash table from 64-bit keys to rows, built by :func:`build_index`.
+
+    Only the hashes are kept in the table, so every lookup confirms the
+    candidate rows against the actual keys (``matches``), which makes hash
+    collisions harmless.
+    """
+
+    def __init__(self, rows, hashes):
+        self.rows = rows
+        self.hashes = hashes
+        self._mask = len(rows) - 1
+
+    @classmethod
+    def build(cls, hashes, rows=None):
+        """Build the table of a set of distinct hashes (see :func:`build_index`)."""
+        return cls(*build_index(hashes, rows))
+
+    def save(self, path):
+        """
+        Save the table to ``path`` (one ``.npy`` file per array).
+
+        Args:
+            path (str): Output directory.
+        """
+        np.save(os.path.join(path, INDEX_ROWS_FILE), self.rows)
+        np.save(os.path.join(path, INDEX_HASHES_FILE), self.hashes)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Load a table saved with :meth:`save`.
+
+        Args:
+            path (str): Directory of the table.
+            mmap_mode (str): Memory-map mode of the arrays, None to read them into memory.
+
+        Returns:
+            HashIndex: Loaded table.
+        """
+        # Plain ndarray views of the maps: indexing np.memmap objects adds overhead to every lookup
+        return cls(*(np.asarray(np.load(os.path.join(path, name), mmap_mode=mmap_mode))
+                     for name in (INDEX_ROWS_FILE, INDEX_HASHES_FILE)))
+
+    def find(self, key, matches):
+        """
+        Row of a single key.
+
+        Args:
+            key (int): Hash of the key.
+            matches (callable): ``matches(row)``, True when the row holds the key.
+
+        Returns:
+            int: Row of the key, -1 when it is not in the table.
+        """
+        slot = key & self._mask
+        while True:
+            row = int(self.rows[slot])
+            if row < 0:
+                return -1
+            if int(self.hashes[slot]) == key and matches(row):
+                return row
+            slot = (slot + 1) & self._mask
+
+    def find_many(self, keys, matches):
+        """
+        Rows of a batch of keys.
+
+        Args:
+            keys (numpy.ndarray): Hash of every key (``uint64``).
+            matches (callable): ``matches(rows, positions)``, mask of the candidate
+                rows that hold the keys at those positions of the batch.
+
+        Returns:
+            numpy.ndarray: Row of every key, -1 for the keys not in the table.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        found = np.full(len(keys), -1, dtype=np.int64)
+
+        # Probe the slots of all the keys at once until each one hits its key or an empty slot
+        pending = np.arange(len(keys))
+        slots = (keys & np.uint64(self._mask)).astype(np.intp)
+        while len(pending):
+            rows = self.rows[slots]
+            hit = (rows >= 0) & (self.hashes[slots] == keys[pending])
+            hit[hit] = matches(rows[hit], pending[hit])
+            found[pending[hit]] = rows[hit]
+
+            left = ~hit & (rows >= 0)
+            pending, slots = pending[left], (slots[left] + 1) & self._mask
+        return found
+
+
+def content_version(paths):
+    """
+    Short id of the content of some files, which changes with any of their bytes.
+
+    Args:
+        paths (list): Files, in a fixed order.
+
+    Returns:
+        str: First 12 hex digits of the SHA-256 of their contents.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as fd:
+            for block in iter(lambda: fd.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class FeatureStore:
+    """
+    Prepared feature vectors of the known tracks, looked up by ``track_id``.
+
+    The vectors are the rows the model scores (output of the fitted
+    preprocessor, in its feature order), so a track in the store is scored
+    without preprocessing. Every array is a ``.npy`` file memory-mapped
+    read-only, shared between the processes that load the same store, and
+    the ids are found through a :class:`HashIndex` in O(1).
+    """
+
+    def __init__(self, vectors, ids, index, feature_names, version=None):
+        self.vectors = vectors
+        self.ids = ids
+        self.index = index
+        self.feature_names = list(feature_names)
+        self.version = version
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Load a store written by :func:`build_store`.
+
+        Args:
+            path (str): Store directory.
+            mmap_mode (str): Memory-map mode of the arrays, None to read them into memory.
+
+        Returns:
+            FeatureStore: Loaded store.
+        """
+        with open(os.path.join(path, STORE_FILE)) as f:
+            header = json.load(f)
+        vectors, ids = (np.asarray(np.load(os.path.join(path, name), mmap_mode=mmap_mode))
+                        for name in (VECTORS_FILE, IDS_FILE))
+        return cls(vectors, ids, HashIndex.load(path, mmap_mode=mmap_mode), feature_names=header["feature_names"],
+                   version=header.get("store_version"))
+
+    def row(self, track_id):
+        """
+        Locate a single track id, without the array overhead of :meth:`rows`.
+
+        Args:
+            track_id (str): Track id.
+
+        Returns:
+            int: Row of the id in :attr:`vectors`, -1 when it is unknown.
+        """
+        encoded = str(track_id).encode()
+        return self.index.find(hash_id(track_id), lambda row: self.ids[row] == encoded)
+
+    def rows(self, ids):
+        """
+        Locate a batch of track ids.
+
+        Args:
+            ids (list): Track ids.
+
+        Returns:
+            numpy.ndarray: Row of every id in :attr:`vectors`, -1 for unknown ids.
+        """
+        encoded = encode_ids(ids)
+        return self.index.find_many(hash_ids(encoded), lambda rows, positions: self.ids[rows] == encoded[positions])
+
+    def get(self, ids):
+        """
+        Feature vectors of a batch of track ids.
+
+        Args:
+            ids (list): Track ids.
+
+        Returns:
+            tuple: Vectors of the known ids (float32, shape (n_known, n_features))
+            and mask of the ids found.
+        """
+        rows = self.rows(ids)
+        known = rows >= 0
+        return self.vectors[rows[known]], known
+
+
+def _write_npy(path, raw_path, dtype, shape):
+    # Header of a .npy file followed by the rows already written to raw_path
+    with open(path, "wb") as out, open(raw_path, "rb") as raw:
+        np.lib.format.write_array_header_1_0(out, {"descr": np.dtype(dtype).str, "fortran_order": False,
+                                                   "shape": shape})
+        shutil.copyfileobj(raw, out, 1 << 20)
+    os.remove(raw_path)
+
+
+def build_store(input_path, output_path, preprocessor_path, chunksize, id_column="track_id"):
+    """
+    Build the feature store of the tracks of the raw dataset.
+
+    The dataset is read in chunks with only the id and the input columns of
+    the preprocessor, parsed with the dtypes of ``schema.SCHEMA`` as in the
+    cleaning stage, so the vectors are those of the prepared partitions (e.g.
+    float32 inputs scaled the same way). Rows the model cannot score (missing
+    values, as the cleaning stage drops them, or categories unseen in
+    training) are skipped. Vectors are appended to disk as they are
+    transformed, so memory stays bounded by the chunk plus the ids.
+
+    The store holds one vector per id, but the raw dataset lists a track once
+    per genre it belongs to, with ``track_genre`` (an input of the model) as
+    the only difference. The first valid row of an id in file order is kept:
+    a lookup by id scores the track under the genre it is listed with first,
+    and the other genres can still be scored through the features. The
+    rows skipped this way are counted in ``repeated_ids`` of the header.
+
+    The store is written to a temporary directory first and renamed, so a
+    reader never sees a half-written store.
+
+    Args:
+        input_path (str): Raw dataset (CSV, Parquet or Arrow).
+        output_path (str): Store directory; replaced if it exists.
+        preprocessor_path (str): Fitted preprocessor written by ``prepare.py``; the
+            ``metadata.yaml`` next to it gives the order of the features.
+        chunksize (int): Rows read at a time.
+        id_column (str): Column with the id of every track.
+
+    Returns:
+        dict: Header of the store.
+    """
+    preprocessor = joblib.load(preprocessor_path)
+    # Columns in the order of the prepared partitions the model was trained on
+    metadata_path = os.path.join(os.path.dirname(preprocessor_path), "metadata.yaml")
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            preprocessor.set_feature_order(yaml.safe_load(f)["feature_names"])
+    feature_columns = preprocessor.input_columns_
+    output_path = os.path.normpath(output_path)
+    tmp_path = "{}.tmp".format(output_path)
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    seen = RowHashSet()
+    ids, hashes, rows_read, repeated = [], [], 0, 0
+    raw_path = os.path.join(tmp_path, "vectors.raw")
+    with open(raw_path, "wb") as raw:
+        for chunk in read_chunks(input_path, chunksize, columns=[id_column] + list(feature_columns)):
+            rows_read += len(chunk)
+            chunk = compact(chunk.dropna())
+            chunk = chunk[~preprocessor.unknown_rows(chunk)]
+            chunk_ids = encode_ids(chunk[id_column].astype(str))
+            chunk_hashes = hash_ids(chunk_ids)
+            is_new = seen.add(chunk_hashes)
+            repeated += int((~is_new).sum())
+
+            preprocessor.transform(chunk[is_new], dtype=np.float32).tofile(raw)
+            ids.append(chunk_ids[is_new])
+            hashes.append(chunk_hashes[is_new])
+            sys.stderr.write("{:,} rows read, {:,} tracks stored\n".format(rows_read, len(seen)))
+
+    ids = np.concatenate(ids) if ids else np.empty(0, dtype="S1")
+    _write_npy(os.path.join(tmp_path, VECTORS_FILE), raw_path, np.float32, (len(ids), preprocessor.n_features_))
+    np.save(os.path.join(tmp_path, IDS_FILE), ids)
+    HashIndex.build(np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)).save(tmp_path)
+
+    header = {
+        # Changes whenever the vectors or their order change (the score table is aligned with them)
+        "store_version": content_version([os.path.join(tmp_path, name) for name in (VECTORS_FILE, IDS_FILE)]),
+        "rows_read": rows_read,
+        "tracks": len(ids),
+        # Valid rows of an id already stored (the same track under another genre)
+        "repeated_ids": repeated,
+        "id_column": id_column,
+        "n_features": preprocessor.n_features_,
+        "feature_names": list(preprocessor.feature_names_),
+    }
+    with open(os.path.join(tmp_path, STORE_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+
+    # Swap the directories; the old store is removed once the new one is in place
+    old_path = "{}.old".format(output_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(output_path):
+        os.rename(output_path, old_path)
+    os.rename(tmp_path, output_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return header
+
+
+def main():
+    params = yaml.safe_load(open("params.yaml"))["features"]
+
+    if len(sys.argv) != 3:
+        sys.stderr.write("Arguments error. Usage:\n")
+        sys.stderr.write("\tpython features.py dataset store\n")
+        sys.exit(1)
+
+    header = build_store(
+        input_path=sys.argv[1],
+        output_path=sys.argv[2],
+        preprocessor_path=params["preprocessor_path"],
+        chunksize=params["chunksize"],
+        id_column=params["id_column"],
+    )
+    sys.stderr.write("Feature store saved to {} ({:,} tracks)\n".format(sys.argv[2], header["tracks"]))
+
+
+if __name__ == "__main__":
+    main()
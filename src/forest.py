@@ -0,0 +1,362 @@
+import json
+import os
+
+import numpy as np
+
+# Arrays of a compiled forest, saved one .npy file each so they can be memory-mapped
+ARRAYS = ("children", "feature", "threshold", "missing_left", "values", "roots", "base")
+
+
+def _softmax(raw):
+    raw = raw - raw.max(axis=1, keepdims=True)
+    np.exp(raw, out=raw)
+    raw /= raw.sum(axis=1, keepdims=True)
+    return raw
+
+
+class CompiledForest:
+    """
+    Tree ensemble flattened into NumPy arrays and evaluated by vectorized traversal.
+
+    Node ``i`` of the forest (all the trees one after the other) takes the
+    slots ``2 * i`` and ``2 * i + 1`` of the flat arrays: ``children`` holds the
+    slot of the left and right child, ``feature`` and ``threshold`` the split
+    of the node (repeated in both slots). A step of the traversal of every
+    (row, tree) pair is then ``slot = children[slot + (x > threshold[slot])]``.
+    Leaves point to themselves in both slots, so the trees are walked
+    together; every few steps the pairs that reached a leaf are set
+    aside and the rest continue, until ``max_depth``. The leaf outputs
+    (``values``, one row per node) are pre-multiplied by the weight of their
+    tree, so the ensemble output is the sum over the trees plus ``base``,
+    passed through ``link``:
+
+    - ``identity``: averaged class probabilities (random forests, trees) or regression output.
+    - ``sigmoid`` / ``softmax``: margin of a binary / multiclass XGBoost model.
+    - ``samme``: weighted votes of an AdaBoost classifier.
+
+    Built with :func:`compile_model`; inputs are compared as ``float32``, as
+    scikit-learn and XGBoost do, so the outputs match the original model.
+    """
+
+    def __init__(self, children, feature, threshold, missing_left, values, roots, base, max_depth,
+                 link="identity", classes=None, n_features=None):
+        self.children = children
+        self.feature = feature
+        self.threshold = threshold
+        self.missing_left = missing_left
+        self.values = values
+        self.roots = roots
+        self.base = base
+        self.max_depth = int(max_depth)
+        self.link = link
+        self.classes_ = None if classes is None else np.asarray(classes)
+        self.n_features_in_ = n_features
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def apply(self, X, check_every=4):
+        """
+        Find the leaf reached in every tree.
+
+        Args:
+            X (numpy.ndarray): Features, shape (n_samples, n_features).
+            check_every (int): Steps between two removals of the pairs already at a leaf.
+
+        Returns:
+            numpy.ndarray: Index of the leaf node, shape (n_samples, n_trees).
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        has_missing = np.isnan(flat).any()
+
+        # One entry per (row, tree) pair still walking: current slot and offset of its row in `flat`
+        slots = np.tile(self.roots, n_rows)
+        offsets = np.repeat(np.arange(0, n_rows * n_features, n_features, dtype=slots.dtype), self.n_trees)
+        pairs = None
+        leaves = slots.copy()
+
+        for step in range(1, self.max_depth + 1):
+            x = flat[offsets + self.feature[slots]] if n_rows > 1 else flat[self.feature[slots]]
+            go_right = x > self.threshold[slots]
+            if has_missing:
+                # NaN fails every comparison: follow the default branch learned for missing values
+                go_right |= np.isnan(x) & ~self.missing_left[slots]
+            slots = self.children[slots + go_right]
+
+            if step % check_every == 0 or step == self.max_depth:
+                # Leaves are the only nodes whose children are themselves: a split on +inf
+                # (missing vs. present values in scikit-learn) is still an internal node
+                walking = self.children[slots] != slots
+                if walking.all():
+                    continue
+                done = ~walking
+                if pairs is None:
+                    leaves[done] = slots[done]
+                    pairs = np.flatnonzero(walking)
+                else:
+                    leaves[pairs[done]] = slots[done]
+                    pairs = pairs[walking]
+                if not len(pairs):
+                    break
+                slots, offsets = slots[walking], offsets[walking]
+        return (leaves >> 1).reshape(n_rows, self.n_trees)
+
+    def predict_raw(self, X):
+        """
+        Sum of the weighted leaf outputs, before the link function.
+
+        Args:
+            X (numpy.ndarray): Features, shape (n_samples, n_features).
+
+        Returns:
+            numpy.ndarray: Raw output, shape (n_samples, n_outputs).
+        """
+        return self.values[self.apply(X)].sum(axis=1) + self.base
+
+    def _transform(self, raw):
+        if self.link == "sigmoid":
+            p = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        if self.link == "softmax":
+            return _softmax(raw)
+        if self.link == "samme":
+            if raw.shape[1] == 2:
+                decision = (raw[:, 1] - raw[:, 0])[:, None] / 2
+                return _softmax(np.hstack([-decision, decision]))
+            return _softmax(raw / (raw.shape[1] - 1))
+        return raw
+
+    def predict_proba(self, X):
+        """
+        Class probabilities, as ``predict_proba`` of the original classifier.
+
+        Args:
+            X (numpy.ndarray): Features, shape (n_samples, n_features).
+
+        Returns:
+            numpy.ndarray: Probability of every class, shape (n_samples, n_classes).
+        """
+        if self.classes_ is None:
+            raise AttributeError("predict_proba is not available for a regression model")
+        return self._transform(self.predict_raw(X))
+
+    def predict(self, X):
+        """
+        Predicted class, or predicted value of a regression model.
+
+        Args:
+            X (numpy.ndarray): Features, shape (n_samples, n_features).
+
+        Returns:
+            numpy.ndarray: Prediction of every row.
+        """
+        if self.classes_ is None:
+            return self._transform(self.predict_raw(X))[:, 0]
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def save(self, path):
+        """
+        Save the arrays (one ``.npy`` file each) and the parameters of the forest.
+
+        Args:
+            path (str): Output directory.
+
+        Returns:
+            list: Paths of the files written.
+        """
+        os.makedirs(path, exist_ok=True)
+        paths = []
+        for name in ARRAYS:
+            paths.append(os.path.join(path, "{}.npy".format(name)))
+            np.save(paths[-1], getattr(self, name))
+        paths.append(os.path.join(path, "forest.json"))
+        with open(paths[-1], "w") as f:
+            json.dump({
+                "max_depth": self.max_depth,
+                "link": self.link,
+                "classes": None if self.classes_ is None else self.classes_.tolist(),
+                "n_features": self.n_features_in_,
+            }, f)
+        return paths
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Load a forest saved with :meth:`save`.
+
+        Args:
+            path (str): Directory of the forest.
+            mmap_mode (str): Memory-map mode of the arrays, None to read them into memory.
+
+        Returns:
+            CompiledForest: Loaded forest.
+        """
+        with open(os.path.join(path, "forest.json")) as f:
+            params = json.load(f)
+        # Plain ndarray views of the maps: indexing np.memmap objects adds overhead to every step
+        arrays = {name: np.asarray(np.load(os.path.join(path, "{}.npy".format(name)), mmap_mode=mmap_mode))
+                  for name in ARRAYS}
+        return cls(**arrays, max_depth=params["max_depth"], link=params["link"], classes=params["classes"],
+                   n_features=params["n_features"])
+
+
+def _flatten(trees):
+    # trees: (left, right, feature, threshold, missing_left, values, depth) per tree, local indices, leaves at -1
+    sizes = [len(tree[0]) for tree in trees]
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int32)
+    left, right, feature, threshold, missing_left, values = (
+        np.concatenate([tree[i] for tree in trees]) for i in range(6)
+    )
+    offsets = np.repeat(roots, sizes)
+    is_leaf = left < 0
+    node = np.arange(len(left), dtype=np.int64)
+    # Slot 2 * i goes to the left child of node i and slot 2 * i + 1 to the right one
+    children = np.empty(2 * len(left), dtype=np.int32)
+    children[0::2] = 2 * np.where(is_leaf, node, left + offsets)
+    children[1::2] = 2 * np.where(is_leaf, node, right + offsets)
+    return {
+        "children": children,
+        "feature": np.repeat(np.where(is_leaf, 0, feature), 2).astype(np.int32),
+        # Leaves stay in place whatever the comparison gives
+        "threshold": np.repeat(np.where(is_leaf, np.inf, threshold), 2).astype(np.float64),
+        "missing_left": np.repeat(np.asarray(missing_left, dtype=bool), 2),
+        "values": np.asarray(values, dtype=np.float64),
+        "roots": 2 * roots,
+        "max_depth": max(tree[6] for tree in trees),
+    }
+
+
+def _sklearn_tree(estimator, weight, leaf_values=None):
+    tree = estimator.tree_
+    if tree.n_outputs != 1:
+        raise TypeError("Multi-output trees are not supported")
+    value = tree.value[:, 0, :]
+    if leaf_values is not None:
+        value = leaf_values(value)
+    elif tree.n_classes[0] > 1:
+        # Class fractions of the leaf, as DecisionTreeClassifier.predict_proba
+        value = value / value.sum(axis=1, keepdims=True)
+    missing_left = getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8))
+    return (tree.children_left, tree.children_right, tree.feature, tree.threshold,
+            missing_left, value * weight, tree.max_depth)
+
+
+def _compile_sklearn(model):
+    from sklearn.ensemble import AdaBoostClassifier
+    from sklearn.ensemble._forest import BaseForest
+    from sklearn.tree import BaseDecisionTree
+
+    if isinstance(model, BaseDecisionTree):
+        estimators, weights = [model], [1.0]
+    elif isinstance(model, BaseForest):
+        estimators = model.estimators_
+        weights = [1.0 / len(estimators)] * len(estimators)
+    elif isinstance(model, AdaBoostClassifier):
+        return _compile_adaboost(model)
+    else:
+        raise TypeError("Cannot compile a {}".format(type(model).__name__))
+
+    classes = getattr(model, "classes_", None)
+    if classes is not None and np.ndim(classes) != 1:
+        raise TypeError("Multi-output models are not supported")
+    trees = [_sklearn_tree(estimator, weight) for estimator, weight in zip(estimators, weights)]
+    flat = _flatten(trees)
+    return CompiledForest(**flat, base=np.zeros(flat["values"].shape[1]), link="identity", classes=classes,
+                          n_features=model.n_features_in_)
+
+
+def _compile_adaboost(model):
+    n_classes = model.n_classes_
+    weights = np.asarray(model.estimator_weights_[:len(model.estimators_)], dtype=np.float64)
+    weights = weights / weights.sum()
+
+    def votes(value):
+        # +1 for the class predicted by the leaf, -1/(K-1) for the others (SAMME)
+        vote = np.full(value.shape, -1.0 / (n_classes - 1))
+        vote[np.arange(len(value)), value.argmax(axis=1)] = 1.0
+        return vote
+
+    trees = [_sklearn_tree(estimator, weight, leaf_values=votes)
+             for estimator, weight in zip(model.estimators_, weights)]
+    flat = _flatten(trees)
+    return CompiledForest(**flat, base=np.zeros(n_classes), link="samme", classes=model.classes_,
+                          n_features=model.n_features_in_)
+
+
+def _tree_depth(left, right):
+    depth, level, nodes = 0, 0, np.array([0])
+    while len(nodes):
+        nodes = np.concatenate([left[nodes], right[nodes]])
+        nodes = nodes[nodes >= 0]
+        level += 1
+        depth = level if len(nodes) else depth
+    return depth
+
+
+def _compile_xgboost(model):
+    import xgboost as xgb
+
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise TypeError("Only gbtree XGBoost models can be compiled, not {}".format(gbm["name"]))
+
+    objective = learner["objective"]["name"]
+    n_groups = max(int(learner["learner_model_param"].get("num_class", 0)), 1)
+    link = {"binary:logistic": "sigmoid", "multi:softprob": "softmax", "multi:softmax": "softmax"}.get(objective)
+    if link is None and not objective.startswith("reg:squared"):
+        raise TypeError("Cannot compile the XGBoost objective {}".format(objective))
+
+    trees = []
+    for tree, group in zip(gbm["model"]["trees"], gbm["model"]["tree_info"]):
+        left = np.asarray(tree["left_children"], dtype=np.int64)
+        right = np.asarray(tree["right_children"], dtype=np.int64)
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        # XGBoost goes left when x < condition (float32): the same as x <= the previous float32
+        threshold = np.nextafter(conditions, np.float32(-np.inf)).astype(np.float64)
+        values = np.zeros((len(left), n_groups))
+        leaves = left < 0
+        # The output of a leaf is stored in its split condition
+        values[leaves, group] = conditions[leaves]
+        trees.append((left, right, np.asarray(tree["split_indices"]), threshold,
+                      np.asarray(tree["default_left"], dtype=bool), values, _tree_depth(left, right)))
+
+    n_features = int(learner["learner_model_param"]["num_feature"])
+    flat = _flatten(trees)
+    forest = CompiledForest(**flat, base=np.zeros(n_groups), link=link or "identity",
+                            classes=getattr(model, "classes_", None) if link else None, n_features=n_features)
+    if link and forest.classes_ is None:
+        forest.classes_ = np.arange(max(n_groups, 2))
+
+    # Intercept (base_score) of the booster, in margin space
+    probe = np.zeros((1, n_features), dtype=np.float32)
+    margin = booster.predict(xgb.DMatrix(probe), output_margin=True).reshape(1, -1)
+    forest.base = (margin - forest.predict_raw(probe))[0].astype(np.float64)
+    return forest
+
+
+def compile_model(model):
+    """
+    Convert a trained tree ensemble into a :class:`CompiledForest`.
+
+    Supports the scikit-learn decision trees and forests (``RandomForest*``,
+    ``ExtraTrees*``), ``AdaBoostClassifier`` over decision trees and XGBoost
+    ``gbtree`` models (``XGBClassifier``, ``XGBRegressor`` or a ``Booster``)
+    with a logistic, softmax or squared error objective.
+
+    Args:
+        model: Fitted estimator.
+
+    Returns:
+        CompiledForest: Equivalent array-backed ensemble.
+
+    Raises:
+        TypeError: If the model cannot be compiled.
+    """
+    if type(model).__module__.startswith("xgboost"):
+        return _compile_xgboost(model)
+    return _compile_sklearn(model)
@@ -0,0 +1,220 @@
+import os
+import uuid
+
+import joblib
+import numpy as np
+import pandas as pd
+import yaml
+
+from schema import cast, compact, read_csv
+from splitting import hash_split, stratified_hash_split
+from storage import append_sparse, append_table, read_in_chunks, table_path
+from streaming import RowHashSet
+
+# Files kept next to the cleaned dataset to know which raw rows were processed
+STATE_FILE = "state.yaml"
+FINGERPRINTS_FILE = "fingerprints.npy"
+
+
+def load_cleaning_state(output_dir):
+    """
+    Load the state recorded by the last run of the cleaning stage.
+
+    Args:
+        output_dir (str): Output directory of the cleaning stage.
+
+    Returns:
+        dict: Build id, rows saved and settings of the run, or None if there is no state.
+    """
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path) or not os.path.exists(os.path.join(output_dir, FINGERPRINTS_FILE)):
+        return None
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def save_cleaning_state(output_dir, seen, rows, settings, build=None):
+    """
+    Record the raw rows processed by the cleaning stage.
+
+    Args:
+        output_dir (str): Output directory of the cleaning stage.
+        seen (RowHashSet): Hashes of every raw row read.
+        rows (int): Rows in the cleaned dataset.
+        settings (dict): Cleaning settings the dataset was built with.
+        build (str): Id of the full build the dataset comes from, a new one when None.
+
+    Returns:
+        dict: Saved state.
+    """
+    seen.save(os.path.join(output_dir, FINGERPRINTS_FILE))
+    state = dict(settings, build=build or uuid.uuid4().hex, rows=int(rows))
+    with open(os.path.join(output_dir, STATE_FILE), "w") as f:
+        yaml.safe_dump(state, f, default_flow_style=False)
+    return state
+
+
+def clean_new_rows(input_path, output_dir, chunksize, columns_to_remove, settings):
+    """
+    Clean only the raw rows added since the last run and append them to the cleaned dataset.
+
+    The raw file is streamed and every row is looked up in the fingerprints of
+    the previous run: known rows are skipped, new ones are deduplicated, cleaned
+    and appended. The new rows are kept in memory until they are appended, so
+    this mode is meant for small additions to a large history.
+
+    Args:
+        input_path (str): Raw CSV file.
+        output_dir (str): Output directory of the cleaning stage.
+        chunksize (int): Number of rows read per chunk.
+        columns_to_remove (list): Columns dropped before saving.
+        settings (dict): Storage format and cleaning flags of the current configuration.
+
+    Returns:
+        dict: Row counts of the run, or None when a full cleaning is required (no
+        previous run, different settings, or raw rows modified or removed).
+    """
+    state = load_cleaning_state(output_dir)
+    stem = os.path.join(output_dir, "dataset_cleaned")
+    if (state is None or not settings["remove_duplicates"]
+            or any(state.get(key) != value for key, value in settings.items())
+            or not os.path.exists(table_path(stem, settings["format"]))):
+        return None
+
+    fingerprints = os.path.join(output_dir, FINGERPRINTS_FILE)
+    previous = RowHashSet.load(fingerprints)
+    seen = RowHashSet.load(fingerprints)
+    matched = np.zeros(len(previous), dtype=bool)
+    summary = {"rows_read": 0, "new_rows": 0, "duplicates_removed": 0,
+               "missing_removed": 0, "rows_saved": 0}
+
+    new_chunks = []
+    for chunk in read_csv(input_path, categories=False, chunksize=chunksize):
+        summary["rows_read"] += len(chunk)
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        pos, known = previous.find(hashes)
+        matched[pos[known]] = True
+        is_new = seen.add(hashes)
+        summary["new_rows"] += int((~known).sum())
+        summary["duplicates_removed"] += int((~known & ~is_new).sum())
+
+        chunk = chunk[is_new]
+        if settings["remove_na"]:
+            rows_before = len(chunk)
+            chunk = compact(chunk.dropna())
+            summary["missing_removed"] += rows_before - len(chunk)
+        new_chunks.append(chunk.drop(columns=[col for col in columns_to_remove if col in chunk.columns]))
+
+    # Rows processed before but no longer in the raw file: the history changed
+    if not matched.all():
+        return None
+
+    new_rows = pd.concat(new_chunks, ignore_index=True)
+    if len(new_rows):
+        append_table(new_rows, stem, settings["format"])
+    summary["rows_saved"] = len(new_rows)
+    summary["rows_total"] = state["rows"] + len(new_rows)
+    save_cleaning_state(output_dir, seen, summary["rows_total"], settings, build=state["build"])
+    return summary
+
+
+def prepare_new_rows(input_path, output_path_train, output_path_test, fmt, seed, test_size, chunksize,
+                     key_columns=None, stratify_bins=None, high_cardinality_encoding="label",
+                     columns_to_normalize=None):
+    """
+    Encode only the cleaned rows added since the last preparation and append them to the partitions.
+
+    The preprocessor fitted by the last full run is reused as is and the new
+    rows are sent to train or test with :func:`splitting.hash_split`, so each
+    row is placed deterministically from its key and ``prepare.seed``. When the
+    last full run used a stratified hash split, its per-stratum thresholds are
+    reused.
+
+    Args:
+        input_path (str): Cleaned dataset.
+        output_path_train (str): Directory of the training partition.
+        output_path_test (str): Directory of the test partition.
+        fmt (str): Storage format.
+        seed (int): Seed of the split.
+        test_size (float): Fraction of the new rows sent to the test set.
+        chunksize (int): Rows read per chunk while skipping the already prepared ones.
+        key_columns (list): Columns hashed to place each row, the whole row but the target when None.
+        stratify_bins (int): Number of popularity strata of the split, None if not stratified.
+        high_cardinality_encoding (str): Encoding of the high-cardinality columns in the configuration.
+        columns_to_normalize (list): Columns to normalize in the configuration, not checked when None.
+
+    Returns:
+        dict: Rows appended to each partition, or None when a full preparation
+        is required (no previous run, different settings, cleaned dataset
+        rebuilt, or categories unseen by the fitted encoders).
+    """
+    state = load_cleaning_state(os.path.dirname(input_path))
+    metadata_path = os.path.join(output_path_train, "metadata.yaml")
+    preprocessor_path = os.path.join(output_path_train, "preprocessor.joblib")
+    if state is None or not os.path.exists(metadata_path) or not os.path.exists(preprocessor_path):
+        return None
+    try:
+        with open(metadata_path) as f:
+            metadata = yaml.safe_load(f)
+    except yaml.YAMLError:
+        return None
+
+    expected = {"source_build": state["build"], "random_seed": seed, "test_split_ratio": test_size,
+                "storage_format": fmt, "split_key": key_columns, "stratify_bins": stratify_bins,
+                "high_cardinality_encoding": high_cardinality_encoding}
+    if any(metadata.get(key) != value for key, value in expected.items()):
+        return None
+    if state["rows"] < metadata["source_rows"]:
+        return None
+
+    # Rows appended by the cleaning stage since the last preparation
+    skip = metadata["source_rows"]
+    position = 0
+    new_chunks = []
+    for chunk in read_in_chunks(input_path, chunksize):
+        start = max(skip - position, 0)
+        position += len(chunk)
+        if start < len(chunk):
+            new_chunks.append(chunk.iloc[start:])
+    summary = {"new_rows": 0, "train_rows": 0, "test_rows": 0}
+    if not new_chunks:
+        return summary
+
+    df = cast(pd.concat(new_chunks, ignore_index=True))
+    preprocessor = joblib.load(preprocessor_path)
+    if columns_to_normalize is not None and list(columns_to_normalize) != preprocessor.columns_to_normalize:
+        return None
+    try:
+        # Columns in the order of the partitions being appended to
+        preprocessor.set_feature_order(metadata["feature_names"])
+    except (KeyError, ValueError):
+        return None
+    if preprocessor.unknown_rows(df).any():
+        return None
+
+    X = preprocessor.transform_frame(df)
+    y = df[preprocessor.target_column]
+    keys = df.drop(columns=[preprocessor.target_column]) if key_columns is None else df[key_columns]
+    if metadata.get("split_thresholds"):
+        test = stratified_hash_split(keys, y, seed, metadata["split_thresholds"])
+    else:
+        test = hash_split(keys, seed, test_size)
+
+    append_table(X[~test], os.path.join(output_path_train, "X_train"), fmt)
+    append_table(y[~test], os.path.join(output_path_train, "y_train"), fmt)
+    append_table(X[test], os.path.join(output_path_test, "X_test"), fmt)
+    append_table(y[test], os.path.join(output_path_test, "y_test"), fmt)
+    if preprocessor.sparse_columns_:
+        X_sparse = preprocessor.transform_sparse(df, block="sparse")
+        append_sparse(X_sparse[~test], os.path.join(output_path_train, "X_train_onehot"))
+        append_sparse(X_sparse[test], os.path.join(output_path_test, "X_test_onehot"))
+
+    summary.update(new_rows=len(df), train_rows=int((~test).sum()), test_rows=int(test.sum()))
+    metadata["train_size"] += summary["train_rows"]
+    metadata["test_size"] += summary["test_rows"]
+    metadata["original_shape"][0] += len(df)
+    metadata["encoded_shape"][0] += len(df)
+    metadata["source_rows"] = position
+    with open(metadata_path, "w") as f:
+        yaml.dump(metadata, f, default_flow_style=False)
+    return summary
@@ -1,517 +1,974 @@
 # %% [markdown]
 # # Preparación de Datos para Modelado
-# 
+#
 # Este notebook realiza la preparación final de los datos para el entrenamiento de modelos de machine learning:
-# 
+#
 # - Cargar librerías necesarias
 # - Identificar y codificar variables categóricas
 # - Dividir el conjunto de datos en entrenamiento y prueba
 # - Guardar los conjuntos de datos procesados
-# 
+#
 # **Nota:** Se asume que los datos ya han sido limpiados previamente.
+#
+# Cada paso es una función que puede importarse sin efectos secundarios
+# (`from prepare import fit_preprocessor, encode`); la etapa completa se ejecuta
+# con `python src/prepare.py data/prep/dataset_cleaned.parquet [--full]`.
 
 # %% [markdown]
 # ## 1. Cargar Librerías Requeridas
-# 
-# Importar todas las librerías necesarias para la preparación de datos y codificación de variables.
+#
+# Al importar el módulo solo se cargan librerías ligeras: pandas, numpy, scikit-learn, joblib y los módulos del pipeline se importan dentro de las funciones que los usan.
 
 # %%
-import pandas as pd
-import numpy as np
-import yaml
 import os
-import warnings
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler, MinMaxScaler, RobustScaler
-import joblib
-from datetime import datetime
-
-# Suprimir warnings para una salida más limpia
-warnings.filterwarnings('ignore')
-
-# Configuración de pandas para mejor visualización
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', None)
-pd.set_option('display.max_colwidth', 50)
-
-print("✓ Librerías importadas exitosamente!")
-print(f"Pandas versión: {pd.__version__}")
-print(f"NumPy versión: {np.__version__}")
+import sys
+
+# Variables numéricas a normalizar
+COLUMNS_TO_NORMALIZE = ['duration_ms', 'loudness', 'tempo']
+
+
+def prepare_incremental(params):
+    """
+    Encode only the cleaned rows added since the last preparation and append them to the partitions.
+
+    Args:
+        params (dict): Pipeline parameters.
+
+    Returns:
+        dict: Rows appended to each partition, or None when a full preparation is required.
+    """
+    from incremental import prepare_new_rows
+    from storage import table_path
+
+    config = params["prepare"]
+    print("\nModo incremental activado")
+    summary = prepare_new_rows(
+        table_path(config["input_path"], params["data"]["format"]),
+        config["output_path_train"],
+        config["output_path_test"],
+        params["data"]["format"],
+        seed=config["seed"],
+        test_size=config["split"],
+        chunksize=config["chunksize"],
+        key_columns=config.get("split_key"),
+        stratify_bins=config.get("stratify_bins"),
+        high_cardinality_encoding=config.get("high_cardinality_encoding", "label"),
+        columns_to_normalize=config.get("columns_to_normalize") or COLUMNS_TO_NORMALIZE,
+    )
+
+    if summary is None:
+        print("✗ No hay una preparación previa reutilizable (primera ejecución, parámetros distintos,")
+        print("  datos reconstruidos o categorías nuevas): se realiza la preparación completa")
+        return None
+
+    print(f"✓ Registros nuevos: {summary['new_rows']:,}")
+    print(f"✓ Añadidos a entrenamiento: {summary['train_rows']:,}")
+    print(f"✓ Añadidos a prueba: {summary['test_rows']:,}")
+    return summary
 
 # %% [markdown]
 # ## 2. Cargar Configuración y Datos
-# 
-# Cargar los parámetros desde el archivo `params.yaml` y el conjunto de datos limpio.
 
 # %%
-# Cargar configuración desde params.yaml
-config = yaml.safe_load(open("params.yaml"))["prepare"]
-
-print("Configuración cargada:")
-print("=" * 40)
-for key, value in config.items():
-    print(f"{key}: {value}")
-
-# Extraer parámetros
-input_path = config["input_path"]
-output_path_train = config["output_path_train"]
-output_path_test = config["output_path_test"]
-test_split = config["split"]
-random_seed = config["seed"]
-
-print(f"\n✓ Configuración cargada exitosamente!")
-print(f"✓ División de test: {test_split*100}%")
-print(f"✓ Semilla aleatoria: {random_seed}")
-
-# %%
-# Cargar el conjunto de datos limpio
-print(f"Cargando datos desde: {input_path}")
-
-if os.path.exists(input_path):
-    df = pd.read_csv(input_path)
-    print(f"✓ Datos cargados exitosamente!")
-    print(f"✓ Forma del conjunto de datos: {df.shape}")
-    print(f"✓ Total de registros: {len(df):,}")
-    print(f"✓ Total de características: {df.shape[1]}")
-else:
-    raise FileNotFoundError(f"Archivo no encontrado: {input_path}")
-
-# Establecer semilla para reproducibilidad
-np.random.seed(random_seed)
-print(f"\n✓ Semilla aleatoria establecida: {random_seed}")
+def load_dataset(input_path):
+    """
+    Load the cleaned dataset with the compact dtypes (float32, int8, category...) of ``schema.SCHEMA``.
+
+    Args:
+        input_path (str): Cleaned dataset, in any storage format.
+
+    Returns:
+        pandas.DataFrame: Cleaned tracks.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    from schema import load_table
+
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Archivo no encontrado: {input_path}")
+    return load_table(input_path)
+
+
+def scan_in_chunks(input_path, columns_to_normalize=COLUMNS_TO_NORMALIZE, method="exact", chunksize=100000):
+    """
+    Read the cleaned dataset once, chunk by chunk, and collect what the preprocessor is fitted on.
+
+    Used with ``split_method: hash``, whose split encodes and writes the
+    partitions in a second streaming pass, so the dataset is never loaded
+    whole: the exact method keeps only the columns to normalize in memory and
+    the streaming method not even those (t-digest quartiles).
+
+    Args:
+        input_path (str): Cleaned dataset, in any storage format.
+        columns_to_normalize (list): Numeric columns to normalize.
+        method (str): ``"exact"`` or ``"streaming"`` statistics (see :func:`numeric_stats`).
+        chunksize (int): Rows read at a time.
+
+    Returns:
+        dict: ``head`` (first rows, with the dtypes of the dataset), ``rows``,
+        ``counts`` of the categorical columns (see :func:`category_counts`) and
+        ``stats`` of the columns to normalize.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    import pandas as pd
+
+    from schema import cast
+    from stats import StreamingStats, column_stats
+    from storage import read_in_chunks
+
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Archivo no encontrado: {input_path}")
+    if method not in ("exact", "streaming"):
+        raise ValueError(f"Método de estadísticas desconocido: {method!r} (exact o streaming)")
+    columns_to_normalize = list(columns_to_normalize)
+    streaming = StreamingStats(columns_to_normalize) if method == "streaming" else None
+
+    head, rows, counts, values = None, 0, {}, []
+    for chunk in read_in_chunks(input_path, chunksize):
+        chunk = cast(chunk)
+        if head is None:
+            head = chunk.head()
+            categorical_columns = column_types(head)[0]
+        rows += len(chunk)
+        for col, col_counts in category_counts(chunk, categorical_columns).items():
+            counts.setdefault(col, []).append(col_counts)
+        if streaming is None:
+            values.append(chunk[columns_to_normalize])
+        else:
+            streaming.update(chunk[columns_to_normalize])
+    if head is None:
+        raise ValueError(f"El conjunto de datos está vacío: {input_path}")
+
+    counts = {col: pd.concat(parts).groupby(level=0).sum().sort_values(ascending=False)
+              for col, parts in counts.items()}
+    if streaming is None:
+        stats = column_stats(pd.concat(values, ignore_index=True), columns_to_normalize)
+    else:
+        stats = streaming.result()
+    return {"head": head, "rows": rows, "counts": counts, "stats": stats}
 
 # %% [markdown]
 # ## 3. Exploración de Variables
-# 
+#
 # Analizar el conjunto de datos para identificar tipos de variables y su distribución.
 
 # %%
-# Mostrar información general del conjunto de datos
-print("INFORMACIÓN GENERAL DEL CONJUNTO DE DATOS")
-print("=" * 50)
-print(f"Forma: {df.shape}")
-print(f"\nPrimeras 5 filas:")
-print(df.head())
+def column_types(df):
+    """
+    Split the columns of the dataset by kind, leaving out the identifiers (``cleaning.ID_COLUMNS``).
+
+    Args:
+        df (pandas.DataFrame): Cleaned tracks.
+
+    Returns:
+        tuple: Categorical, numeric and boolean column names.
+    """
+    import numpy as np
+
+    from cleaning import ID_COLUMNS
+
+    df = df.drop(columns=ID_COLUMNS, errors='ignore')
+    # Variables categóricas (object y category)
+    categorical_columns = df.select_dtypes(include=['object', 'category']).columns.tolist()
+    categorical_columns += ['key', 'mode', 'time_signature']
+    # Variables numéricas, excluyendo las que están en categorical_columns
+    numeric_columns = df.select_dtypes(include=[np.number]).columns.tolist()
+    numeric_columns = [col for col in numeric_columns if col not in categorical_columns]
+    # Variables booleanas
+    boolean_columns = df.select_dtypes(include=['bool']).columns.tolist()
+    return categorical_columns, numeric_columns, boolean_columns
+
+
+def print_exploration(df, categorical_columns, numeric_columns, boolean_columns):
+    """
+    Print the general information of the dataset and the kind of every column.
+
+    Args:
+        df (pandas.DataFrame): Cleaned tracks.
+        categorical_columns (list): Categorical columns.
+        numeric_columns (list): Numeric columns.
+        boolean_columns (list): Boolean columns.
+    """
+    # Mostrar información general del conjunto de datos
+    print("INFORMACIÓN GENERAL DEL CONJUNTO DE DATOS")
+    print("=" * 50)
+    print(f"Forma: {df.shape}")
+    print(f"\nPrimeras 5 filas:")
+    print(df.head())
 
-print(f"\nInformación de tipos de datos:")
-print(df.info())
+    print(f"\nInformación de tipos de datos:")
+    print(df.info())
+    print(df.describe(include='all'))
 
-# %%
-df.describe(include='all')
+    # Identificar tipos de variables
+    print("ANÁLISIS DE TIPOS DE VARIABLES")
+    print("=" * 50)
 
-# %%
-# Identificar tipos de variables
-print("ANÁLISIS DE TIPOS DE VARIABLES")
-print("=" * 50)
-
-# Variables categóricas (object y category)
-categorical_columns = df.select_dtypes(include=['object', 'category']).columns.tolist()
-categorical_columns += ['key', 'mode', 'time_signature']
-print(f"\nVariables categóricas ({len(categorical_columns)}):")
-for col in categorical_columns:
-    unique_values = df[col].nunique()
-    print(f"  - {col}: {df[col].dtype} (valores únicos: {unique_values})")
-
-# Variables numéricas
-numeric_columns = df.select_dtypes(include=[np.number]).columns.tolist()
-# Excluir columnas numéricas que están en categorical_columns
-numeric_columns = [col for col in numeric_columns if col not in categorical_columns]
-print(f"Variables numéricas ({len(numeric_columns)}):")
-for col in numeric_columns:
-    print(f"  - {col}: {df[col].dtype}")
-
-# Variables booleanas
-boolean_columns = df.select_dtypes(include=['bool']).columns.tolist()
-print(f"\nVariables booleanas ({len(boolean_columns)}):")
-for col in boolean_columns:
-    print(f"  - {col}: {df[col].dtype}")
+    print(f"\nVariables categóricas ({len(categorical_columns)}):")
+    for col in categorical_columns:
+        unique_values = df[col].nunique()
+        print(f"  - {col}: {df[col].dtype} (valores únicos: {unique_values})")
+
+    print(f"Variables numéricas ({len(numeric_columns)}):")
+    for col in numeric_columns:
+        print(f"  - {col}: {df[col].dtype}")
+
+    print(f"\nVariables booleanas ({len(boolean_columns)}):")
+    for col in boolean_columns:
+        print(f"  - {col}: {df[col].dtype}")
 
 # %% [markdown]
 # ## 4. Normalización de Variables Numéricas
-# 
-# Analizar y normalizar las variables numéricas para mejorar el rendimiento de los algoritmos de machine learning que son sensibles a la escala de las características.
+#
+# Analizar las variables numéricas y elegir el método de normalización de cada una.
+#
+# Las estadísticas de todas las columnas a normalizar (`prepare.columns_to_normalize`) se calculan juntas en una sola pasada y los scalers se ajustan a partir de ellas, sin volver a recorrer los datos. Con `prepare.statistics: streaming` se calculan por bloques, con cuantiles aproximados (t-digest). Con `split_method: hash` toda la etapa lee el conjunto por bloques (`scan_in_chunks`) y no lo carga en memoria: `exact` solo guarda las columnas a normalizar y `streaming` ni siquiera esas, para datos que no caben en memoria.
 
 # %%
-# Análisis estadístico de variables numéricas
-columns_to_normalize = ['duration_ms','loudness', 'tempo']
-
-print("ANÁLISIS ESTADÍSTICO DE VARIABLES NUMÉRICAS A NORMALIZAR")
-print("=" * 50)
-
-# Estadísticas descriptivas de variables numéricas
-numeric_stats = df[columns_to_normalize].describe()
-print(numeric_stats)
-
-print(f"\nRangos de valores para cada variable numérica a normalizar:")
-print("-" * 50)
-for col in columns_to_normalize:
-    min_val = df[col].min()
-    max_val = df[col].max()
-    mean_val = df[col].mean()
-    std_val = df[col].std()
-    print(f"{col}:")
-    print(f"  • Rango: [{min_val:.3f}, {max_val:.3f}]")
-    print(f"  • Media: {mean_val:.3f}, Desv. Estándar: {std_val:.3f}")
-    ratio = max_val / min_val if min_val != 0 else 'Inf'
-    if isinstance(ratio, str):
-        print(f"  • Ratio (max/min): {ratio}")
-    else:
-        print(f"  • Ratio (max/min): {ratio:.2f}")
-    print()
-
-# %%
-# Determinación de estrategia de normalización
-if columns_to_normalize:
-    print("DETERMINACIÓN DE ESTRATEGIA DE NORMALIZACIÓN")
+def numeric_stats(df, columns_to_normalize=COLUMNS_TO_NORMALIZE, method="exact", chunksize=100000):
+    """
+    Compute the statistics of the columns to normalize of the dataset in memory.
+
+    The streaming method gives the same statistics as :func:`scan_in_chunks`
+    with the same ``chunksize``, so both split methods fit the same scalers.
+
+    Args:
+        df (pandas.DataFrame): Cleaned tracks.
+        columns_to_normalize (list): Numeric columns to normalize.
+        method (str): ``"exact"`` (one pass over ``df``) or ``"streaming"`` (t-digest quartiles).
+        chunksize (int): Rows per chunk of the streaming method.
+
+    Returns:
+        dict: Statistics of every column (see :func:`stats.column_stats`).
+    """
+    from stats import StreamingStats, column_stats
+
+    columns_to_normalize = list(columns_to_normalize)
+    if method not in ("exact", "streaming"):
+        raise ValueError(f"Método de estadísticas desconocido: {method!r} (exact o streaming)")
+    if method == "streaming":
+        stats = StreamingStats(columns_to_normalize)
+        for start in range(0, len(df), chunksize):
+            stats.update(df[columns_to_normalize].iloc[start:start + chunksize])
+        return stats.result()
+    return column_stats(df[columns_to_normalize], columns_to_normalize)
+
+
+def print_numeric_analysis(stats):
+    """
+    Print the statistics and ranges of the columns to normalize.
+
+    Args:
+        stats (dict): Statistics of every column, from :func:`numeric_stats`.
+    """
+    import pandas as pd
+
+    print("ANÁLISIS ESTADÍSTICO DE VARIABLES NUMÉRICAS A NORMALIZAR")
     print("=" * 50)
-    
-    # Análisis de distribuciones para determinar el mejor método
-    variables_to_normalize = []
-    normalization_strategy = {}
-    
-    for col in columns_to_normalize:
-        # Calcular estadísticas para determinar el método apropiado
-        q1 = df[col].quantile(0.25)
-        q3 = df[col].quantile(0.75)
-        iqr = q3 - q1
-        
-        # Detectar outliers usando IQR
-        lower_bound = q1 - 1.5 * iqr
-        upper_bound = q3 + 1.5 * iqr
-        outliers = df[(df[col] < lower_bound) | (df[col] > upper_bound)][col]
-        outlier_percentage = len(outliers) / len(df) * 100
-        
-        # Determinar el rango de valores
-        min_val = df[col].min()
-        max_val = df[col].max()
-        range_ratio = max_val / min_val if min_val > 0 else float('inf')
-        
-        # Decidir método de normalización
-        if outlier_percentage > 5:  # Si hay muchos outliers, usar RobustScaler
-            method = "RobustScaler"
-            scaler = RobustScaler()
-        elif range_ratio > 100:  # Si el rango es muy amplio, usar StandardScaler
-            method = "StandardScaler"
-            scaler = StandardScaler()
-        else:  # Para rangos moderados, usar MinMaxScaler
-            method = "MinMaxScaler"
-            scaler = MinMaxScaler()
-        
-        variables_to_normalize.append(col)
-        normalization_strategy[col] = {'method': method, 'scaler': scaler, 'outlier_pct': outlier_percentage}
-        
-        print(f"✓ {col}: {method}")
-        print(f"  • Outliers: {outlier_percentage:.1f}%")
-        print(f"  • Ratio rango: {range_ratio:.2f}")
+
+    # Estadísticas descriptivas de variables numéricas (mismo formato que DataFrame.describe)
+    numeric_stats = pd.DataFrame({
+        col: {
+            'count': col_stats['count'],
+            'mean': col_stats['mean'],
+            # Desviación estándar muestral, como describe()
+            'std': (col_stats['var'] * col_stats['count'] / max(col_stats['count'] - 1, 1)) ** 0.5,
+            'min': col_stats['min'],
+            '25%': col_stats['q1'],
+            '50%': col_stats['median'],
+            '75%': col_stats['q3'],
+            'max': col_stats['max'],
+        }
+        for col, col_stats in stats.items()
+    })
+    print(numeric_stats)
+
+    print(f"\nRangos de valores para cada variable numérica a normalizar:")
+    print("-" * 50)
+    for col in stats:
+        min_val = numeric_stats[col]['min']
+        max_val = numeric_stats[col]['max']
+        mean_val = numeric_stats[col]['mean']
+        std_val = numeric_stats[col]['std']
+        print(f"{col}:")
+        print(f"  • Rango: [{min_val:.3f}, {max_val:.3f}]")
+        print(f"  • Media: {mean_val:.3f}, Desv. Estándar: {std_val:.3f}")
+        ratio = max_val / min_val if min_val != 0 else 'Inf'
+        if isinstance(ratio, str):
+            print(f"  • Ratio (max/min): {ratio}")
+        else:
+            print(f"  • Ratio (max/min): {ratio:.2f}")
         print()
-    
-    print(f"Total de variables a normalizar: {len(variables_to_normalize)}")
-else:
-    variables_to_normalize = []
-    normalization_strategy = {}
-    print("✓ No hay variables numéricas para normalizar.")
 
-# %%
-# Aplicar normalización a las variables numéricas
-df_normalized = df.copy()
-scalers = {}  # Diccionario para guardar los scalers
 
-if variables_to_normalize:
-    print("APLICANDO NORMALIZACIÓN")
+def fit_preprocessor(df, columns_to_normalize=COLUMNS_TO_NORMALIZE, high_cardinality_encoding="label", stats=None,
+                     categories=None):
+    """
+    Fit the scalers and encoders of the song features.
+
+    The preprocessor picks the method of every numeric column (RobustScaler
+    with many outliers, StandardScaler with a very wide range, MinMaxScaler
+    otherwise) and fits scalers and encoders in a single reusable object.
+
+    Args:
+        df (pandas.DataFrame): Cleaned tracks.
+        columns_to_normalize (list): Numeric columns to normalize.
+        high_cardinality_encoding (str): ``"label"`` or ``"onehot"`` (sparse block).
+        stats (dict): Statistics of the columns to normalize, computed by the preprocessor when None.
+        categories (dict): Values of every categorical column, taken from ``df`` when None.
+
+    Returns:
+        preprocessing.SongPreprocessor: Fitted preprocessor.
+    """
+    from preprocessing import SongPreprocessor
+
+    return SongPreprocessor(
+        columns_to_normalize=columns_to_normalize,
+        high_cardinality_encoding=high_cardinality_encoding,
+    ).fit(df, stats=stats, categories=categories)
+
+
+def print_normalization(preprocessor):
+    """
+    Print the normalization method chosen for every numeric column.
+
+    Args:
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+    """
+    print("DETERMINACIÓN DE ESTRATEGIA DE NORMALIZACIÓN")
     print("=" * 50)
-    
-    for col in variables_to_normalize:
-        method = normalization_strategy[col]['method']
-        scaler = normalization_strategy[col]['scaler']
-        
-        # Aplicar normalización
-        original_values = df[col].values.reshape(-1, 1)
-        normalized_values = scaler.fit_transform(original_values)
-        df_normalized[col] = normalized_values.flatten()
-        
-        # Guardar el scaler para uso futuro
-        scalers[f'{col}_scaler'] = scaler
-        
-        # Mostrar estadísticas antes y después
-        original_mean = df[col].mean()
-        original_std = df[col].std()
-        normalized_mean = df_normalized[col].mean()
-        normalized_std = df_normalized[col].std()
-        
-        print(f"✓ {col} ({method}):")
-        print(f"  • Antes: μ={original_mean:.3f}, σ={original_std:.3f}")
-        print(f"  • Después: μ={normalized_mean:.3f}, σ={normalized_std:.3f}")
-        print(f"  • Rango después: [{df_normalized[col].min():.3f}, {df_normalized[col].max():.3f}]")
+
+    normalization_strategy = preprocessor.normalization_strategy_
+    for col in normalization_strategy:
+        print(f"✓ {col}: {normalization_strategy[col]['method']}")
+        print(f"  • Outliers: {normalization_strategy[col]['outlier_pct']:.1f}%")
+        print(f"  • Ratio rango: {normalization_strategy[col]['range_ratio']:.2f}")
         print()
-    
-    print(f"✓ Normalización completada!")
-    print(f"✓ Variables normalizadas: {len(variables_to_normalize)}")
-    print(f"✓ Scalers guardados: {len(scalers)}")
-else:
-    print("✓ No hay variables para normalizar.")
+
+    print(f"Total de variables a normalizar: {len(normalization_strategy)}")
+    print(f"✓ Scalers ajustados: {len(preprocessor.scalers_)}")
 
 # %% [markdown]
 # ## 5. Identificar y Codificar Variables Categóricas
-# 
+#
 # Procesar las variables categóricas utilizando técnicas de codificación apropiadas.
 
 # %%
-# Análisis detallado de variables categóricas
-if categorical_columns:
-    print("ANÁLISIS DETALLADO DE VARIABLES CATEGÓRICAS")
-    print("=" * 50)
-    
-    for col in categorical_columns:
-        unique_count = df[col].nunique()
-        sample_values = df[col].value_counts().head(10)
-        
-        print(f"\nVariable: {col}")
-        print(f"Valores únicos: {unique_count}")
-        print(f"Top 10 valores más frecuentes:")
-        print(sample_values)
-        print("-" * 30)
-else:
-    print("✓ No se encontraron variables categóricas para procesar.")
+def category_counts(df, categorical_columns):
+    """
+    Count the values of the categorical columns.
+
+    Args:
+        df (pandas.DataFrame): Cleaned tracks, or a chunk of them.
+        categorical_columns (list): Categorical columns.
+
+    Returns:
+        dict: Frequency of every value present in each column (``pandas.Series``), most frequent first.
+    """
+    import numpy as np
+    import pandas as pd
+
+    # Sobre los valores: en una columna category value_counts() listaría también las categorías ausentes
+    return {col: pd.Series(np.asarray(df[col]), name=col).value_counts() for col in categorical_columns}
+
+
+def print_categorical_analysis(counts, preprocessor):
+    """
+    Print the most frequent values of every categorical column and its encoding.
+
+    Args:
+        counts (dict): Result of :func:`category_counts`.
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+    """
+    # Análisis detallado de variables categóricas
+    if counts:
+        print("ANÁLISIS DETALLADO DE VARIABLES CATEGÓRICAS")
+        print("=" * 50)
+
+        for col, col_counts in counts.items():
+            unique_count = len(col_counts)
+            sample_values = col_counts.head(10)
+
+            print(f"\nVariable: {col}")
+            print(f"Valores únicos: {unique_count}")
+            print(f"Top 10 valores más frecuentes:")
+            print(sample_values)
+            print("-" * 30)
+    else:
+        print("✓ No se encontraron variables categóricas para procesar.")
 
-# %%
-# Determinar estrategia de codificación para cada variable categórica
-if categorical_columns:
+    # Estrategia de codificación elegida por el preprocesador para cada variable categórica:
+    # One-Hot Encoding (<=10 categorías) y Label Encoding (>10 categorías), o
+    # One-Hot disperso (matriz CSR) con high_cardinality_encoding: onehot
     print("ESTRATEGIA DE CODIFICACIÓN")
     print("=" * 50)
-    
-    # Separar variables por cardinalidad
-    low_cardinality = []  # Para One-Hot Encoding (<=10 categorías)
-    high_cardinality = [] # Para Label Encoding (>10 categorías)
-    
-    for col in categorical_columns:
-        unique_count = df[col].nunique()
-        if unique_count <= 10:
-            low_cardinality.append(col)
-            print(f"✓ {col}: One-Hot Encoding (cardinalidad: {unique_count})")
+
+    low_cardinality = preprocessor.low_cardinality_
+    high_cardinality = preprocessor.high_cardinality_
+    sparse_columns = preprocessor.sparse_columns_
+
+    for col in preprocessor.categorical_columns_:
+        if col in low_cardinality:
+            method = "One-Hot Encoding"
+        elif col in sparse_columns:
+            method = "One-Hot Encoding disperso (CSR)"
         else:
-            high_cardinality.append(col)
-            print(f"✓ {col}: Label Encoding (cardinalidad: {unique_count})")
-    
+            method = "Label Encoding"
+        print(f"✓ {col}: {method} (cardinalidad: {len(counts[col])})")
+
     print(f"\nResumen:")
     print(f"Variables para One-Hot Encoding: {len(low_cardinality)}")
-    print(f"Variables para Label Encoding: {len(high_cardinality)}")
-else:
-    low_cardinality = []
-    high_cardinality = []
-    print("✓ No hay variables categóricas para codificar.")
+    print(f"Variables para Label Encoding: {len(high_cardinality) - len(sparse_columns)}")
+    print(f"Variables para One-Hot Encoding disperso: {len(sparse_columns)}")
+
+
+def encode(df, preprocessor):
+    """
+    Apply the normalization and the encoding in a single pass.
+
+    Args:
+        df (pandas.DataFrame): Cleaned tracks.
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+
+    Returns:
+        tuple: Dense features (DataFrame), target (Series) and the sparse one-hot
+        block of the high-cardinality columns (CSR matrix, None without it).
+    """
+    # Separar características (X) y variable objetivo (y)
+    X = preprocessor.transform_frame(df)
+    y = df[preprocessor.target_column]
+    # Bloque one-hot de alta cardinalidad, guardado aparte como matriz CSR (.npz)
+    X_sparse = preprocessor.transform_sparse(df, block="sparse") if preprocessor.sparse_columns_ else None
+    return X, y, X_sparse
+
+
+def encoded_shape(n_rows, preprocessor):
+    """
+    Shape of the encoded dataset, including the sparse block and the target.
+
+    Args:
+        n_rows (int): Rows of the dataset.
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+
+    Returns:
+        tuple: Rows and columns.
+    """
+    return (n_rows, preprocessor.n_features_ + 1)
+
+
+def print_encoding(df, X, preprocessor):
+    """
+    Print the columns before and after the normalization and the encoding.
+
+    Args:
+        df (pandas.DataFrame): Cleaned tracks.
+        X (pandas.DataFrame): Dense features.
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+    """
+    print("APLICANDO NORMALIZACIÓN Y CODIFICACIÓN")
+    print("=" * 50)
 
-# %%
-# Aplicar codificación a variables categóricas
-df_encoded = df_normalized.copy()  # Usar el dataframe normalizado
-encoders = {}  # Diccionario para guardar los encoders
-
-print("APLICANDO CODIFICACIÓN")
-print("=" * 50)
-
-# Label Encoding para variables de alta cardinalidad
-if high_cardinality:
-    print("Aplicando Label Encoding...")
-    for col in high_cardinality:
-        le = LabelEncoder()
-        df_encoded[col] = le.fit_transform(df_normalized[col].astype(str))
-        encoders[f'{col}_label_encoder'] = le
-        print(f"  ✓ {col}: {df_normalized[col].nunique()} categorías → valores numéricos")
-
-# One-Hot Encoding para variables de baja cardinalidad
-if low_cardinality:
-    print("\nAplicando One-Hot Encoding...")
-    for col in low_cardinality:
-        # Crear variables dummy
-        dummies = pd.get_dummies(df_normalized[col], prefix=col, drop_first=True)
-        
-        # Remover columna original y agregar las nuevas
-        df_encoded = df_encoded.drop(columns=[col])
-        df_encoded = pd.concat([df_encoded, dummies], axis=1)
-        
-        # Guardar las columnas creadas para referencia
-        encoders[f'{col}_dummy_columns'] = dummies.columns.tolist()
-        print(f"  ✓ {col}: {df_normalized[col].nunique()} categorías → {len(dummies.columns)} variables dummy")
-
-print(f"\n✓ Codificación completada!")
-print(f"✓ Forma después de normalización: {df_normalized.shape}")
-print(f"✓ Forma después de codificación: {df_encoded.shape}")
-print(f"✓ Nuevas características creadas: {df_encoded.shape[1] - df_normalized.shape[1]}")
+    normalization_strategy = preprocessor.normalization_strategy_
+    encoders = preprocessor.encoders_
+    for col in normalization_strategy:
+        method = normalization_strategy[col]['method']
+        print(f"✓ {col} ({method}):")
+        print(f"  • Antes: μ={df[col].mean():.3f}, σ={df[col].std():.3f}")
+        print(f"  • Después: μ={X[col].mean():.3f}, σ={X[col].std():.3f}")
+        print(f"  • Rango después: [{X[col].min():.3f}, {X[col].max():.3f}]")
+        print()
+
+    for col in preprocessor.high_cardinality_:
+        if col in preprocessor.sparse_columns_:
+            onehot_columns = encoders[f'{col}_onehot_columns']
+            print(f"  ✓ {col}: {df[col].nunique()} categorías → {len(onehot_columns)} columnas dispersas")
+        else:
+            print(f"  ✓ {col}: {df[col].nunique()} categorías → valores numéricos")
+    for col in preprocessor.low_cardinality_:
+        dummy_columns = encoders[f'{col}_dummy_columns']
+        print(f"  ✓ {col}: {df[col].nunique()} categorías → {len(dummy_columns)} variables dummy")
+
+    shape = encoded_shape(len(X), preprocessor)
+    print(f"\n✓ Normalización y codificación completadas!")
+    print(f"✓ Forma original: {df.shape}")
+    print(f"✓ Forma después de codificación: {shape}")
+    print(f"✓ Nuevas características creadas: {shape[1] - df.shape[1]}")
 
 # %% [markdown]
 # ## 6. División en Conjuntos de Entrenamiento y Prueba
-# 
+#
 # Dividir el conjunto de datos codificado en conjuntos de entrenamiento y prueba según los parámetros configurados.
+#
+# - `split_method: random`: división aleatoria con `train_test_split`.
+# - `split_method: hash`: cada registro se asigna por el hash de `split_key` (por defecto `track_id`, conservado por la limpieza; si es `null`, el registro completo sin la variable objetivo) y la semilla, opcionalmente estratificado en `stratify_bins` rangos de popularidad.
 
 # %%
-# Verificar si existe una columna objetivo (target)
-print("IDENTIFICACIÓN DE VARIABLE OBJETIVO")
-print("=" * 50)
-
-target_column = 'popularity'
-print(f"✓ Variable objetivo seleccionada: {target_column}")
-
-# Separar características (X) y variable objetivo (y)
-X = df_encoded.drop(columns=[target_column])
-y = df_encoded[target_column]
-
-print(f"\nForma de características (X): {X.shape}")
-print(f"Forma de variable objetivo (y): {y.shape}")
-print(f"\nDistribución de la variable objetivo:")
-print(y.value_counts().sort_index())
-
-# %%
-# Realizar la división train/test
-print("DIVISIÓN EN CONJUNTOS DE ENTRENAMIENTO Y PRUEBA")
-print("=" * 50)
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, 
-    test_size=test_split, 
-    random_state=random_seed,
-    #stratify=y if len(y.unique()) > 1 and len(y.unique()) < len(y) else None
-)
-
-print(f"✓ División completada con semilla: {random_seed}")
-print(f"✓ Tamaño de división de prueba: {test_split*100}%")
-print(f"\nTamaños de conjuntos:")
-print(f"  - Entrenamiento: {len(X_train):,} registros ({len(X_train)/len(X)*100:.1f}%)")
-print(f"  - Prueba: {len(X_test):,} registros ({len(X_test)/len(X)*100:.1f}%)")
-
-print(f"\nDistribución en conjunto de entrenamiento:")
-print(y_train.value_counts().sort_index())
+def print_target(X, y, target_column):
+    """
+    Print the target column and its distribution.
+
+    Args:
+        X (pandas.DataFrame): Dense features.
+        y (pandas.Series): Target.
+        target_column (str): Name of the target.
+    """
+    print("IDENTIFICACIÓN DE VARIABLE OBJETIVO")
+    print("=" * 50)
 
-print(f"\nDistribución en conjunto de prueba:")
-print(y_test.value_counts().sort_index())
+    print(f"✓ Variable objetivo seleccionada: {target_column}")
+
+    print(f"\nForma de características (X): {X.shape}")
+    print(f"Forma de variable objetivo (y): {y.shape}")
+    print(f"\nDistribución de la variable objetivo:")
+    print(y.value_counts().sort_index())
+
+
+def random_split(X, y, X_sparse, test_size, seed):
+    """
+    Split the encoded dataset at random with ``train_test_split``.
+
+    Args:
+        X (pandas.DataFrame): Dense features.
+        y (pandas.Series): Target.
+        X_sparse (scipy.sparse.csr_matrix): Sparse block, None without it.
+        test_size (float): Fraction of the rows sent to the test set.
+        seed (int): Seed of the split.
+
+    Returns:
+        dict: ``X_train``, ``X_test``, ``y_train``, ``y_test`` and the sparse
+        blocks ``X_train_onehot`` / ``X_test_onehot`` (None without them).
+    """
+    from sklearn.model_selection import train_test_split
+
+    arrays = [X, y] if X_sparse is None else [X, y, X_sparse]
+    X_train, X_test, y_train, y_test, *sparse_splits = train_test_split(
+        *arrays,
+        test_size=test_size,
+        random_state=seed,
+        #stratify=y if len(y.unique()) > 1 and len(y.unique()) < len(y) else None
+    )
+    X_train_onehot, X_test_onehot = sparse_splits or (None, None)
+    return {"X_train": X_train, "X_test": X_test, "y_train": y_train, "y_test": y_test,
+            "X_train_onehot": X_train_onehot, "X_test_onehot": X_test_onehot}
+
+
+def print_split(split, n_total, config, target_column):
+    """
+    Print the size of the partitions and, for a random split, their target distribution.
+
+    Args:
+        split (dict): Result of :func:`random_split` or ``splitting.split_in_chunks``.
+        n_total (int): Rows of the dataset.
+        config (dict): ``prepare`` section of the parameters.
+        target_column (str): Name of the target.
+    """
+    n_train, n_test = split["n_train"], split["n_test"]
+    print(f"✓ División completada con semilla: {config['seed']}")
+    print(f"✓ Tamaño de división de prueba: {config['split']*100}%")
+    if config.get("stratify_bins") and config.get("split_method") == "hash":
+        print(f"✓ Estratificada en {config['stratify_bins']} rangos de {target_column}")
+    print(f"\nTamaños de conjuntos:")
+    print(f"  - Entrenamiento: {n_train:,} registros ({n_train/n_total*100:.1f}%)")
+    print(f"  - Prueba: {n_test:,} registros ({n_test/n_total*100:.1f}%)")
+
+    if "y_train" in split:
+        print(f"\nDistribución en conjunto de entrenamiento:")
+        print(split["y_train"].value_counts().sort_index())
+
+        print(f"\nDistribución en conjunto de prueba:")
+        print(split["y_test"].value_counts().sort_index())
+
+
+def split_dataset(input_path, X, y, X_sparse, preprocessor, config, storage_format):
+    """
+    Split the dataset into train and test with the method of ``prepare.split_method``.
+
+    With ``split_method: hash`` every row is placed from the hash of its key and
+    the seed, so the assignment does not change when rows are added; the
+    partitions are encoded and written chunk by chunk in a single pass
+    (``splitting.split_in_chunks``) instead of splitting the matrix in memory.
+
+    Args:
+        input_path (str): Cleaned dataset (read again by the hash split).
+        X (pandas.DataFrame): Dense features, None with the hash split.
+        y (pandas.Series): Target, None with the hash split.
+        X_sparse (scipy.sparse.csr_matrix): Sparse block, None without it.
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+        config (dict): ``prepare`` section of the parameters.
+        storage_format (str): Storage format of the partitions.
+
+    Returns:
+        dict: Rows of each partition (``n_train``, ``n_test``), thresholds of the
+        stratified split and, for a random split, the partitions themselves.
+    """
+    if config.get("split_method", "random") == "hash":
+        from splitting import split_in_chunks
+
+        summary = split_in_chunks(
+            input_path,
+            preprocessor,
+            config["output_path_train"],
+            config["output_path_test"],
+            storage_format,
+            seed=config["seed"],
+            test_size=config["split"],
+            chunksize=config["chunksize"],
+            key_columns=config.get("split_key"),
+            stratify_bins=config.get("stratify_bins"),
+        )
+        return {"n_train": summary["train_rows"], "n_test": summary["test_rows"],
+                "split_thresholds": summary["thresholds"]}
+
+    split = random_split(X, y, X_sparse, test_size=config["split"], seed=config["seed"])
+    split.update(n_train=len(split["X_train"]), n_test=len(split["X_test"]), split_thresholds=None)
+    return split
 
 # %% [markdown]
 # ## 7. Guardar Conjuntos de Datos Procesados
-# 
+#
 # Exportar los conjuntos de entrenamiento y prueba a los directorios especificados en la configuración.
 
 # %%
-# Crear directorios de salida
-print("GUARDANDO CONJUNTOS DE DATOS PROCESADOS")
-print("=" * 50)
-
-os.makedirs(output_path_train, exist_ok=True)
-os.makedirs(output_path_test, exist_ok=True)
-
-print(f"✓ Directorios creados:")
-print(f"  - Entrenamiento: {output_path_train}")
-print(f"  - Prueba: {output_path_test}")
-
-# %%
-# Guardar conjunto de entrenamiento
-train_features_path = os.path.join(output_path_train, 'X_train.csv')
-train_target_path = os.path.join(output_path_train, 'y_train.csv')
-
-X_train.to_csv(train_features_path, index=False)
-y_train.to_csv(train_target_path, index=False)
-
-print(f"✓ Conjunto de entrenamiento guardado:")
-print(f"  - Características: {train_features_path}")
-print(f"  - Variable objetivo: {train_target_path}")
-print(f"  - Registros: {len(X_train):,}")
-print(f"  - Características: {X_train.shape[1]}")
-
-# %%
-# Guardar conjunto de prueba
-test_features_path = os.path.join(output_path_test, 'X_test.csv')
-test_target_path = os.path.join(output_path_test, 'y_test.csv')
-
-X_test.to_csv(test_features_path, index=False)
-y_test.to_csv(test_target_path, index=False)
-
-print(f"✓ Conjunto de prueba guardado:")
-print(f"  - Características: {test_features_path}")
-print(f"  - Variable objetivo: {test_target_path}")
-print(f"  - Registros: {len(X_test):,}")
-print(f"  - Características: {X_test.shape[1]}")
-
-# %%
-# Guardar encoders, scalers y metadata
-encoders_path = os.path.join(output_path_train, 'encoders.joblib')
-scalers_path = os.path.join(output_path_train, 'scalers.joblib')
-metadata_path = os.path.join(output_path_train, 'metadata.yaml')
-
-# Guardar encoders
-if encoders:
-    joblib.dump(encoders, encoders_path)
-    print(f"✓ Encoders guardados: {encoders_path}")
-
-# Guardar scalers
-if scalers:
-    joblib.dump(scalers, scalers_path)
-    print(f"✓ Scalers guardados: {scalers_path}")
-
-# Crear metadata
-metadata = {
-    'original_shape': df.shape,
-    'encoded_shape': df_encoded.shape,
-    'target_column': target_column,
-    'numeric_columns': numeric_columns,
-    'categorical_columns': categorical_columns,
-    'low_cardinality_encoded': low_cardinality,
-    'high_cardinality_encoded': high_cardinality,
-    'train_size': len(X_train),
-    'test_size': len(X_test),
-    'test_split_ratio': test_split,
-    'random_seed': random_seed,
-    'feature_count': X_train.shape[1],
-    'encoding_date': datetime.now().strftime('%Y-%m-%d')
-}
-
-with open(metadata_path, 'w') as f:
-    yaml.dump(metadata, f, default_flow_style=False)
-
-print(f"✓ Metadata guardada: {metadata_path}")
+def save_partitions(split, output_path_train, output_path_test, storage_format, sparse=False):
+    """
+    Save the train and test partitions (already written by the hash split).
+
+    Args:
+        split (dict): Result of :func:`split_dataset`.
+        output_path_train (str): Directory of the training partition.
+        output_path_test (str): Directory of the test partition.
+        storage_format (str): Storage format.
+        sparse (bool): The preprocessor produces a sparse block.
+
+    Returns:
+        dict: Path of every table, by name (``X_train``, ``y_train``...).
+    """
+    from storage import table_path, write_sparse, write_table
+
+    os.makedirs(output_path_train, exist_ok=True)
+    os.makedirs(output_path_test, exist_ok=True)
+
+    # Los directorios se conservan entre ejecuciones (persist en dvc.yaml): eliminar
+    # el bloque disperso de una ejecución anterior con high_cardinality_encoding: onehot
+    if not sparse:
+        for stale_path in [os.path.join(output_path_train, 'X_train_onehot.npz'),
+                           os.path.join(output_path_test, 'X_test_onehot.npz')]:
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    paths = {}
+    for name, directory in [('X_train', output_path_train), ('y_train', output_path_train),
+                            ('X_test', output_path_test), ('y_test', output_path_test)]:
+        stem = os.path.join(directory, name)
+        if name in split:
+            paths[name] = write_table(split[name], stem, storage_format)
+        else:
+            # La división por hash ya lo escribió por bloques
+            paths[name] = table_path(stem, storage_format)
+        if name.startswith('X_') and split.get(f'{name}_onehot') is not None:
+            write_sparse(split[f'{name}_onehot'], f'{stem}_onehot')
+    return paths
+
+
+def build_metadata(original_shape, preprocessor, split, config, storage_format, column_kinds, source_build):
+    """
+    Describe the prepared dataset for the later stages and the incremental mode.
+
+    Args:
+        original_shape (tuple): Rows and columns of the cleaned dataset.
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+        split (dict): Result of :func:`split_dataset`.
+        config (dict): ``prepare`` section of the parameters.
+        storage_format (str): Storage format of the partitions.
+        column_kinds (tuple): Result of :func:`column_types`.
+        source_build (str): Build id of the cleaned dataset, None if unknown.
+
+    Returns:
+        dict: Metadata saved to ``metadata.yaml``.
+    """
+    from datetime import datetime
+
+    categorical_columns, numeric_columns, _ = column_kinds
+    return {
+        'original_shape': list(original_shape),
+        'encoded_shape': list(encoded_shape(original_shape[0], preprocessor)),
+        'target_column': preprocessor.target_column,
+        'numeric_columns': numeric_columns,
+        'categorical_columns': categorical_columns,
+        'low_cardinality_encoded': preprocessor.low_cardinality_,
+        'high_cardinality_encoded': preprocessor.high_cardinality_,
+        'train_size': split["n_train"],
+        'test_size': split["n_test"],
+        'test_split_ratio': config["split"],
+        'random_seed': config["seed"],
+        'split_method': config.get("split_method", "random"),
+        'split_key': config.get("split_key"),
+        'stratify_bins': config.get("stratify_bins"),
+        'split_thresholds': split["split_thresholds"],
+        'storage_format': storage_format,
+        # Registros del conjunto limpio ya preparados (modo incremental)
+        'source_build': source_build,
+        'source_rows': original_shape[0],
+        'feature_count': preprocessor.n_features_,
+        # Orden fijo de las columnas de X (SongPreprocessor.set_feature_order)
+        'feature_names': preprocessor.feature_names_,
+        # Columnas guardadas aparte en X_*_onehot.npz (high_cardinality_encoding: onehot)
+        'high_cardinality_encoding': preprocessor.high_cardinality_encoding,
+        'sparse_feature_names': preprocessor.sparse_feature_names_,
+        'encoding_date': datetime.now().strftime('%Y-%m-%d')
+    }
+
+
+def save_preprocessor(preprocessor, metadata, output_path_train):
+    """
+    Save the fitted preprocessor, its encoders and scalers, and the metadata.
+
+    Args:
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+        metadata (dict): Result of :func:`build_metadata`.
+        output_path_train (str): Directory of the training partition.
+
+    Returns:
+        dict: Path of every file saved, by name.
+    """
+    import joblib
+    import yaml
+
+    paths = {
+        'preprocessor': os.path.join(output_path_train, 'preprocessor.joblib'),
+        'metadata': os.path.join(output_path_train, 'metadata.yaml'),
+    }
+    # Guardar el preprocesador ajustado (reutilizable en inferencia)
+    joblib.dump(preprocessor, paths['preprocessor'])
+
+    # Guardar encoders y scalers
+    if preprocessor.encoders_:
+        paths['encoders'] = os.path.join(output_path_train, 'encoders.joblib')
+        joblib.dump(preprocessor.encoders_, paths['encoders'])
+    if preprocessor.scalers_:
+        paths['scalers'] = os.path.join(output_path_train, 'scalers.joblib')
+        joblib.dump(preprocessor.scalers_, paths['scalers'])
+
+    with open(paths['metadata'], 'w') as f:
+        yaml.dump(metadata, f, default_flow_style=False)
+    return paths
 
 # %% [markdown]
 # ## 8. Resumen Final
-# 
+#
 # Resumen completo del proceso de preparación de datos.
 
 # %%
-# Resumen final del proceso
-print("🎉 PREPARACIÓN DE DATOS COMPLETADA EXITOSAMENTE")
-print("=" * 60)
-
-print(f"📊 ESTADÍSTICAS GENERALES:")
-print(f"  • Conjunto de datos original: {df.shape}")
-print(f"  • Conjunto de datos normalizado: {df_normalized.shape}")
-print(f"  • Conjunto de datos codificado: {df_encoded.shape}")
-print(f"  • Nuevas características creadas: {df_encoded.shape[1] - df.shape[1]}")
-
-print(f"\n🔧 PROCESAMIENTO REALIZADO:")
-print(f"  • Variables numéricas: {len(numeric_columns)}")
-print(f"  • Variables normalizadas: {len(variables_to_normalize)}")
-print(f"  • Variables categóricas procesadas: {len(categorical_columns)}")
-print(f"  • One-Hot Encoding aplicado a: {len(low_cardinality)} variables")
-print(f"  • Label Encoding aplicado a: {len(high_cardinality)} variables")
-
-if variables_to_normalize:
-    print(f"\n📏 NORMALIZACIÓN APLICADA:")
-    for col in variables_to_normalize:
-        method = normalization_strategy[col]['method']
-        print(f"  • {col}: {method}")
-
-print(f"\n📁 DIVISIÓN DE DATOS:")
-print(f"  • Conjunto de entrenamiento: {len(X_train):,} registros ({len(X_train)/len(X)*100:.1f}%)")
-print(f"  • Conjunto de prueba: {len(X_test):,} registros ({len(X_test)/len(X)*100:.1f}%)")
-print(f"  • Variable objetivo: {target_column}")
-print(f"  • Semilla utilizada: {random_seed}")
-
-print(f"\n💾 ARCHIVOS GENERADOS:")
-print(f"  • {train_features_path}")
-print(f"  • {train_target_path}")
-print(f"  • {test_features_path}")
-print(f"  • {test_target_path}")
-if encoders:
-    print(f"  • {encoders_path}")
-if scalers:
-    print(f"  • {scalers_path}")
-print(f"  • {metadata_path}")
+def print_summary(original_shape, preprocessor, split, config, column_kinds, files):
+    """
+    Print the summary of the preparation.
+
+    Args:
+        original_shape (tuple): Rows and columns of the cleaned dataset.
+        preprocessor (preprocessing.SongPreprocessor): Fitted preprocessor.
+        split (dict): Result of :func:`split_dataset`.
+        config (dict): ``prepare`` section of the parameters.
+        column_kinds (tuple): Result of :func:`column_types`.
+        files (list): Paths of the files generated.
+    """
+    categorical_columns, numeric_columns, _ = column_kinds
+    normalization_strategy = preprocessor.normalization_strategy_
+    sparse_columns = preprocessor.sparse_columns_
+    shape = encoded_shape(original_shape[0], preprocessor)
+    n_train, n_test = split["n_train"], split["n_test"]
+
+    print("🎉 PREPARACIÓN DE DATOS COMPLETADA EXITOSAMENTE")
+    print("=" * 60)
+
+    print(f"📊 ESTADÍSTICAS GENERALES:")
+    print(f"  • Conjunto de datos original: {original_shape}")
+    print(f"  • Conjunto de datos codificado: {shape}")
+    print(f"  • Nuevas características creadas: {shape[1] - original_shape[1]}")
+
+    print(f"\n🔧 PROCESAMIENTO REALIZADO:")
+    print(f"  • Variables numéricas: {len(numeric_columns)}")
+    print(f"  • Variables normalizadas: {len(normalization_strategy)}")
+    print(f"  • Variables categóricas procesadas: {len(categorical_columns)}")
+    print(f"  • One-Hot Encoding aplicado a: {len(preprocessor.low_cardinality_)} variables")
+    print(f"  • Label Encoding aplicado a: {len(preprocessor.high_cardinality_) - len(sparse_columns)} variables")
+    print(f"  • One-Hot Encoding disperso aplicado a: {len(sparse_columns)} variables")
+
+    if normalization_strategy:
+        print(f"\n📏 NORMALIZACIÓN APLICADA:")
+        for col in normalization_strategy:
+            method = normalization_strategy[col]['method']
+            print(f"  • {col}: {method}")
+
+    print(f"\n📁 DIVISIÓN DE DATOS:")
+    print(f"  • Conjunto de entrenamiento: {n_train:,} registros ({n_train/original_shape[0]*100:.1f}%)")
+    print(f"  • Conjunto de prueba: {n_test:,} registros ({n_test/original_shape[0]*100:.1f}%)")
+    print(f"  • Variable objetivo: {preprocessor.target_column}")
+    print(f"  • Semilla utilizada: {config['seed']}")
+
+    print(f"\n💾 ARCHIVOS GENERADOS:")
+    for path in files:
+        print(f"  • {path}")
+
+    print(f"\n✅ Los datos están listos para el entrenamiento de modelos de machine learning!")
+
+
+def run(params, full_refit=False):
+    """
+    Run the prepare stage with the given parameters.
+
+    Args:
+        params (dict): Pipeline parameters (``params.yaml``).
+        full_refit (bool): Refit everything even in incremental mode.
+
+    Returns:
+        dict: Rows of each partition, or of the rows appended in incremental mode.
+    """
+    import numpy as np
+
+    from incremental import load_cleaning_state
+    from profiling import StageProfiler
+    from storage import table_path
+
+    # Tiempo, CPU y memoria de cada paso, guardados en metrics/profile_prepare.json
+    profiler = StageProfiler("prepare")
+
+    config = params["prepare"]
+    storage_format = params["data"]["format"]
+
+    print("Configuración cargada:")
+    print("=" * 40)
+    for key, value in config.items():
+        print(f"{key}: {value}")
+
+    input_path = table_path(config["input_path"], storage_format)
+    output_path_train = config["output_path_train"]
+    output_path_test = config["output_path_test"]
+    random_seed = config["seed"]
+
+    print(f"\n✓ Configuración cargada exitosamente!")
+    print(f"✓ División de test: {config['split']*100}%")
+    print(f"✓ Semilla aleatoria: {random_seed}")
+    print(f"✓ Método de división: {config.get('split_method', 'random')}")
+
+    # Modo incremental: codificar solo los registros nuevos con el preprocesador ya
+    # ajustado y añadirlos a las particiones guardadas. `--full` fuerza el reajuste completo.
+    if config.get("incremental", False) and not full_refit:
+        profiler.start("incremental")
+        summary = prepare_incremental(params)
+        if summary is not None:
+            print(f"✓ Perfil guardado: {profiler.save()}")
+            return summary
+
+    columns_to_normalize = config.get("columns_to_normalize") or COLUMNS_TO_NORMALIZE
+    statistics = config.get("statistics", "exact")
+    # La división por hash codifica y escribe las particiones por bloques: el preprocesador se
+    # ajusta también con una lectura por bloques, sin cargar el conjunto completo en memoria
+    out_of_core = config.get("split_method", "random") == "hash"
+
+    # Cargar el conjunto de datos limpio
+    profiler.start("load")
+    if out_of_core:
+        print(f"Leyendo datos por bloques desde: {input_path}")
+        scan = scan_in_chunks(input_path, columns_to_normalize, method=statistics, chunksize=config["chunksize"])
+        df, stats, counts = scan["head"], scan["stats"], scan["counts"]
+        original_shape = (scan["rows"], df.shape[1])
+    else:
+        print(f"Cargando datos desde: {input_path}")
+        df = load_dataset(input_path)
+        original_shape = df.shape
+    print(f"✓ Datos cargados exitosamente!")
+    print(f"✓ Forma del conjunto de datos: {original_shape}")
+    print(f"✓ Total de registros: {original_shape[0]:,}")
+    print(f"✓ Total de características: {original_shape[1]}")
+
+    # Establecer semilla para reproducibilidad
+    np.random.seed(random_seed)
+    print(f"\n✓ Semilla aleatoria establecida: {random_seed}")
+
+    column_kinds = column_types(df)
+    if not out_of_core:
+        print_exploration(df, *column_kinds)
+
+    profiler.start("normalization")
+    if not out_of_core:
+        stats = numeric_stats(df, columns_to_normalize, method=statistics, chunksize=config["chunksize"])
+        counts = category_counts(df, column_kinds[0])
+    print_numeric_analysis(stats)
+    # Por bloques, las categorías vienen de los conteos y df solo aporta las columnas y sus tipos
+    categories = {col: col_counts.index.to_numpy() for col, col_counts in counts.items()} if out_of_core else None
+    preprocessor = fit_preprocessor(df, columns_to_normalize,
+                                    high_cardinality_encoding=config.get("high_cardinality_encoding", "label"),
+                                    stats=stats, categories=categories)
+    print_normalization(preprocessor)
+
+    profiler.start("encoding")
+    print_categorical_analysis(counts, preprocessor)
+    if out_of_core:
+        # Se codifica por bloques al dividir
+        X = y = X_sparse = None
+    else:
+        X, y, X_sparse = encode(df, preprocessor)
+        print_encoding(df, X, preprocessor)
+        print_target(X, y, preprocessor.target_column)
 
-print(f"\n✅ Los datos están listos para el entrenamiento de modelos de machine learning!")
+    # En modo hash incluye codificar y escribir las particiones
+    profiler.start("split")
+    print("DIVISIÓN EN CONJUNTOS DE ENTRENAMIENTO Y PRUEBA")
+    print("=" * 50)
+    split = split_dataset(input_path, X, y, X_sparse, preprocessor, config, storage_format)
+    print_split(split, original_shape[0], config, preprocessor.target_column)
 
+    profiler.start("write")
+    print("GUARDANDO CONJUNTOS DE DATOS PROCESADOS")
+    print("=" * 50)
+    sparse = bool(preprocessor.sparse_columns_)
+    tables = save_partitions(split, output_path_train, output_path_test, storage_format, sparse=sparse)
+    for partition, directory in [('train', output_path_train), ('test', output_path_test)]:
+        print(f"✓ Conjunto de {'entrenamiento' if partition == 'train' else 'prueba'} guardado:")
+        print(f"  - Características: {tables[f'X_{partition}']}")
+        print(f"  - Variable objetivo: {tables[f'y_{partition}']}")
+        if sparse:
+            print(f"  - Bloque disperso: {os.path.join(directory, f'X_{partition}_onehot.npz')}")
+        print(f"  - Registros: {split[f'n_{partition}']:,}")
+        print(f"  - Características: {preprocessor.n_features_}")
+
+    cleaning_state = load_cleaning_state(os.path.dirname(input_path))
+    metadata = build_metadata(original_shape, preprocessor, split, config, storage_format, column_kinds,
+                              source_build=cleaning_state['build'] if cleaning_state else None)
+    artifacts = save_preprocessor(preprocessor, metadata, output_path_train)
+    for name, path in artifacts.items():
+        print(f"✓ {name.capitalize()} guardado: {path}")
+
+    files = list(tables.values()) + [artifacts[name] for name in ['preprocessor', 'encoders', 'scalers', 'metadata']
+                                     if name in artifacts]
+    files.append(profiler.save())
+    print_summary(original_shape, preprocessor, split, config, column_kinds, files)
+    return {"train_rows": split["n_train"], "test_rows": split["n_test"]}
+
+
+def main():
+    import warnings
+
+    import pandas as pd
+    import yaml
+
+    # Suprimir warnings para una salida más limpia
+    warnings.filterwarnings('ignore')
+
+    # Configuración de pandas para mejor visualización
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', None)
+    pd.set_option('display.max_colwidth', 50)
+
+    print("✓ Librerías importadas exitosamente!")
+    print(f"Pandas versión: {pd.__version__}")
+
+    params = yaml.safe_load(open("params.yaml"))
+    run(params, full_refit='--full' in sys.argv[1:])
 
+# %%
+if __name__ == "__main__":
+    main()
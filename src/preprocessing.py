@@ -0,0 +1,371 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder, MinMaxScaler, StandardScaler
+
+from stats import choose_method, column_stats, fit_scaler
+
+
+def _affine(scaler):
+    # Every supported scaler is x * mul + add once fitted
+    if isinstance(scaler, MinMaxScaler):
+        return scaler.scale_[0], scaler.min_[0]
+    if isinstance(scaler, StandardScaler):
+        return 1.0 / scaler.scale_[0], -scaler.mean_[0] / scaler.scale_[0]
+    return 1.0 / scaler.scale_[0], -scaler.center_[0] / scaler.scale_[0]
+
+
+class SongPreprocessor:
+    """
+    Fitted preprocessing of the song features: scaling plus categorical encoding.
+
+    Replays the transformations of ``prepare.py`` on new data: the numeric
+    columns in ``columns_to_normalize`` are scaled with the method chosen by
+    :func:`stats.choose_method`, categorical columns with more than
+    ``max_onehot_cardinality`` values are label encoded and the rest are one-hot
+    encoded (dropping the first category). The output keeps the column order of
+    ``prepare.py``: input columns in order, with the one-hot blocks appended at
+    the end. The target and the ``id_columns`` (kept by the cleaning stage to
+    place each track in the hash split) are never features.
+
+    With ``high_cardinality_encoding="onehot"`` the high-cardinality columns
+    (``track_genre``) are one-hot encoded as well, into a separate *sparse*
+    block placed after the rest (the *dense* block), so linear models do not
+    see an arbitrary ordinal code. :meth:`transform_frame` then returns the
+    dense block and :meth:`transform_sparse` with ``block="sparse"`` the one-hot
+    block as CSR.
+
+    Once fitted, every transformation is reduced to NumPy arrays (an affine map
+    for the numeric block, sorted lookups for the labels and comparisons for the
+    dummies) so :meth:`transform` fills a preallocated output matrix, or
+    :meth:`transform_sparse` a CSR matrix, in one pass. The column order can be
+    pinned with :meth:`set_feature_order` (e.g. to the ``feature_names`` saved
+    in ``metadata.yaml``).
+    """
+
+    def __init__(self, columns_to_normalize=("duration_ms", "loudness", "tempo"),
+                 extra_categorical_columns=("key", "mode", "time_signature"),
+                 target_column="popularity", max_onehot_cardinality=10,
+                 high_cardinality_encoding="label", id_columns=("track_id",)):
+        if high_cardinality_encoding not in ("label", "onehot"):
+            raise ValueError("high_cardinality_encoding must be 'label' or 'onehot'")
+        self.columns_to_normalize = list(columns_to_normalize)
+        self.extra_categorical_columns = list(extra_categorical_columns)
+        self.target_column = target_column
+        self.max_onehot_cardinality = max_onehot_cardinality
+        self.high_cardinality_encoding = high_cardinality_encoding
+        self.id_columns = list(id_columns)
+
+    def fit(self, df, stats=None, categories=None):
+        """
+        Fit scalers and encoders on the cleaned dataset.
+
+        The statistics of all the columns to normalize are computed together
+        in one pass (:func:`stats.column_stats`) and the scalers are built
+        from them without reading the columns again. ``stats`` and
+        ``categories`` can be given instead, e.g. collected chunk by chunk
+        from a table larger than memory; ``df`` then only provides the
+        columns and their dtypes, and a few rows are enough.
+
+        Args:
+            df (pandas.DataFrame): Cleaned dataset, target and identifier columns included or not.
+            stats (dict): Precomputed statistics of ``columns_to_normalize``, by column.
+            categories (dict): Values of every categorical column (see :meth:`categorical_columns`).
+
+        Returns:
+            SongPreprocessor: The fitted preprocessor.
+        """
+        features = df.drop(columns=[self.target_column] + self.id_columns, errors="ignore")
+        self.input_columns_ = features.columns.tolist()
+
+        categorical = self.categorical_columns(features)
+        self.categorical_columns_ = categorical
+        self.numeric_columns_ = [
+            col for col in features.select_dtypes(include=[np.number]).columns if col not in categorical
+        ]
+        self.boolean_columns_ = features.select_dtypes(include=["bool"]).columns.tolist()
+
+        if stats is None:
+            stats = column_stats(features[self.columns_to_normalize], self.columns_to_normalize)
+        self.normalization_strategy_ = {}
+        self.scalers_ = {}
+        for col in self.columns_to_normalize:
+            strategy = choose_method(stats[col])
+            scaler = fit_scaler(strategy["method"], stats[col])
+            self.normalization_strategy_[col] = dict(strategy, scaler=scaler)
+            self.scalers_[f"{col}_scaler"] = scaler
+
+        self.low_cardinality_ = []
+        self.high_cardinality_ = []
+        self.sparse_columns_ = []
+        self.encoders_ = {}
+        self.dummy_categories_ = {}
+        self.label_lookup_ = {}
+        for col in categorical:
+            if categories is None:
+                uniques = pd.unique(features[col].to_numpy())
+            else:
+                uniques = np.asarray(categories[col])
+            if len(uniques) <= self.max_onehot_cardinality:
+                # Same categories as pd.get_dummies(drop_first=True)
+                values = np.sort(uniques)
+                self.low_cardinality_.append(col)
+                self.dummy_categories_[col] = values[1:]
+                self.encoders_[f"{col}_dummy_columns"] = [f"{col}_{cat}" for cat in values[1:]]
+            elif self.high_cardinality_encoding == "onehot":
+                values = np.sort(uniques)
+                self.high_cardinality_.append(col)
+                self.sparse_columns_.append(col)
+                self.dummy_categories_[col] = values[1:]
+                self.encoders_[f"{col}_onehot_columns"] = [f"{col}_{cat}" for cat in values[1:]]
+                # Only used to detect unknown values
+                self.label_lookup_[col] = (values, np.arange(len(values)))
+            else:
+                le = LabelEncoder().fit(pd.Series(uniques).astype(str))
+                self.high_cardinality_.append(col)
+                self.encoders_[f"{col}_label_encoder"] = le
+                # LabelEncoder codes follow the string order; map the raw values to them
+                values = np.sort(uniques)
+                codes = np.searchsorted(le.classes_, values.astype(str))
+                self.label_lookup_[col] = (values, codes)
+
+        self._build_plan()
+        return self
+
+    def categorical_columns(self, df):
+        """
+        Columns encoded as categories: text and category dtypes plus ``extra_categorical_columns``.
+
+        Args:
+            df (pandas.DataFrame): Cleaned dataset, or only its first rows.
+
+        Returns:
+            list: Categorical column names.
+        """
+        categorical = df.drop(columns=[self.target_column] + self.id_columns, errors="ignore").select_dtypes(
+            include=["object", "category"]).columns.tolist()
+        return categorical + [col for col in self.extra_categorical_columns if col not in categorical]
+
+    def _dummy_names(self, col):
+        if col in self.sparse_columns_:
+            return self.encoders_[f"{col}_onehot_columns"]
+        return self.encoders_[f"{col}_dummy_columns"]
+
+    def _build_plan(self, feature_names=None):
+        dropped = self.low_cardinality_ + self.sparse_columns_
+        kept = [col for col in self.input_columns_ if col not in dropped]
+        default = kept + [name for col in dropped for name in self._dummy_names(col)]
+        if feature_names is not None and sorted(feature_names) != sorted(default):
+            raise ValueError("Feature order does not match the fitted features: {}".format(default))
+        self.feature_names_ = list(default if feature_names is None else feature_names)
+
+        sparse_names = {name for col in self.sparse_columns_ for name in self._dummy_names(col)}
+        self.dense_feature_names_ = [name for name in self.feature_names_ if name not in sparse_names]
+        self.sparse_feature_names_ = [name for name in self.feature_names_ if name in sparse_names]
+
+        # Numeric inputs (scaled or passed through) as an affine map
+        self._numeric_columns = [col for col in kept if col not in self.high_cardinality_]
+        self._mul = np.ones(len(self._numeric_columns))
+        self._add = np.zeros(len(self._numeric_columns))
+        for i, col in enumerate(self._numeric_columns):
+            if col in self.normalization_strategy_:
+                self._mul[i], self._add[i] = _affine(self.normalization_strategy_[col]["scaler"])
+
+        self._plans = {
+            None: self._make_plan(self.feature_names_),
+            "dense": self._make_plan(self.dense_feature_names_),
+            "sparse": self._make_plan(self.sparse_feature_names_),
+        }
+
+    def _make_plan(self, feature_names):
+        # Output column of every numeric input, label code and dummy in the given columns
+        position = {name: i for i, name in enumerate(feature_names)}
+        return {
+            "n_features": len(feature_names),
+            "numeric": [(i, position[col]) for i, col in enumerate(self._numeric_columns) if col in position],
+            "labels": {col: position[col] for col in self.high_cardinality_ if col in position},
+            "dummies": {
+                col: np.array([position[name] for name in self._dummy_names(col)], dtype=np.intp)
+                for col in self.low_cardinality_ + self.sparse_columns_
+                if len(self.dummy_categories_[col]) and self._dummy_names(col)[0] in position
+            },
+        }
+
+    def set_feature_order(self, feature_names):
+        """
+        Pin the order of the output columns.
+
+        Args:
+            feature_names (list): Permutation of ``feature_names_``, e.g. the
+                ``feature_names`` stored in ``metadata.yaml``.
+
+        Returns:
+            SongPreprocessor: The preprocessor, with the new order.
+        """
+        self._build_plan(feature_names)
+        return self
+
+    @property
+    def n_features_(self):
+        return len(self.feature_names_)
+
+    def _encode_labels(self, col, values):
+        lookup, codes = self.label_lookup_[col]
+        pos = np.searchsorted(lookup, values)
+        pos[pos == len(lookup)] = 0
+        unknown = lookup[pos] != values
+        if unknown.any():
+            raise ValueError(f"Unknown value(s) for '{col}': {np.unique(values[unknown]).tolist()[:5]}")
+        return codes[pos]
+
+    def unknown_rows(self, X):
+        """
+        Flag the rows with a high-cardinality value not seen during ``fit``.
+
+        Args:
+            X (pandas.DataFrame | dict): Raw features, one array-like per input column.
+
+        Returns:
+            numpy.ndarray: Boolean mask, True for the rows :meth:`transform` would reject.
+        """
+        unknown = np.zeros(len(X[self.input_columns_[0]]), dtype=bool)
+        for col, (lookup, _) in self.label_lookup_.items():
+            values = np.asarray(X[col])
+            pos = np.searchsorted(lookup, values)
+            pos[pos == len(lookup)] = 0
+            unknown |= lookup[pos] != values
+        return unknown
+
+    def transform(self, X, out=None, dtype=np.float64, block=None):
+        """
+        Transform raw song features into the model feature matrix.
+
+        Args:
+            X (pandas.DataFrame | dict): Raw features, one array-like per input column.
+            out (numpy.ndarray): Optional preallocated output of shape (n_rows, n_columns).
+            dtype (numpy.dtype): Type of the output when ``out`` is not given.
+            block (str): None for every feature, ``"dense"`` or ``"sparse"`` for
+                the columns of ``dense_feature_names_`` or ``sparse_feature_names_``.
+
+        Returns:
+            numpy.ndarray: Feature matrix with columns in the order of the block.
+        """
+        plan = self._plans[block]
+        n_rows = len(X[self.input_columns_[0]])
+        if out is None:
+            out = np.empty((n_rows, plan["n_features"]), dtype=dtype)
+
+        # Every column is written in place: no intermediate frame or block copy
+        for i, j in plan["numeric"]:
+            values = np.asarray(X[self._numeric_columns[i]], dtype=np.float64)
+            if self._mul[i] == 1 and self._add[i] == 0:
+                out[:, j] = values
+            else:
+                out[:, j] = values * self._mul[i] + self._add[i]
+
+        for col, j in plan["labels"].items():
+            out[:, j] = self._encode_labels(col, np.asarray(X[col]))
+
+        for col, index in plan["dummies"].items():
+            values = np.asarray(X[col])
+            if col in self.label_lookup_:
+                self._encode_labels(col, values)
+            out[:, index] = values[:, None] == self.dummy_categories_[col][None, :]
+        return out
+
+    def transform_sparse(self, X, dtype=np.float64, block=None):
+        """
+        Transform raw song features into a CSR feature matrix.
+
+        Every row has at most one entry per input column (the scaled value, the
+        label code or the matching dummy), so the entries are written in one
+        pass into fixed-width arrays and zeros are dropped afterwards.
+
+        Args:
+            X (pandas.DataFrame | dict): Raw features, one array-like per input column.
+            dtype (numpy.dtype): Type of the stored values.
+            block (str): Columns to return, as in :meth:`transform`.
+
+        Returns:
+            scipy.sparse.csr_matrix: Feature matrix with columns in the order of the block.
+        """
+        from scipy import sparse
+
+        plan = self._plans[block]
+        n_rows = len(X[self.input_columns_[0]])
+        width = len(plan["numeric"]) + len(plan["labels"]) + len(plan["dummies"])
+        data = np.empty((n_rows, width), dtype=dtype)
+        indices = np.empty((n_rows, width), dtype=np.int32)
+
+        k = 0
+        for i, j in plan["numeric"]:
+            data[:, k] = np.asarray(X[self._numeric_columns[i]], dtype=np.float64) * self._mul[i] + self._add[i]
+            indices[:, k] = j
+            k += 1
+
+        for col, j in plan["labels"].items():
+            data[:, k] = self._encode_labels(col, np.asarray(X[col]))
+            indices[:, k] = j
+            k += 1
+
+        for col, index in plan["dummies"].items():
+            categories = self.dummy_categories_[col]
+            values = np.asarray(X[col])
+            if col in self.label_lookup_:
+                self._encode_labels(col, values)
+            pos = np.searchsorted(categories, values)
+            pos[pos == len(categories)] = 0
+            data[:, k] = categories[pos] == values
+            indices[:, k] = index[pos]
+            k += 1
+
+        indptr = np.arange(0, n_rows * width + 1, width, dtype=np.int64)
+        matrix = sparse.csr_matrix((data.ravel(), indices.ravel(), indptr), shape=(n_rows, plan["n_features"]))
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        return matrix
+
+    def transform_frame(self, df):
+        """
+        Transform a DataFrame keeping the dtypes of ``prepare.py`` outputs.
+
+        Boolean inputs and dummy columns stay ``bool`` and label codes ``int64``.
+        Only the dense block is returned (every feature unless
+        ``high_cardinality_encoding="onehot"``).
+
+        Args:
+            df (pandas.DataFrame): Raw features.
+
+        Returns:
+            pandas.DataFrame: Encoded features, indexed like ``df``.
+        """
+        encoded = pd.DataFrame(self.transform(df, block="dense"), columns=self.dense_feature_names_, index=df.index)
+        dtypes = {col: bool for col in self.boolean_columns_}
+        dtypes.update({col: np.int64 for col in self.high_cardinality_ if col not in self.sparse_columns_})
+        dtypes.update({name: bool for col in self.low_cardinality_ for name in self.encoders_[f"{col}_dummy_columns"]})
+        return encoded.astype(dtypes)
+
+    def transform_one(self, features, out=None):
+        """
+        Transform the features of a single song.
+
+        Args:
+            features (dict): Raw value of every input column.
+            out (numpy.ndarray): Optional preallocated output of shape (n_features_,).
+
+        Returns:
+            numpy.ndarray: Feature vector with columns in ``feature_names_`` order.
+        """
+        plan = self._plans[None]
+        if out is None:
+            out = np.empty(self.n_features_)
+        for i, j in plan["numeric"]:
+            out[j] = float(features[self._numeric_columns[i]]) * self._mul[i] + self._add[i]
+
+        for col, j in plan["labels"].items():
+            out[j] = self._encode_labels(col, np.array([features[col]]))[0]
+
+        for col, index in plan["dummies"].items():
+            if col in self.label_lookup_:
+                self._encode_labels(col, np.array([features[col]]))
+            out[index] = self.dummy_categories_[col] == features[col]
+        return out
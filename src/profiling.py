@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _reset_peak_rss():
+    # Linux only: writing 5 to clear_refs resets the peak RSS (VmHWM) of the process
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of the process in MB.
+
+    Returns:
+        float: Peak RSS since the last reset (Linux) or since the process
+        started, None when the platform does not report it.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KB elsewhere
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class StageProfiler:
+    """
+    Wall time, CPU time and peak RSS of the named steps of a pipeline stage.
+
+    Steps are opened with :meth:`start` (which closes the previous one, so the
+    cells of a script can be marked one after the other) or with the
+    :meth:`step` context manager, and saved to ``metrics/profile_<stage>.json``
+    to be compared with ``dvc metrics diff``. The CPU time includes every
+    thread of the process; the peak RSS of a step is exact on Linux and the
+    peak of the process so far elsewhere.
+    """
+
+    def __init__(self, stage, output_dir="metrics"):
+        self.stage = stage
+        self.path = os.path.join(output_dir, "profile_{}.json".format(stage))
+        self.steps = {}
+        self._current = None
+        self._started = (time.perf_counter(), time.process_time())
+
+    def start(self, name):
+        """
+        Close the current step and open a new one.
+
+        Args:
+            name (str): Step name; the times of repeated steps are added up.
+        """
+        self.stop()
+        _reset_peak_rss()
+        self._current = (name, time.perf_counter(), time.process_time())
+
+    def stop(self):
+        """
+        Close the current step, if any.
+        """
+        if self._current is None:
+            return
+        name, wall, cpu = self._current
+        self._current = None
+        step = self.steps.setdefault(name, {"wall_time_s": 0.0, "cpu_time_s": 0.0, "peak_rss_mb": None})
+        step["wall_time_s"] += time.perf_counter() - wall
+        step["cpu_time_s"] += time.process_time() - cpu
+        peak = peak_rss_mb()
+        if peak is not None:
+            step["peak_rss_mb"] = max(step["peak_rss_mb"] or 0.0, peak)
+
+    @contextmanager
+    def step(self, name):
+        """
+        Profile the body of a ``with`` block as the step ``name``.
+
+        Args:
+            name (str): Step name.
+        """
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def save(self):
+        """
+        Close the current step and write the profile as JSON.
+
+        Returns:
+            str: Path of the profile.
+        """
+        self.stop()
+        wall, cpu = self._started
+        peaks = [step["peak_rss_mb"] for step in self.steps.values() if step["peak_rss_mb"] is not None]
+        profile = {
+            "stage": self.stage,
+            "total": {
+                "wall_time_s": round(time.perf_counter() - wall, 4),
+                "cpu_time_s": round(time.process_time() - cpu, 4),
+                "peak_rss_mb": round(max(peaks), 1) if peaks else None,
+            },
+            "steps": {
+                name: {
+                    "wall_time_s": round(step["wall_time_s"], 4),
+                    "cpu_time_s": round(step["cpu_time_s"], 4),
+                    "peak_rss_mb": None if step["peak_rss_mb"] is None else round(step["peak_rss_mb"], 1),
+                }
+                for name, step in self.steps.items()
+            },
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(profile, f, indent=2)
+        return self.path
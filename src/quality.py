@@ -0,0 +1,158 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def _scan_shard(df, columns):
+    # Hash and missing-value mask of every column of the shard, in column order
+    hashes, missing = [], []
+    for col in columns:
+        hashes.append(pd.util.hash_pandas_object(df[col], index=False).to_numpy())
+        missing.append(df[col].isna().to_numpy())
+    return hashes, missing
+
+
+def scan_columns(df, n_jobs=None):
+    """
+    Hash every row and count the missing values in one pass over the columns.
+
+    The columns are split in contiguous shards scanned on threads. The row hash
+    combines the hashes of the columns exactly as
+    ``pandas.util.hash_pandas_object(df, index=False)`` does, so it can be
+    compared with the fingerprints saved by previous runs.
+
+    Args:
+        df (pandas.DataFrame): Table to scan.
+        n_jobs (int): Number of threads, one per CPU when None or -1.
+
+    Returns:
+        tuple: Hash of every row (``uint64``), missing values per column
+        (``pandas.Series``) and missing values per row (``numpy.ndarray``).
+    """
+    n_jobs = os.cpu_count() if n_jobs in (None, -1) else n_jobs
+    columns = df.columns.tolist()
+    shards = [shard.tolist() for shard in np.array_split(np.arange(len(columns)), max(min(n_jobs, len(columns)), 1))]
+
+    # Same recurrence as pandas.core.util.hashing.combine_hash_arrays
+    num_items = len(columns)
+    mult = np.uint64(1000003)
+    row_hashes = np.full(len(df), 0x345678, dtype=np.uint64)
+    missing_by_row = np.zeros(len(df), dtype=np.int32)
+    missing_by_column = {}
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        futures = [pool.submit(_scan_shard, df, [columns[i] for i in shard]) for shard in shards]
+        i = 0
+        for future in futures:
+            hashes, missing = future.result()
+            for column_hashes, column_missing in zip(hashes, missing):
+                row_hashes ^= column_hashes
+                row_hashes *= mult
+                mult += np.uint64(82520 + 2 * (num_items - i))
+                missing_by_row += column_missing
+                missing_by_column[columns[i]] = int(column_missing.sum())
+                i += 1
+    row_hashes += np.uint64(97531)
+    return row_hashes, pd.Series(missing_by_column, index=columns, dtype=np.int64), missing_by_row
+
+
+class QualityReport:
+    """
+    Data-quality statistics of the cleaning stage, accumulated chunk by chunk.
+
+    Every chunk is scanned once with :func:`scan_columns`: the row hashes give
+    the duplicates (through a ``streaming.RowHashSet`` shared by all the
+    chunks) and the missing-value counts give the rows dropped, so the counts
+    before and after each cleaning step are derived from the same masks instead
+    of rescanning the table.
+    """
+
+    def __init__(self):
+        self.stats = {
+            "rows_read": 0,
+            "columns": 0,
+            "missing_values": 0,
+            "rows_with_missing": 0,
+            "missing_by_column": {},
+            "duplicate_rows": 0,
+            "duplicates_removed": 0,
+            "missing_values_after_deduplication": 0,
+            "rows_with_missing_after_deduplication": 0,
+            "missing_removed": 0,
+            "rows_saved": 0,
+            "remaining_duplicates": 0,
+            "remaining_missing": 0,
+            "remaining_rows_with_missing": 0,
+        }
+
+    def update(self, chunk, seen, remove_duplicates=True, remove_na=True, n_jobs=None):
+        """
+        Add a chunk of raw rows to the report.
+
+        Args:
+            chunk (pandas.DataFrame): Raw rows.
+            seen (streaming.RowHashSet): Hashes of the rows of the previous chunks, updated in place.
+            remove_duplicates (bool): Rows already seen are dropped.
+            remove_na (bool): Rows with a missing value are dropped.
+            n_jobs (int): Threads of :func:`scan_columns`.
+
+        Returns:
+            tuple: Row hashes of the chunk, mask of the rows seen for the first
+            time and mask of the rows kept by the cleaning.
+        """
+        hashes, missing_by_column, missing_by_row = scan_columns(chunk, n_jobs)
+        is_new = seen.add(hashes)
+        has_missing = missing_by_row > 0
+
+        deduplicated = is_new if remove_duplicates else np.ones(len(chunk), dtype=bool)
+        keep = deduplicated & ~has_missing if remove_na else deduplicated
+
+        stats = self.stats
+        stats["rows_read"] += len(chunk)
+        stats["columns"] = len(chunk.columns)
+        stats["missing_values"] += int(missing_by_row.sum())
+        stats["rows_with_missing"] += int(has_missing.sum())
+        for col, count in missing_by_column.items():
+            stats["missing_by_column"][col] = stats["missing_by_column"].get(col, 0) + int(count)
+        stats["duplicate_rows"] += int((~is_new).sum())
+        stats["duplicates_removed"] += int((~deduplicated).sum())
+        stats["missing_values_after_deduplication"] += int(missing_by_row[deduplicated].sum())
+        stats["rows_with_missing_after_deduplication"] += int(has_missing[deduplicated].sum())
+        stats["missing_removed"] += int((deduplicated & ~keep).sum())
+        stats["rows_saved"] += int(keep.sum())
+        stats["remaining_duplicates"] += int((keep & ~is_new).sum())
+        stats["remaining_missing"] += int(missing_by_row[keep].sum())
+        stats["remaining_rows_with_missing"] += int(has_missing[keep].sum())
+        return hashes, is_new, keep
+
+    def save(self, path, **extra):
+        """
+        Write the report as JSON (a DVC metrics file).
+
+        Args:
+            path (str): Output file.
+            **extra: Additional entries of the report (e.g. the cleaning mode).
+
+        Returns:
+            dict: Saved report.
+        """
+        return write_report(dict(extra, **self.stats), path)
+
+
+def write_report(report, path):
+    """
+    Write a quality report as JSON.
+
+    Args:
+        report (dict): Statistics of the run.
+        path (str): Output file.
+
+    Returns:
+        dict: Saved report.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
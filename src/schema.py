@@ -0,0 +1,174 @@
+import pandas as pd
+
+from storage import format_of, read_in_chunks, read_table
+
+# Compact dtype of every column of the raw Spotify tracks dataset. Text columns
+# are only needed by the cleaning stage (duplicate detection) and are kept in
+# Arrow buffers instead of one Python object per value.
+SCHEMA = {
+    "index": "int32",
+    "track_id": "string[pyarrow]",
+    "artists": "string[pyarrow]",
+    "album_name": "string[pyarrow]",
+    "track_name": "string[pyarrow]",
+    "popularity": "int8",
+    "duration_ms": "int32",
+    "explicit": "bool",
+    "danceability": "float32",
+    "energy": "float32",
+    "key": "int8",
+    "loudness": "float32",
+    "mode": "int8",
+    "speechiness": "float32",
+    "acousticness": "float32",
+    "instrumentalness": "float32",
+    "liveness": "float32",
+    "valence": "float32",
+    "tempo": "float32",
+    "time_signature": "int8",
+    "track_genre": "category",
+}
+# Raw files may have empty cells in any column: the integer and boolean columns
+# are parsed with these nullable types and compacted once the NA rows are dropped
+NULLABLE = {"int8": "Int8", "int32": "Int32", "bool": "boolean"}
+
+
+def check_columns(columns, expected=None):
+    """
+    Refuse columns that are not part of the dataset schema.
+
+    Args:
+        columns (list): Columns found in a file.
+        expected (list): Columns that must be present, None to skip the check.
+
+    Raises:
+        ValueError: If a column is not in ``SCHEMA`` or an expected one is missing.
+    """
+    unexpected = [col for col in columns if col not in SCHEMA]
+    if unexpected:
+        raise ValueError("Unexpected column(s) {}, expected a subset of {}".format(unexpected, list(SCHEMA)))
+    if expected is not None:
+        missing = [col for col in expected if col not in columns]
+        if missing:
+            raise ValueError("Missing column(s) {}".format(missing))
+
+
+def dtypes(columns, categories=True, nullable=False):
+    """
+    Dtype of each of the given columns.
+
+    Args:
+        columns (list): Columns of the schema.
+        categories (bool): Keep the ``category`` columns; when False they are read
+            as plain strings, so chunks can be appended to the same file without
+            reconciling the categories of every chunk.
+        nullable (bool): Use the nullable counterparts (``NULLABLE``) of the integer
+            and boolean dtypes, which accept missing values.
+
+    Returns:
+        dict: Column to dtype.
+    """
+    types = {col: SCHEMA[col] for col in columns}
+    if nullable:
+        types = {col: NULLABLE.get(dtype, dtype) for col, dtype in types.items()}
+    if not categories:
+        types = {col: object if dtype == "category" else dtype for col, dtype in types.items()}
+    return types
+
+
+def read_csv(path, columns=None, categories=True, **kwargs):
+    """
+    Read a raw CSV file of tracks with the dtypes of ``SCHEMA``.
+
+    The header is validated first and only ``columns`` are parsed. Integer and
+    boolean columns are parsed with nullable dtypes, so rows with empty cells
+    load and can be dropped by the cleaning; :func:`compact` converts them to
+    the compact dtypes afterwards.
+
+    Args:
+        path (str): CSV file.
+        columns (list): Columns to load, all of them when None.
+        categories (bool): See :func:`dtypes`.
+        **kwargs: Extra arguments of ``pandas.read_csv`` (e.g. ``chunksize``).
+
+    Returns:
+        pandas.DataFrame: Loaded table (or a chunk iterator when ``chunksize`` is given).
+    """
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    check_columns(header, expected=columns)
+    columns = header if columns is None else list(columns)
+    return pd.read_csv(path, usecols=columns, dtype=dtypes(columns, categories, nullable=True), **kwargs)
+
+
+def read_chunks(path, chunksize, columns=None):
+    """
+    Iterate over a table of tracks in any storage format with the nullable dtypes of :func:`read_csv`.
+
+    Category columns are read as plain strings (see :func:`dtypes`), so every
+    chunk has the same dtypes whatever values it holds.
+
+    Args:
+        path (str): File to read (format inferred from the extension).
+        chunksize (int): Maximum number of rows per chunk.
+        columns (list): Columns to load, all of them when None.
+
+    Yields:
+        pandas.DataFrame: Next chunk, to be passed to :func:`compact` once its missing values are dropped.
+    """
+    if format_of(path) == "csv":
+        yield from read_csv(path, columns=columns, categories=False, chunksize=chunksize)
+        return
+    if columns is not None:
+        check_columns(columns)
+    for chunk in read_in_chunks(path, chunksize, columns=columns):
+        check_columns(chunk.columns.tolist(), expected=columns)
+        yield chunk.astype(dtypes(chunk.columns, categories=False, nullable=True))
+
+
+def compact(df):
+    """
+    Convert the nullable columns read by :func:`read_csv` to the compact dtypes of ``SCHEMA``.
+
+    Args:
+        df (pandas.DataFrame): Tracks without missing values in those columns.
+
+    Returns:
+        pandas.DataFrame: Table with the compact dtypes.
+    """
+    nullable = set(NULLABLE.values())
+    types = {col: SCHEMA[col] for col in df.columns if col in SCHEMA and str(df[col].dtype) in nullable}
+    return df.astype(types) if types else df
+
+
+def load_table(path, columns=None):
+    """
+    Load a table of tracks in any storage format with the compact dtypes of ``SCHEMA``.
+
+    Args:
+        path (str): File to read (format inferred from the extension).
+        columns (list): Columns to load, all of them when None.
+
+    Returns:
+        pandas.DataFrame: Loaded table.
+    """
+    if format_of(path) == "csv":
+        return read_csv(path, columns=columns)
+    if columns is not None:
+        check_columns(columns)
+    df = read_table(path, columns=columns)
+    check_columns(df.columns.tolist(), expected=columns)
+    return cast(df)
+
+
+def cast(df):
+    """
+    Convert the columns of a DataFrame to the dtypes of ``SCHEMA``.
+
+    Args:
+        df (pandas.DataFrame): Tracks, with a subset of the schema columns.
+
+    Returns:
+        pandas.DataFrame: Table with the compact dtypes.
+    """
+    check_columns(df.columns.tolist())
+    return df.astype(dtypes(df.columns))
@@ -0,0 +1,170 @@
+import os
+import pickle
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+import yaml
+
+from storage import TableWriter, format_of, read_in_chunks
+from streaming import RowHashSet
+
+# Models fitted on DataFrames warn on every call when given a plain array
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# Model and preprocessor of each worker process, loaded once by _init_worker
+_worker = {}
+
+
+def load_model(model_path, preprocessor_path):
+    """
+    Load the trained model and the fitted preprocessor.
+
+    Args:
+        model_path (str): Pickled model written by ``train.py``.
+        preprocessor_path (str): Preprocessor written by ``prepare.py``.
+
+    Returns:
+        tuple: (model, preprocessor).
+    """
+    with open(model_path, "rb") as fd:
+        model = pickle.load(fd)
+    # Parallelism comes from the worker processes
+    if hasattr(model, "n_jobs"):
+        model.n_jobs = 1
+    return model, joblib.load(preprocessor_path)
+
+
+def _init_worker(model_path, preprocessor_path):
+    _worker["model"], _worker["preprocessor"] = load_model(model_path, preprocessor_path)
+
+
+def score_chunk(model, preprocessor, chunk):
+    """
+    Score a chunk of cleaned tracks.
+
+    Rows with a category unseen during training get a NaN score instead of
+    failing the whole chunk.
+
+    Args:
+        model: Trained model.
+        preprocessor (SongPreprocessor): Fitted preprocessor.
+        chunk (pandas.DataFrame): Raw features of the tracks.
+
+    Returns:
+        numpy.ndarray: Popularity score of every row.
+    """
+    scores = np.full(len(chunk), np.nan)
+    known = ~preprocessor.unknown_rows(chunk)
+    if known.any():
+        X = preprocessor.transform(chunk[known], dtype=np.float32)
+        if hasattr(model, "predict_proba"):
+            scores[known] = model.predict_proba(X)[:, -1]
+        else:
+            scores[known] = model.predict(X)
+    return scores
+
+
+def _score_in_worker(chunk):
+    return score_chunk(_worker["model"], _worker["preprocessor"], chunk)
+
+
+def clean_chunk(chunk, seen, feature_columns):
+    """
+    Apply the cleaning stage rules to a chunk of raw tracks.
+
+    Exact duplicates of rows already seen are dropped, as well as rows with
+    missing values in the columns needed to score them.
+
+    Args:
+        chunk (pandas.DataFrame): Raw tracks.
+        seen (RowHashSet): Hashes of the rows of previous chunks, or None to keep duplicates.
+        feature_columns (list): Input columns of the preprocessor.
+
+    Returns:
+        pandas.DataFrame: Cleaned chunk.
+    """
+    if seen is not None:
+        chunk = chunk[seen.add(pd.util.hash_pandas_object(chunk, index=False).to_numpy())]
+    return chunk.dropna(subset=feature_columns)
+
+
+def score_file(input_path, output_path, model_path, preprocessor_path, chunksize,
+               n_jobs, id_columns, remove_duplicates=True):
+    """
+    Stream a file of raw tracks through the model and write the scores incrementally.
+
+    Chunks are scored in a pool of ``n_jobs`` processes, each of which loads
+    the model once. At most two chunks per worker are in flight, so memory
+    stays bounded whatever the size of the input.
+
+    Args:
+        input_path (str): Raw tracks (CSV, Parquet or Arrow).
+        output_path (str): Output file; its extension selects the format.
+        model_path (str): Pickled model.
+        preprocessor_path (str): Fitted preprocessor.
+        chunksize (int): Rows per chunk.
+        n_jobs (int): Worker processes, -1 for one per core.
+        id_columns (list): Columns copied from the input to identify each score.
+        remove_duplicates (bool): Drop exact duplicate rows, as the cleaning stage does.
+
+    Returns:
+        int: Number of rows written.
+    """
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    preprocessor = joblib.load(preprocessor_path)
+    feature_columns = preprocessor.input_columns_
+    seen = RowHashSet() if remove_duplicates else None
+
+    output_stem = os.path.splitext(output_path)[0]
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    writer = TableWriter(output_stem, format_of(output_path))
+
+    def write(chunk, scores):
+        result = chunk[[col for col in id_columns if col in chunk.columns]].copy()
+        result["score"] = scores
+        writer.write(result)
+        sys.stderr.write("{:,} rows scored\n".format(writer.rows))
+
+    chunks = (clean_chunk(chunk, seen, feature_columns) for chunk in read_in_chunks(input_path, chunksize))
+    with writer, ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_init_worker, initargs=(model_path, preprocessor_path)
+    ) as pool:
+        pending = []
+        for chunk in chunks:
+            pending.append((chunk, pool.submit(_score_in_worker, chunk)))
+            if len(pending) >= 2 * n_jobs:
+                chunk, future = pending.pop(0)
+                write(chunk, future.result())
+        for chunk, future in pending:
+            write(chunk, future.result())
+
+    return writer.rows
+
+
+def main():
+    params = yaml.safe_load(open("params.yaml"))["score"]
+
+    if len(sys.argv) != 3:
+        sys.stderr.write("Arguments error. Usage:\n")
+        sys.stderr.write("\tpython score.py tracks scores\n")
+        sys.exit(1)
+
+    rows = score_file(
+        input_path=sys.argv[1],
+        output_path=sys.argv[2],
+        model_path=params["model_path"],
+        preprocessor_path=params["preprocessor_path"],
+        chunksize=params["chunksize"],
+        n_jobs=params["n_jobs"],
+        id_columns=params["id_columns"],
+        remove_duplicates=params["remove_duplicates"],
+    )
+    sys.stderr.write("Scores saved to {} ({:,} rows)\n".format(sys.argv[2], rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import yaml
+from scipy import sparse
+from sklearn.ensemble import AdaBoostClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import SGDRegressor
+from sklearn.model_selection import ParameterGrid, cross_val_score
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import LinearSVR
+from sklearn.tree import DecisionTreeClassifier
+
+from train import load_features
+
+# Search spaces of the hyperparameter search notebooks. Classifiers predict
+# popularity >= threshold and are ranked by F1, regressors predict the raw
+# popularity and are ranked by (negative) MSE. Families marked "sparse" are
+# trained on the CSR matrix as is when prepare wrote a one-hot block; the
+# others get the rows of each trial densified.
+SEARCH_SPACES = {
+    "xgboost": {
+        "task": "classification",
+        "scoring": "f1",
+        "sparse": True,
+        "grid": {
+            "learning_rate": [0.01, 0.1, 0.2, 0.3],
+            "max_depth": [3, 5, 7, 9],
+            "min_child_weight": [1, 3, 5],
+            "subsample": [0.6, 0.8, 1.0],
+            "colsample_bytree": [0.6, 0.8, 1.0],
+            "n_estimators": [100, 200, 300],
+        },
+    },
+    "adaboost": {
+        "task": "classification",
+        "scoring": "f1",
+        "sparse": True,
+        "grid": {
+            "n_estimators": [50, 100, 200, 300],
+            "learning_rate": [0.01, 0.1, 0.5, 1.0, 1.5],
+            "estimator__max_depth": [1, 2, 3, 4, 5],
+            "estimator__min_samples_split": [2, 5, 10],
+            "estimator__min_samples_leaf": [1, 2, 4],
+        },
+    },
+    "mlp": {
+        "task": "classification",
+        "scoring": "f1",
+        "grid": {
+            "mlp__hidden_layer_sizes": [(64,), (64, 32), (128, 64), (256, 128)],
+            "mlp__activation": ["relu", "tanh"],
+            "mlp__alpha": [1e-5, 1e-4, 1e-3],
+            "mlp__learning_rate_init": [1e-4, 1e-3, 3e-3],
+            "mlp__batch_size": [64, 128, 256],
+        },
+    },
+    "linearsvr": {
+        "task": "regression",
+        "scoring": "neg_mean_squared_error",
+        "sparse": True,
+        "grid": {
+            "C": [0.001, 0.01, 0.1, 1, 10, 100, 1000],
+            "epsilon": [0.01, 0.1, 0.2, 0.5, 1.0],
+            "loss": ["epsilon_insensitive", "squared_epsilon_insensitive"],
+            "max_iter": [1000, 5000, 10000],
+        },
+    },
+    "sgdregressor": {
+        "task": "regression",
+        "scoring": "neg_mean_squared_error",
+        "grid": {
+            "sgd__loss": ["squared_error", "huber", "epsilon_insensitive", "squared_epsilon_insensitive"],
+            "sgd__penalty": ["l2", "l1", "elasticnet"],
+            "sgd__alpha": [0.0001, 0.001, 0.01, 0.1, 1.0],
+            "sgd__l1_ratio": [0.15, 0.5, 0.7, 0.9],
+            "sgd__learning_rate": ["constant", "optimal", "invscaling", "adaptive"],
+            "sgd__eta0": [0.001, 0.01, 0.1, 1.0],
+            "sgd__max_iter": [1000, 5000, 10000],
+        },
+    },
+}
+
+# Training matrix of each worker process, memory-mapped by _init_worker
+_worker = {}
+# Arrays of a CSR matrix, saved and mapped one .npy file each
+CSR_ARRAYS = ("data", "indices", "indptr")
+
+
+def make_estimator(family, params, seed):
+    """
+    Build the estimator of a model family with the given hyperparameters.
+
+    Args:
+        family (str): Key of ``SEARCH_SPACES``.
+        params (dict): Hyperparameters of the configuration.
+        seed (int): Random seed.
+
+    Returns:
+        sklearn.base.BaseEstimator: Unfitted estimator (single-threaded).
+    """
+    if family == "xgboost":
+        import xgboost as xgb
+
+        return xgb.XGBClassifier(random_state=seed, n_jobs=1, **params)
+    if family == "adaboost":
+        estimator = AdaBoostClassifier(estimator=DecisionTreeClassifier(random_state=seed), random_state=seed)
+    elif family == "mlp":
+        estimator = Pipeline([
+            ("imputer", SimpleImputer(strategy="median")),
+            ("scaler", StandardScaler()),
+            ("mlp", MLPClassifier(random_state=seed, early_stopping=True, n_iter_no_change=10,
+                                  validation_fraction=0.1, max_iter=200)),
+        ])
+    elif family == "linearsvr":
+        estimator = LinearSVR(random_state=seed)
+    elif family == "sgdregressor":
+        estimator = Pipeline([("scaler", StandardScaler()), ("sgd", SGDRegressor(random_state=seed, tol=1e-3))])
+    else:
+        raise ValueError("Unknown model family {!r}".format(family))
+    return estimator.set_params(**params)
+
+
+def sample_candidates(grid, max_candidates, rng):
+    """
+    Configurations of a search space, a random sample of them when the grid is larger than the cap.
+
+    The sample is drawn by index, without building the whole grid.
+
+    Args:
+        grid (dict): Values of every hyperparameter.
+        max_candidates (int): Largest number of configurations, the whole grid when None or 0.
+        rng (numpy.random.Generator): Generator of the sample.
+
+    Returns:
+        list: Configurations, in the order of the grid.
+    """
+    grid = ParameterGrid(grid)
+    if not max_candidates or len(grid) <= max_candidates:
+        return list(grid)
+    keep = rng.choice(len(grid), size=max_candidates, replace=False)
+    return [grid[int(i)] for i in np.sort(keep)]
+
+
+def _share_matrix(X, directory):
+    # Dense matrices are one .npy file, CSR matrices their three arrays
+    if isinstance(X, np.ndarray):
+        path = os.path.join(directory, "X.npy")
+        np.save(path, X)
+        return {"path": path}
+    shared = {"shape": X.shape}
+    for name in CSR_ARRAYS:
+        shared[name] = os.path.join(directory, "X_{}.npy".format(name))
+        np.save(shared[name], getattr(X, name))
+    return shared
+
+
+def _load_matrix(shared):
+    if "path" in shared:
+        return np.load(shared["path"], mmap_mode="r")
+    arrays = tuple(np.load(shared[name], mmap_mode="r") for name in CSR_ARRAYS)
+    return sparse.csr_matrix(arrays, shape=shared["shape"], copy=False)
+
+
+def _init_worker(x_shared, y_path, order_path):
+    # Every worker maps the same files: the pages are shared, not copied
+    _worker["X"] = _load_matrix(x_shared)
+    _worker["y"] = np.load(y_path, mmap_mode="r")
+    _worker["order"] = np.load(order_path, mmap_mode="r")
+
+
+def evaluate(family, params, n_samples, threshold, cv, seed):
+    """
+    Cross-validate one configuration on the first ``n_samples`` rows of the shuffled training set.
+
+    Args:
+        family (str): Key of ``SEARCH_SPACES``.
+        params (dict): Hyperparameters of the configuration.
+        n_samples (int): Rows used (the resource of successive halving).
+        threshold (int): Popularity from which a track is considered popular.
+        cv (int): Number of cross-validation folds.
+        seed (int): Random seed.
+
+    Returns:
+        dict: Trial record (score, standard deviation, time and error if any).
+    """
+    space = SEARCH_SPACES[family]
+    rows = np.sort(_worker["order"][:n_samples])
+    X = _worker["X"][rows]
+    if sparse.issparse(X) and not space.get("sparse"):
+        X = X.toarray()
+    y = _worker["y"][rows]
+    if space["task"] == "classification":
+        y = (y >= threshold).astype(int)
+
+    start = time.perf_counter()
+    trial = {"family": family, "n_samples": n_samples, "params": json.dumps(params, default=str)}
+    try:
+        scores = cross_val_score(make_estimator(family, params, seed), X, y, cv=cv, scoring=space["scoring"])
+        trial.update(score=float(np.mean(scores)), score_std=float(np.std(scores)), error="")
+    except Exception as e:
+        trial.update(score=-np.inf, score_std=np.nan, error=str(e).splitlines()[0] if str(e) else type(e).__name__)
+    trial["fit_time"] = time.perf_counter() - start
+    return trial
+
+
+def successive_halving(pool, family, candidates, n_total, min_samples, factor, threshold, cv, seed):
+    """
+    Search a model family with successive halving.
+
+    Every rung evaluates the surviving configurations in parallel, keeps the
+    best ``1/factor`` of them and multiplies the rows by ``factor``, so bad
+    configurations are discarded after training on small samples only.
+
+    Args:
+        pool (concurrent.futures.Executor): Worker pool.
+        family (str): Key of ``SEARCH_SPACES``.
+        candidates (list): Configurations to try.
+        n_total (int): Rows of the training set.
+        min_samples (int): Rows used in the first rung.
+        factor (int): Reduction factor between rungs.
+        threshold (int): Popularity threshold of the classifiers.
+        cv (int): Number of cross-validation folds.
+        seed (int): Random seed.
+
+    Returns:
+        list: Records of every trial, with the rung they belong to.
+    """
+    trials = []
+    n_samples = min(min_samples, n_total)
+    rung = 0
+    while True:
+        sys.stderr.write("{} rung {}: {} configurations on {:,} rows\n".format(family, rung, len(candidates), n_samples))
+        futures = [pool.submit(evaluate, family, params, n_samples, threshold, cv, seed) for params in candidates]
+        results = [future.result() for future in futures]
+        for result in results:
+            result["rung"] = rung
+        trials.extend(results)
+
+        if len(candidates) <= 1 or n_samples >= n_total:
+            return trials
+
+        ranking = np.argsort([-result["score"] for result in results], kind="stable")
+        candidates = [candidates[i] for i in ranking[:math.ceil(len(candidates) / factor)]]
+        n_samples = min(n_samples * factor, n_total)
+        rung += 1
+
+
+def main():
+    params = yaml.safe_load(open("params.yaml"))
+    storage_format = params["data"]["format"]
+    config = params["search"]
+
+    if len(sys.argv) != 3:
+        sys.stderr.write("Arguments error. Usage:\n")
+        sys.stderr.write("\tpython search.py features output\n")
+        sys.exit(1)
+
+    input = sys.argv[1]
+    output = sys.argv[2]
+    seed = config["seed"]
+    n_jobs = os.cpu_count() if config["n_jobs"] == -1 else config["n_jobs"]
+    rng = np.random.default_rng(seed)
+
+    X, y = load_features(input, storage_format)
+
+    os.makedirs(output, exist_ok=True)
+    trials = []
+    with tempfile.TemporaryDirectory() as shared:
+        # Training matrix shared read-only by all the workers
+        x_shared = _share_matrix(X, shared)
+        y_path = os.path.join(shared, "y.npy")
+        order_path = os.path.join(shared, "order.npy")
+        np.save(y_path, y)
+        np.save(order_path, rng.permutation(X.shape[0]))
+        n_total = X.shape[0]
+        del X, y
+
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(x_shared, y_path, order_path)) as pool:
+            for family in config["families"]:
+                candidates = sample_candidates(SEARCH_SPACES[family]["grid"], config["max_candidates"], rng)
+                trials += successive_halving(
+                    pool, family, candidates, n_total,
+                    min_samples=config["min_samples"],
+                    factor=config["factor"],
+                    threshold=config["threshold"],
+                    cv=config["cv"],
+                    seed=seed,
+                )
+
+    trials = pd.DataFrame(trials)
+    trials.to_csv(os.path.join(output, "trials.csv"), index=False)
+
+    best = {}
+    for family, family_trials in trials.groupby("family", sort=False):
+        last_rung = family_trials[family_trials["rung"] == family_trials["rung"].max()]
+        top = last_rung.loc[last_rung["score"].idxmax()]
+        best[family] = {
+            "params": json.loads(top["params"]),
+            "scoring": SEARCH_SPACES[family]["scoring"],
+            "score": float(top["score"]),
+            "n_samples": int(top["n_samples"]),
+            "trials": len(family_trials),
+        }
+    with open(os.path.join(output, "best_params.yaml"), "w") as f:
+        yaml.dump(best, f, default_flow_style=False)
+
+    sys.stderr.write("{} trials saved to {}\n".format(len(trials), output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from schema import cast
+from storage import SparseWriter, TableWriter, read_in_chunks
+
+# Resolution of the split: the test fraction is rounded to 1/SPLIT_BUCKETS
+SPLIT_BUCKETS = 1_000_000
+
+
+def _hash_key(seed):
+    # pandas hashes with a 16 character key; derive it from the seed
+    return "{:016d}".format(seed % 10 ** 16)
+
+
+def split_buckets(keys, seed):
+    """
+    Map every row to one of ``SPLIT_BUCKETS`` buckets from the hash of its key.
+
+    Args:
+        keys (pandas.DataFrame | pandas.Series): Values identifying every row.
+        seed (int): Seed of the split (changes the assignment).
+
+    Returns:
+        numpy.ndarray: Bucket of every row, uniformly distributed.
+    """
+    hashes = pd.util.hash_pandas_object(keys, index=False, hash_key=_hash_key(seed)).to_numpy()
+    return (hashes % SPLIT_BUCKETS).astype(np.int64)
+
+
+def hash_split(keys, seed, test_size):
+    """
+    Assign rows to the test set from the hash of their values.
+
+    The decision only depends on the row itself and the seed, so a row always
+    lands in the same partition whatever the other rows of the dataset are.
+
+    Args:
+        keys (pandas.DataFrame | pandas.Series): Values identifying every row.
+        seed (int): Seed of the split (changes the assignment).
+        test_size (float): Fraction of the rows sent to the test set.
+
+    Returns:
+        numpy.ndarray: Boolean mask, True for the test rows.
+    """
+    return split_buckets(keys, seed) < round(test_size * SPLIT_BUCKETS)
+
+
+def popularity_strata(popularity, n_bins):
+    """
+    Bin the popularity (0-100) into ``n_bins`` equal-width strata.
+
+    Args:
+        popularity (array-like): Popularity of every row.
+        n_bins (int): Number of strata.
+
+    Returns:
+        numpy.ndarray: Stratum of every row, from 0 to ``n_bins - 1``.
+    """
+    popularity = np.clip(np.asarray(popularity, dtype=np.int64), 0, 100)
+    return popularity * n_bins // 101
+
+
+def strata_thresholds(buckets, strata, n_bins, test_size):
+    """
+    Bucket threshold of every stratum that sends ``test_size`` of its rows to test.
+
+    Args:
+        buckets (numpy.ndarray): Bucket of every row (:func:`split_buckets`).
+        strata (numpy.ndarray): Stratum of every row.
+        n_bins (int): Number of strata.
+        test_size (float): Fraction of the rows of every stratum sent to the test set.
+
+    Returns:
+        list: Threshold of every stratum; rows with a lower bucket go to test.
+    """
+    default = round(test_size * SPLIT_BUCKETS)
+    thresholds = []
+    for stratum in range(n_bins):
+        values = np.sort(buckets[strata == stratum])
+        n_test = round(test_size * len(values))
+        thresholds.append(int(values[n_test]) if n_test < len(values) and len(values) else default)
+    return thresholds
+
+
+def stratified_hash_split(keys, popularity, seed, thresholds):
+    """
+    Assign rows to the test set with the per-stratum thresholds of :func:`strata_thresholds`.
+
+    Args:
+        keys (pandas.DataFrame | pandas.Series): Values identifying every row.
+        popularity (array-like): Popularity of every row.
+        seed (int): Seed of the split.
+        thresholds (list): Bucket threshold of every popularity stratum.
+
+    Returns:
+        numpy.ndarray: Boolean mask, True for the test rows.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.int64)
+    strata = popularity_strata(popularity, len(thresholds))
+    return split_buckets(keys, seed) < thresholds[strata]
+
+
+def split_in_chunks(input_path, preprocessor, output_path_train, output_path_test, fmt,
+                    seed, test_size, chunksize, key_columns=None, stratify_bins=None):
+    """
+    Encode the cleaned dataset and write the train and test partitions in a single streaming pass.
+
+    Every row goes to train or test from the hash of its key and the seed (see
+    :func:`hash_split`), so no row has to be held in memory beyond its chunk
+    and the assignment of a row never changes when other rows are added. With
+    ``stratify_bins`` the test fraction is matched inside each popularity
+    stratum; this needs a first pass over the key and target columns only.
+    The one-hot block of a preprocessor with sparse columns is written as CSR
+    (one entry per row and column), chunk by chunk, to ``X_*_onehot.npz``.
+
+    Args:
+        input_path (str): Cleaned dataset.
+        preprocessor (SongPreprocessor): Fitted preprocessor.
+        output_path_train (str): Directory of the training partition.
+        output_path_test (str): Directory of the test partition.
+        fmt (str): Storage format of the partitions.
+        seed (int): Seed of the split.
+        test_size (float): Fraction of the rows sent to the test set.
+        chunksize (int): Rows per chunk.
+        key_columns (list): Columns hashed to place each row, e.g. ``["track_id"]``; the
+            whole row but the target when None.
+        stratify_bins (int): Number of popularity strata, None for a plain hash split.
+
+    Returns:
+        dict: Rows written to each partition and thresholds of the strata (None if not stratified).
+    """
+    target = preprocessor.target_column
+
+    def keys_of(chunk):
+        # Never the target: a row must not change partition when its label does
+        return chunk.drop(columns=[target]) if key_columns is None else chunk[key_columns]
+
+    thresholds = None
+    if stratify_bins:
+        columns = None if key_columns is None else list(dict.fromkeys(key_columns + [target]))
+        buckets, strata = [], []
+        for chunk in read_in_chunks(input_path, chunksize, columns=columns):
+            chunk = cast(chunk)
+            buckets.append(split_buckets(keys_of(chunk), seed))
+            strata.append(popularity_strata(chunk[target], stratify_bins))
+        thresholds = strata_thresholds(np.concatenate(buckets), np.concatenate(strata), stratify_bins, test_size)
+
+    os.makedirs(output_path_train, exist_ok=True)
+    os.makedirs(output_path_test, exist_ok=True)
+    writers = {
+        "X_train": TableWriter(os.path.join(output_path_train, "X_train"), fmt),
+        "y_train": TableWriter(os.path.join(output_path_train, "y_train"), fmt),
+        "X_test": TableWriter(os.path.join(output_path_test, "X_test"), fmt),
+        "y_test": TableWriter(os.path.join(output_path_test, "y_test"), fmt),
+    }
+    if preprocessor.sparse_columns_:
+        n_sparse = len(preprocessor.sparse_feature_names_)
+        writers["X_train_onehot"] = SparseWriter(os.path.join(output_path_train, "X_train_onehot"), n_sparse)
+        writers["X_test_onehot"] = SparseWriter(os.path.join(output_path_test, "X_test_onehot"), n_sparse)
+    for chunk in read_in_chunks(input_path, chunksize):
+        chunk = cast(chunk)
+        if thresholds is None:
+            test = hash_split(keys_of(chunk), seed, test_size)
+        else:
+            test = stratified_hash_split(keys_of(chunk), chunk[target], seed, thresholds)
+
+        X = preprocessor.transform_frame(chunk)
+        y = chunk[[target]]
+        writers["X_train"].write(X[~test])
+        writers["y_train"].write(y[~test])
+        writers["X_test"].write(X[test])
+        writers["y_test"].write(y[test])
+        if preprocessor.sparse_columns_:
+            X_sparse = preprocessor.transform_sparse(chunk, block="sparse")
+            writers["X_train_onehot"].write(X_sparse[~test])
+            writers["X_test_onehot"].write(X_sparse[test])
+
+    for writer in writers.values():
+        writer.close()
+    return {"train_rows": writers["X_train"].rows, "test_rows": writers["X_test"].rows,
+            "thresholds": thresholds}
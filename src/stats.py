@@ -0,0 +1,273 @@
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler, RobustScaler, StandardScaler
+
+SCALERS = {
+    "RobustScaler": RobustScaler,
+    "StandardScaler": StandardScaler,
+    "MinMaxScaler": MinMaxScaler,
+}
+# Quantiles kept for every column: IQR fences and RobustScaler center
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+def _summary(count, minimum, maximum, mean, var, q1, median, q3, outlier_pct):
+    range_ratio = maximum / minimum if minimum > 0 else float("inf")
+    return {
+        "count": int(count),
+        "min": float(minimum),
+        "max": float(maximum),
+        "mean": float(mean),
+        "var": float(var),
+        "q1": float(q1),
+        "median": float(median),
+        "q3": float(q3),
+        "outlier_pct": float(outlier_pct),
+        "range_ratio": float(range_ratio),
+    }
+
+
+def _quartiles(X):
+    # Quartiles of every column from a single partition, with the linear
+    # interpolation of np.quantile (same values, bit for bit)
+    n = X.shape[0]
+    position = np.asarray(QUANTILES) * (n - 1)
+    below = np.floor(position).astype(np.intp)
+    above = np.minimum(below + 1, n - 1)
+    partitioned = np.partition(X, np.unique(np.r_[below, above]), axis=0)
+    a, b = partitioned[below], partitioned[above]
+    t = (position - below)[:, None]
+    return np.where(t >= 0.5, b - (b - a) * (1 - t), a + (b - a) * t)
+
+
+def column_stats(values, columns):
+    """
+    Statistics of every column of a matrix, computed together along the rows.
+
+    Each quantity is a single NumPy reduction over all the columns at once
+    (one partition for the three quartiles, one comparison against the IQR
+    fences of every column...), instead of one scan per statistic and column.
+
+    Args:
+        values (numpy.ndarray | pandas.DataFrame): Data, shape (n_samples, n_columns).
+        columns (list): Name of every column.
+
+    Returns:
+        dict: Statistics of every column (count, min, max, mean, var, quartiles,
+        percentage of IQR outliers and max/min ratio), by name.
+    """
+    # Column-major, so every reduction along the rows reads contiguous memory
+    X = np.asfortranarray(values, dtype=np.float64)
+    n = X.shape[0]
+    q1, median, q3 = _quartiles(X)
+    iqr = q3 - q1
+    outlier_pct = np.count_nonzero((X < q1 - 1.5 * iqr) | (X > q3 + 1.5 * iqr), axis=0) / n * 100
+
+    # Mean and corrected two-pass variance, as StandardScaler computes them
+    mean = X.sum(axis=0) / n
+    deviation = X - mean
+    correction = deviation.sum(axis=0)
+    var = (np.square(deviation, out=deviation).sum(axis=0) - correction ** 2 / n) / n
+
+    minimum, maximum = X.min(axis=0), X.max(axis=0)
+    return {
+        col: _summary(n, minimum[i], maximum[i], mean[i], var[i], q1[i], median[i], q3[i], outlier_pct[i])
+        for i, col in enumerate(columns)
+    }
+
+
+def _merge_digest(means, weights, values, compression):
+    # Merging t-digest: sort the centroids and the new points and merge the
+    # neighbours that fall in the same unit of the k1 scale function, which
+    # keeps the centroids small near the tails and large around the median
+    means = np.concatenate([means, values])
+    weights = np.concatenate([weights, np.ones(len(values))])
+    order = np.argsort(means, kind="stable")
+    means, weights = means[order], weights[order]
+
+    q_left = (np.cumsum(weights) - weights) / weights.sum()
+    k = compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+    group = np.floor(k - k[0]).astype(np.intp)
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    merged_weights = np.add.reduceat(weights, starts)
+    return np.add.reduceat(means * weights, starts) / merged_weights, merged_weights
+
+
+class StreamingStats:
+    """
+    Column statistics accumulated chunk by chunk, for data that does not fit in memory.
+
+    Count, min, max, mean and variance are exact (chunks are combined with
+    Chan's parallel update); the quartiles come from a t-digest per column, so
+    the quartiles and the percentage of IQR outliers (read from the digest at
+    the fences) are approximate, with an error that shrinks as
+    ``compression`` grows. :meth:`result` returns the same statistics as
+    :func:`column_stats`.
+    """
+
+    def __init__(self, columns, compression=1000):
+        self.columns = list(columns)
+        self.compression = compression
+        k = len(self.columns)
+        self.count = 0
+        self.minimum = np.full(k, np.inf)
+        self.maximum = np.full(k, -np.inf)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.digests = [(np.empty(0), np.empty(0)) for _ in range(k)]
+
+    def update(self, values):
+        """
+        Add a chunk of rows.
+
+        Args:
+            values (numpy.ndarray | pandas.DataFrame): Chunk, shape (n_rows, n_columns).
+
+        Returns:
+            StreamingStats: The updated statistics.
+        """
+        X = np.asarray(values, dtype=np.float64)
+        n = X.shape[0]
+        if n == 0:
+            return self
+        np.minimum(self.minimum, X.min(axis=0), out=self.minimum)
+        np.maximum(self.maximum, X.max(axis=0), out=self.maximum)
+
+        chunk_mean = X.mean(axis=0)
+        chunk_m2 = np.square(X - chunk_mean).sum(axis=0)
+        total = self.count + n
+        delta = chunk_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+        self.digests = [_merge_digest(means, weights, X[:, i], self.compression)
+                        for i, (means, weights) in enumerate(self.digests)]
+        return self
+
+    def _positions(self, i):
+        # Cumulative weight at the middle of every centroid, with the exact extremes at both ends
+        means, weights = self.digests[i]
+        middle = np.cumsum(weights) - weights / 2
+        return (np.r_[0.0, middle, self.count], np.r_[self.minimum[i], means, self.maximum[i]])
+
+    def quantile(self, q):
+        """
+        Approximate quantiles of every column.
+
+        Args:
+            q (float | list): Quantile(s) in [0, 1].
+
+        Returns:
+            numpy.ndarray: Quantiles, shape (len(q), n_columns).
+        """
+        q = np.atleast_1d(q)
+        out = np.empty((len(q), len(self.columns)))
+        for i in range(len(self.columns)):
+            positions, means = self._positions(i)
+            out[:, i] = np.interp(q * self.count, positions, means)
+        return out
+
+    def cdf(self, x):
+        """
+        Approximate fraction of the values of every column below ``x``.
+
+        Args:
+            x (numpy.ndarray): One value per column.
+
+        Returns:
+            numpy.ndarray: Fraction of every column.
+        """
+        out = np.empty(len(self.columns))
+        for i in range(len(self.columns)):
+            positions, means = self._positions(i)
+            out[i] = np.interp(x[i], means, positions) / self.count
+        return out
+
+    def result(self):
+        """
+        Statistics of every column, in the format of :func:`column_stats`.
+
+        Returns:
+            dict: Statistics of every column, by name.
+        """
+        if self.count == 0:
+            raise ValueError("No rows were added")
+        q1, median, q3 = self.quantile(QUANTILES)
+        iqr = q3 - q1
+        low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+        # Nothing is below the minimum or above the maximum (exact for columns with a single value)
+        below = np.where(low <= self.minimum, 0.0, self.cdf(low))
+        above = np.where(high >= self.maximum, 0.0, 1 - self.cdf(high))
+        outlier_pct = (below + above) * 100
+        var = self.m2 / self.count
+        return {
+            col: _summary(self.count, self.minimum[i], self.maximum[i], self.mean[i], var[i], q1[i], median[i],
+                          q3[i], outlier_pct[i])
+            for i, col in enumerate(self.columns)
+        }
+
+
+def choose_method(stats):
+    """
+    Pick the normalization method of a numeric column from its statistics.
+
+    RobustScaler when more than 5% of the values are IQR outliers,
+    StandardScaler when max/min is above 100 and MinMaxScaler otherwise.
+
+    Args:
+        stats (dict): Statistics of the column (:func:`column_stats`).
+
+    Returns:
+        dict: Chosen method, outlier percentage and range ratio.
+    """
+    if stats["outlier_pct"] > 5:
+        method = "RobustScaler"
+    elif stats["range_ratio"] > 100:
+        method = "StandardScaler"
+    else:
+        method = "MinMaxScaler"
+    return {"method": method, "outlier_pct": stats["outlier_pct"], "range_ratio": stats["range_ratio"]}
+
+
+def _nonzero(scale):
+    # Near-zero scales are replaced by 1, as scikit-learn does for constant features
+    return 1.0 if scale < 10 * np.finfo(np.float64).eps else scale
+
+
+def fit_scaler(method, stats):
+    """
+    Build a fitted scikit-learn scaler from the statistics of a column, without the data.
+
+    The scaler has the fitted attributes ``fit`` would set on the same column,
+    so it transforms (and inverse-transforms) like a scaler fitted on it.
+
+    Args:
+        method (str): Key of ``SCALERS``.
+        stats (dict): Statistics of the column (:func:`column_stats`).
+
+    Returns:
+        sklearn.base.TransformerMixin: Fitted scaler of one feature.
+    """
+    scaler = SCALERS[method]()
+    scaler.n_features_in_ = 1
+    if method == "MinMaxScaler":
+        low, high = scaler.feature_range
+        scaler.data_min_ = np.array([stats["min"]])
+        scaler.data_max_ = np.array([stats["max"]])
+        scaler.data_range_ = scaler.data_max_ - scaler.data_min_
+        scaler.scale_ = (high - low) / np.array([_nonzero(scaler.data_range_[0])])
+        scaler.min_ = low - scaler.data_min_ * scaler.scale_
+        scaler.n_samples_seen_ = stats["count"]
+    elif method == "StandardScaler":
+        scaler.mean_ = np.array([stats["mean"]])
+        scaler.var_ = np.array([stats["var"]])
+        # Constant feature test of StandardScaler (error bound of the two-pass variance)
+        eps = np.finfo(np.float64).eps
+        n = stats["count"]
+        constant = stats["var"] <= n * eps * stats["var"] + (n * stats["mean"] * eps) ** 2
+        scaler.scale_ = np.array([1.0 if constant else np.sqrt(stats["var"])])
+        scaler.n_samples_seen_ = n
+    else:
+        scaler.center_ = np.array([stats["median"]])
+        scaler.scale_ = np.array([_nonzero(stats["q3"] - stats["q1"])])
+    return scaler
@@ -0,0 +1,370 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ("csv", "parquet", "arrow")
+
+
+def table_path(stem, fmt):
+    """
+    Build the path of a table for the given storage format.
+
+    Args:
+        stem (str): Path of the table without extension (e.g. ``data/train/X_train``).
+        fmt (str): One of ``csv``, ``parquet`` or ``arrow`` (Arrow IPC file).
+
+    Returns:
+        str: Path with the extension of the format.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown storage format {!r}, expected one of {}".format(fmt, FORMATS))
+    return "{}.{}".format(stem, fmt)
+
+
+def format_of(path):
+    """
+    Infer the storage format of a file from its extension.
+
+    Args:
+        path (str): File path.
+
+    Returns:
+        str: Storage format.
+    """
+    fmt = os.path.splitext(path)[1].lstrip(".")
+    if fmt not in FORMATS:
+        raise ValueError("Cannot infer the storage format of {!r}".format(path))
+    return fmt
+
+
+def _to_arrow(df, schema=None):
+    import pyarrow as pa
+
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def write_table(df, stem, fmt):
+    """
+    Save a DataFrame (or Series) in the given storage format.
+
+    Parquet and Arrow keep the pandas dtypes, including the boolean dummy
+    columns and categoricals. Arrow IPC files are written uncompressed so
+    readers can memory-map them without copying.
+
+    Args:
+        df (pandas.DataFrame | pandas.Series): Data to save.
+        stem (str): Output path without extension.
+        fmt (str): Storage format.
+
+    Returns:
+        str: Path of the written file.
+    """
+    path = table_path(stem, fmt)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return path
+
+    _write_arrow(_to_arrow(df), path, fmt)
+    return path
+
+
+def _write_arrow(table, path, fmt):
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, path)
+    else:
+        import pyarrow as pa
+
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def append_table(df, stem, fmt):
+    """
+    Append rows to a table saved with :func:`write_table`, creating it if needed.
+
+    CSV files are appended in place. Parquet and Arrow files cannot be, so the
+    stored table is concatenated with the new rows at the Arrow level (no
+    pandas conversion, decoding or re-encoding of the existing rows) and written
+    to a temporary file that replaces the original.
+
+    Args:
+        df (pandas.DataFrame | pandas.Series): Rows to append, with the columns of the stored table.
+        stem (str): Path of the table without extension.
+        fmt (str): Storage format.
+
+    Returns:
+        str: Path of the table.
+    """
+    path = table_path(stem, fmt)
+    if not os.path.exists(path):
+        return write_table(df, stem, fmt)
+    if fmt == "csv":
+        df.to_csv(path, mode="a", header=False, index=False)
+        return path
+
+    import pyarrow as pa
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        stored = pq.read_table(path)
+    else:
+        with pa.memory_map(path) as source:
+            stored = pa.ipc.open_file(source).read_all()
+
+    # Categorical columns get one dictionary for the whole table, as Arrow files require
+    table = pa.concat_tables([stored, _to_arrow(df).cast(stored.schema)]).unify_dictionaries()
+    _write_arrow(table, path + ".tmp", fmt)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def read_table(path, columns=None, memory_map=True):
+    """
+    Load a table saved with :func:`write_table`.
+
+    The format is inferred from the extension. Parquet and Arrow files are
+    memory-mapped and only the requested columns are materialized.
+
+    Args:
+        path (str): File to read.
+        columns (list): Columns to load, all of them when None.
+        memory_map (bool): Memory-map Parquet/Arrow files instead of reading them.
+
+    Returns:
+        pandas.DataFrame: Loaded table.
+    """
+    fmt = format_of(path)
+    if fmt == "csv":
+        return pd.read_csv(path, usecols=columns)
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+
+    import pyarrow as pa
+
+    source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+    with source:
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return table.to_pandas()
+
+
+def read_in_chunks(path, chunksize, columns=None):
+    """
+    Iterate over a table in chunks of at most ``chunksize`` rows.
+
+    Args:
+        path (str): File to read (format inferred from the extension).
+        chunksize (int): Maximum number of rows per chunk.
+        columns (list): Columns to load, all of them when None.
+
+    Yields:
+        pandas.DataFrame: Next chunk of the table.
+    """
+    fmt = format_of(path)
+    if fmt == "csv":
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+        return
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    import pyarrow as pa
+
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+
+
+def write_sparse(matrix, stem):
+    """
+    Save a sparse matrix as a compressed ``.npz`` file.
+
+    Args:
+        matrix (scipy.sparse.spmatrix): Matrix to save (stored as CSR).
+        stem (str): Output path without extension.
+
+    Returns:
+        str: Path of the written file.
+    """
+    from scipy import sparse
+
+    path = "{}.npz".format(stem)
+    sparse.save_npz(path, sparse.csr_matrix(matrix))
+    return path
+
+
+def read_sparse(path):
+    """
+    Load a sparse matrix saved with :func:`write_sparse`.
+
+    Args:
+        path (str): ``.npz`` file.
+
+    Returns:
+        scipy.sparse.csr_matrix: Loaded matrix.
+    """
+    from scipy import sparse
+
+    return sparse.load_npz(path).tocsr()
+
+
+def append_sparse(matrix, stem):
+    """
+    Append rows to a sparse matrix saved with :func:`write_sparse`, creating it if needed.
+
+    Args:
+        matrix (scipy.sparse.spmatrix): Rows to append.
+        stem (str): Path of the matrix without extension.
+
+    Returns:
+        str: Path of the matrix.
+    """
+    from scipy import sparse
+
+    path = "{}.npz".format(stem)
+    if os.path.exists(path):
+        matrix = sparse.vstack([read_sparse(path), matrix], format="csr")
+    return write_sparse(matrix, stem)
+
+
+class SparseWriter:
+    """
+    Incremental writer of a CSR matrix saved chunk by chunk, read back with :func:`read_sparse`.
+
+    The ``data``, ``indices`` and ``indptr`` arrays of every chunk are appended
+    to temporary files next to the output, so memory is bounded by the chunk;
+    :meth:`close` packs them into the ``.npz`` layout of ``scipy.sparse.save_npz``.
+    """
+
+    ARRAYS = ("data", "indices", "indptr")
+
+    def __init__(self, stem, n_columns):
+        self.path = "{}.npz".format(stem)
+        self.n_columns = n_columns
+        self.rows = 0
+        self.nnz = 0
+        self._dtypes = {"data": None, "indices": np.dtype(np.int32), "indptr": np.dtype(np.int64)}
+        self._parts = {name: open("{}.{}.tmp".format(self.path, name), "w+b") for name in self.ARRAYS}
+        np.zeros(1, dtype=np.int64).tofile(self._parts["indptr"])
+
+    def write(self, matrix):
+        """
+        Append the rows of a sparse matrix.
+
+        Args:
+            matrix (scipy.sparse.spmatrix): Rows to append, with ``n_columns`` columns.
+        """
+        from scipy import sparse
+
+        matrix = sparse.csr_matrix(matrix)
+        if matrix.shape[1] != self.n_columns:
+            raise ValueError("Expected {} columns, got {}".format(self.n_columns, matrix.shape[1]))
+        if self._dtypes["data"] is None:
+            self._dtypes["data"] = matrix.data.dtype
+        matrix.data.astype(self._dtypes["data"], copy=False).tofile(self._parts["data"])
+        matrix.indices.astype(np.int32, copy=False).tofile(self._parts["indices"])
+        (matrix.indptr[1:].astype(np.int64) + self.nnz).tofile(self._parts["indptr"])
+        self.rows += matrix.shape[0]
+        self.nnz += matrix.nnz
+
+    def close(self):
+        import zipfile
+
+        lengths = {"data": self.nnz, "indices": self.nnz, "indptr": self.rows + 1}
+        dtypes = dict(self._dtypes, data=self._dtypes["data"] or np.dtype(np.float64))
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as npz:
+            for name in self.ARRAYS:
+                part = self._parts[name]
+                part.flush()
+                part.seek(0)
+                with npz.open("{}.npy".format(name), "w", force_zip64=True) as out:
+                    np.lib.format.write_array_header_1_0(
+                        out, {"descr": dtypes[name].str, "fortran_order": False, "shape": (lengths[name],)})
+                    shutil.copyfileobj(part, out, 1 << 20)
+            for name, value in [("format", np.array(b"csr")), ("shape", np.array([self.rows, self.n_columns]))]:
+                with npz.open("{}.npy".format(name), "w") as out:
+                    np.lib.format.write_array(out, value)
+        for part in self._parts.values():
+            part.close()
+            os.remove(part.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TableWriter:
+    """
+    Incremental writer used to save a table chunk by chunk.
+
+    The schema of the first chunk is used for the rest of the file, so every
+    chunk must have the same columns.
+    """
+
+    def __init__(self, stem, fmt):
+        self.path = table_path(stem, fmt)
+        self.fmt = fmt
+        self.rows = 0
+        self._schema = None
+        self._writer = None
+        self._sink = None
+
+    def write(self, df):
+        """
+        Append a chunk to the output file.
+
+        Args:
+            df (pandas.DataFrame): Chunk to append.
+        """
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        else:
+            table = _to_arrow(df, schema=self._schema)
+            if self._writer is None:
+                self._open(table.schema)
+            self._writer.write_table(table)
+        self.rows += len(df)
+
+    def _open(self, schema):
+        import pyarrow as pa
+
+        self._schema = schema
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(self.path, schema)
+        else:
+            self._sink = pa.OSFile(self.path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, schema)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,145 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from quality import QualityReport
+from schema import compact, read_csv
+from storage import TableWriter
+
+
+class RowHashSet:
+    """
+    Compact set of 64-bit row hashes used to detect duplicates across chunks.
+
+    The hashes are kept in a single sorted ``uint64`` array (8 bytes per row)
+    instead of a Python ``set`` of ints, which costs roughly ten times more
+    memory per entry.
+    """
+
+    def __init__(self):
+        self._hashes = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a set saved with :meth:`save`.
+
+        Args:
+            path (str): ``.npy`` file.
+
+        Returns:
+            RowHashSet: The loaded set.
+        """
+        hashes = cls()
+        hashes._hashes = np.load(path)
+        return hashes
+
+    def save(self, path):
+        """
+        Save the hashes to a ``.npy`` file.
+
+        Args:
+            path (str): Output file.
+        """
+        np.save(path, self._hashes)
+
+    def find(self, hashes):
+        """
+        Locate a batch of hashes in the set.
+
+        Args:
+            hashes (numpy.ndarray): Row hashes (``uint64``).
+
+        Returns:
+            tuple: Position of every hash in the sorted array and mask of the hashes present.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if not len(self._hashes):
+            return np.zeros(len(hashes), dtype=np.intp), np.zeros(len(hashes), dtype=bool)
+        pos = np.searchsorted(self._hashes, hashes)
+        pos[pos == len(self._hashes)] = 0
+        return pos, self._hashes[pos] == hashes
+
+    def add(self, hashes):
+        """
+        Add a batch of hashes and report which ones had not been seen before.
+
+        Repeated hashes inside the same batch only count as new the first time.
+
+        Args:
+            hashes (numpy.ndarray): Row hashes of the batch (``uint64``).
+
+        Returns:
+            numpy.ndarray: Boolean mask, True for the rows seen for the first time.
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        first_in_batch = ~pd.Series(hashes).duplicated().to_numpy()
+        _, seen = self.find(hashes)
+
+        is_new = first_in_batch & ~seen
+        if is_new.any():
+            # Merge into the sorted array: only the new hashes are sorted, the set is copied once
+            new = np.sort(hashes[is_new])
+            self._hashes = np.insert(self._hashes, np.searchsorted(self._hashes, new), new)
+        return is_new
+
+
+def clean_in_chunks(input_path, output_stem, fmt, chunksize, columns_to_remove,
+                    remove_duplicates=True, remove_na=True, seen=None, report=None, n_jobs=None):
+    """
+    Clean the raw dataset reading and writing it in chunks.
+
+    Each chunk is deduplicated against every row already written (using the
+    hash of the full raw row, as ``DataFrame.drop_duplicates`` does in the
+    in-memory mode), rows with missing values are dropped and the
+    out-of-scope columns removed before the chunk is appended to the output.
+    Chunks are parsed with the compact dtypes of ``schema.SCHEMA`` and scanned
+    once by a :class:`quality.QualityReport`, which gives both the rows to keep
+    and the data-quality statistics.
+
+    Args:
+        input_path (str): Raw CSV file.
+        output_stem (str): Output path without extension.
+        fmt (str): Storage format of the output (see ``storage.FORMATS``).
+        chunksize (int): Number of rows read per chunk.
+        columns_to_remove (list): Columns dropped before saving.
+        remove_duplicates (bool): Drop rows already seen in previous chunks.
+        remove_na (bool): Drop rows with at least one missing value.
+        seen (RowHashSet): Set filled with the hashes of the raw rows, a new one when None.
+        report (QualityReport): Report filled with the statistics of the rows, a new one when None.
+        n_jobs (int): Threads used to scan the columns of each chunk.
+
+    Returns:
+        dict: Row counts of the run (read, duplicates, missing, saved) and output path.
+    """
+    seen = RowHashSet() if seen is None else seen
+    report = QualityReport() if report is None else report
+    summary = {"chunks": 0, "rows_read": 0, "duplicates_removed": 0,
+               "missing_removed": 0, "rows_saved": 0}
+
+    os.makedirs(os.path.dirname(output_stem) or ".", exist_ok=True)
+    writer = TableWriter(output_stem, fmt)
+
+    for chunk in read_csv(input_path, categories=False, chunksize=chunksize):
+        summary["chunks"] += 1
+        summary["rows_read"] += len(chunk)
+
+        _, _, keep = report.update(chunk, seen, remove_duplicates, remove_na, n_jobs)
+        chunk = chunk[keep].drop(columns=[col for col in columns_to_remove if col in chunk.columns])
+        # Without rows with missing values every chunk gets the compact dtypes
+        writer.write(compact(chunk) if remove_na else chunk)
+
+        summary["rows_saved"] += len(chunk)
+        sys.stderr.write("Chunk {}: {:,} rows saved\n".format(summary["chunks"], summary["rows_saved"]))
+
+    writer.close()
+    summary["duplicates_removed"] = report.stats["duplicates_removed"]
+    summary["missing_removed"] = report.stats["missing_removed"]
+    summary["unique_hashes"] = len(seen)
+    summary["output_path"] = writer.path
+    return summary
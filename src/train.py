@@ -2,12 +2,57 @@ import os
 import pickle
 import sys
 
+import joblib
 import numpy as np
 import yaml
 from sklearn.ensemble import RandomForestClassifier
 
+from bundle import save_bundle
+from profiling import StageProfiler
+from storage import read_sparse, read_table, table_path
 
-def train(seed, n_est, min_split, matrix):
+
+def load_features(input, fmt):
+    """
+    Load the training split written by ``prepare.py``.
+
+    Parquet and Arrow files are memory-mapped and the features converted
+    straight to a ``float32`` matrix, the type the trees work with internally.
+    The columns follow the ``feature_names`` of ``metadata.yaml`` when present,
+    the order the preprocessor produces at inference time. When prepare saved
+    a one-hot block (``X_train_onehot.npz``) it is appended to the dense block
+    and a CSR matrix is returned, without densifying it.
+
+    Args:
+        input (str): Directory with ``X_train`` and ``y_train``.
+        fmt (str): Storage format of the tables.
+
+    Returns:
+        tuple: (X, y), X as a NumPy array or a CSR matrix.
+    """
+    columns = None
+    sparse_names = set()
+    metadata_path = os.path.join(input, "metadata.yaml")
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as fd:
+            metadata = yaml.safe_load(fd)
+        sparse_names = set(metadata.get("sparse_feature_names") or [])
+        columns = [name for name in metadata.get("feature_names", []) if name not in sparse_names] or None
+
+    X = read_table(table_path(os.path.join(input, "X_train"), fmt), columns=columns).to_numpy(dtype=np.float32)
+    y = read_table(table_path(os.path.join(input, "y_train"), fmt)).iloc[:, 0].to_numpy()
+
+    # Only the block listed in the metadata: the directory is persisted by DVC
+    # and may keep the .npz of a previous run with one-hot encoding
+    onehot_path = os.path.join(input, "X_train_onehot.npz")
+    if sparse_names:
+        from scipy import sparse
+
+        X = sparse.hstack([sparse.csr_matrix(X), read_sparse(onehot_path).astype(np.float32)], format="csr")
+    return X, y
+
+
+def train(seed, n_est, min_split, x, y, threshold, n_jobs=-1):
     """
     Train a random forest classifier.
 
@@ -15,20 +60,21 @@ def train(seed, n_est, min_split, matrix):
         seed (int): Random seed.
         n_est (int): Number of trees in the forest.
         min_split (int): Minimum number of samples required to split an internal node.
-        matrix (scipy.sparse.csr_matrix): Input matrix.
+        x (numpy.ndarray | scipy.sparse.csr_matrix): Feature matrix.
+        y (numpy.ndarray): Popularity of every row.
+        threshold (int): Popularity from which a track is considered popular.
+        n_jobs (int): Trees fitted in parallel, -1 for one per core.
 
     Returns:
         sklearn.ensemble.RandomForestClassifier: Trained classifier.
     """
-    labels = np.squeeze(matrix[:, 1].toarray())
-    x = matrix[:, 2:]
+    labels = (y >= threshold).astype(np.int8)
 
-    sys.stderr.write("Input matrix size {}\n".format(matrix.shape))
     sys.stderr.write("X matrix size {}\n".format(x.shape))
     sys.stderr.write("Y matrix size {}\n".format(labels.shape))
 
     clf = RandomForestClassifier(
-        n_estimators=n_est, min_samples_split=min_split, n_jobs=2, random_state=seed
+        n_estimators=n_est, min_samples_split=min_split, n_jobs=n_jobs, random_state=seed
     )
 
     clf.fit(x, labels)
@@ -37,7 +83,9 @@ def train(seed, n_est, min_split, matrix):
 
 
 def main():
-    params = yaml.safe_load(open("params.yaml"))["train"]
+    params = yaml.safe_load(open("params.yaml"))
+    storage_format = params["data"]["format"]
+    params = params["train"]
 
     if len(sys.argv) != 3:
         sys.stderr.write("Arguments error. Usage:\n")
@@ -50,15 +98,31 @@ def main():
     n_est = params["n_est"]
     min_split = params["min_split"]
 
+    profiler = StageProfiler("train")
+
     # Load the data
-    with open(os.path.join(input, "train.pkl"), "rb") as fd:
-        matrix, _ = pickle.load(fd)
+    with profiler.step("load"):
+        x, y = load_features(input, storage_format)
 
-    clf = train(seed=seed, n_est=n_est, min_split=min_split, matrix=matrix)
+    with profiler.step("fit"):
+        clf = train(seed=seed, n_est=n_est, min_split=min_split, x=x, y=y,
+                    threshold=params["threshold"], n_jobs=params["n_jobs"])
 
     # Save the model
-    with open(output, "wb") as fd:
-        pickle.dump(clf, fd)
+    with profiler.step("write"):
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "wb") as fd:
+            pickle.dump(clf, fd)
+
+    # Model, preprocessor and feature order in one memory-mappable bundle for the backend
+    if params.get("bundle_path"):
+        with profiler.step("bundle"):
+            preprocessor = joblib.load(os.path.join(input, "preprocessor.joblib"))
+            header = save_bundle(params["bundle_path"], clf, preprocessor,
+                                 extra={"train_params": {key: params[key] for key in ["seed", "n_est", "min_split",
+                                                                                      "threshold"]}})
+            sys.stderr.write("Bundle {} saved to {}\n".format(header["model_version"], params["bundle_path"]))
+    profiler.save()
 
 
 if __name__ == "__main__":
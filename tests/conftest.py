@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# The pipeline stages and the backend import their modules by name, as when run as scripts
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "dashboard", "backend"))
+
+GENRES = ["pop", "rock", "jazz", "metal", "blues", "soul", "folk", "punk", "funk", "disco", "house", "techno"]
+
+
+def make_tracks(n_rows=400, seed=0):
+    """Raw tracks with the columns and value ranges of dataset.csv."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "index": np.arange(n_rows),
+        "track_id": ["t{:05d}".format(i) for i in range(n_rows)],
+        "artists": rng.choice(["a", "b", "c"], n_rows),
+        "album_name": rng.choice(["x", "y"], n_rows),
+        "track_name": ["song {}".format(i) for i in range(n_rows)],
+        "popularity": rng.integers(0, 101, n_rows),
+        "duration_ms": rng.integers(30_000, 600_000, n_rows),
+        "explicit": rng.random(n_rows) < 0.1,
+        "danceability": rng.random(n_rows).round(3),
+        "energy": rng.random(n_rows).round(3),
+        "key": rng.integers(0, 12, n_rows),
+        "loudness": rng.normal(-8, 4, n_rows).round(3),
+        "mode": rng.integers(0, 2, n_rows),
+        "speechiness": rng.random(n_rows).round(3),
+        "acousticness": rng.random(n_rows).round(3),
+        "instrumentalness": rng.random(n_rows).round(3),
+        "liveness": rng.random(n_rows).round(3),
+        "valence": rng.random(n_rows).round(3),
+        "tempo": rng.normal(120, 30, n_rows).round(3),
+        "time_signature": rng.choice([3, 4, 5], n_rows),
+        "track_genre": rng.choice(GENRES, n_rows),
+    })
+
+
+@pytest.fixture
+def tracks():
+    return make_tracks()
+
+
+@pytest.fixture
+def raw_csv(tmp_path, tracks):
+    """Raw CSV with a few repeated rows and a few missing values, as dataset.csv."""
+    df = pd.concat([tracks, tracks.iloc[[3, 50, 51, 399]]], ignore_index=True)
+    df.loc[[10, 200], "artists"] = np.nan
+    df["explicit"] = df["explicit"].astype(object)
+    df.loc[120, "explicit"] = np.nan
+    path = tmp_path / "dataset.csv"
+    df.to_csv(path, index=False)
+    return str(path)
@@ -0,0 +1,90 @@
+import asyncio
+
+import cache as cache_module
+from batching import MicroBatcher
+from cache import PredictionCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeModel:
+    """Scores a record as its ``x``; records with ``x`` < 0 are rejected."""
+
+    def __init__(self, version="v1"):
+        self.version = version
+        self.batch_calls = 0
+
+    def predict_one(self, features):
+        if features["x"] < 0:
+            raise ValueError("negative x")
+        return float(features["x"])
+
+    def predict_records(self, records):
+        self.batch_calls += 1
+        return [self.predict_one(features) for features in records]
+
+
+def test_cache_expires_entries(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = PredictionCache(max_size=10, ttl=5.0)
+    cache.put("a", 1.0)
+    clock.now = 4.9
+    assert cache.get("a") == 1.0
+    clock.now = 5.1
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_evicts_the_least_recently_used():
+    cache = PredictionCache(max_size=2)
+    cache.put("a", 1.0)
+    cache.put("b", 2.0)
+    assert cache.get("a") == 1.0
+    cache.put("c", 3.0)
+    assert [cache.get(key) for key in "abc"] == [1.0, None, 3.0]
+    cache.invalidate()
+    assert cache.get("a") is None
+
+
+def test_cache_key_rounds_floats():
+    cache = PredictionCache(decimals=2)
+    assert cache.key({"x": 0.1234, "genre": "pop"}) == cache.key({"x": 0.1201, "genre": "pop"})
+    assert PredictionCache().key({"x": 0.1234}) != PredictionCache().key({"x": 0.1201})
+
+
+def run_batch(model, records, max_wait=0.05):
+    async def main():
+        batcher = MicroBatcher(lambda: model, max_wait=max_wait)
+        batcher.start()
+        try:
+            return await asyncio.gather(*[batcher.predict(features) for features in records],
+                                        return_exceptions=True), batcher
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_batcher_merges_requests():
+    model = FakeModel()
+    results, batcher = run_batch(model, [{"x": i} for i in range(5)])
+    assert results == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert (batcher.batches, batcher.requests, model.batch_calls) == (1, 5, 1)
+
+
+def test_batcher_isolates_a_failing_record():
+    results, _ = run_batch(FakeModel(), [{"x": 1}, {"x": -1}, {"x": 2}])
+    assert results[0] == 1.0 and results[2] == 2.0
+    assert isinstance(results[1], ValueError)
+
+
+def test_batcher_fails_every_caller_without_a_model():
+    results, _ = run_batch(None, [{"x": 1}, {"x": 2}])
+    assert all(isinstance(result, Exception) for result in results)
@@ -0,0 +1,71 @@
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from bundle import save_bundle
+from catalog import ScoreTable, build_table, hash_vector, hash_vectors
+from cleaning import clean_dataframe, load_dataset
+from features import FeatureStore, build_store
+from preprocessing import SongPreprocessor
+
+
+@pytest.fixture
+def store(tmp_path, raw_csv):
+    df = clean_dataframe(load_dataset(raw_csv)).reset_index(drop=True)
+    preprocessor = SongPreprocessor().fit(df)
+    joblib.dump(preprocessor, tmp_path / "preprocessor.joblib")
+    build_store(raw_csv, str(tmp_path / "features"), str(tmp_path / "preprocessor.joblib"), 100)
+    return FeatureStore.load(str(tmp_path / "features")), preprocessor, df
+
+
+@pytest.fixture(params=["regressor", "classifier"])
+def table(request, tmp_path, store):
+    store, preprocessor, df = store
+    X = preprocessor.transform(df, dtype=np.float32)
+    if request.param == "regressor":
+        model = RandomForestRegressor(n_estimators=5, max_depth=4, random_state=0).fit(X, df["popularity"])
+        scores = model.predict(store.vectors)
+    else:
+        model = RandomForestClassifier(n_estimators=5, max_depth=4, random_state=0).fit(X, df["popularity"] > 50)
+        scores = model.predict_proba(store.vectors)[:, -1]
+    header = save_bundle(str(tmp_path / "bundle"), model, preprocessor)
+    build_table(str(tmp_path / "features"), str(tmp_path / "bundle"), str(tmp_path / "scores"), 64)
+    return ScoreTable.load(str(tmp_path / "scores"), store), store, scores, header
+
+
+def test_hash_vectors_matches_hash_vector():
+    X = np.random.default_rng(0).normal(size=(20, 7)).astype(np.float32)
+    X[3, 2], X[4, 2] = 0.0, -0.0
+    assert hash_vectors(X).tolist() == [hash_vector(row) for row in X]
+    assert hash_vector(X[3]) != hash_vector(X[4])
+
+
+def test_lookup_returns_the_scores_of_the_store(table):
+    table, store, scores, header = table
+    assert table.model_version == header["model_version"]
+    assert table.header["tracks"] == len(store)
+    # Store rows with identical vectors share the entry of the first one
+    _, first = np.unique(store.vectors, axis=0, return_index=True)
+    assert table.header["vectors"] == len(first)
+
+    for i in range(0, len(store), 7):
+        assert table.lookup(store.vectors[i]) == scores[i]
+    rows = table.rows(store.vectors)
+    np.testing.assert_array_equal(store.vectors[rows], store.vectors)
+    np.testing.assert_array_equal(table.scores[rows], scores[rows])
+
+
+def test_lookup_misses_unseen_vectors(table):
+    table, store, _, _ = table
+    changed = store.vectors[:3].copy()
+    changed[:, 0] = np.nextafter(changed[:, 0], np.inf)
+    assert [table.lookup(row) for row in changed] == [None] * 3
+    assert table.rows(np.vstack([changed, store.vectors[:1]])).tolist() == [-1, -1, -1, 0]
+
+
+def test_load_refuses_another_store(tmp_path, table):
+    _, store, _, _ = table
+    store.version = "other"
+    with pytest.raises(ValueError):
+        ScoreTable.load(str(tmp_path / "scores"), store)
@@ -0,0 +1,101 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+from cleaning import clean_dataframe, load_dataset
+from features import FeatureStore, HashIndex, build_store, encode_ids, hash_id, hash_ids
+from preprocessing import SongPreprocessor
+from schema import compact, read_csv
+
+
+def test_hash_ids_matches_hash_id():
+    ids = ["", "a", "5SuOikwiRyPMVoIQDJUgSV", "ñandú", "t00001", "t00001 "]
+    assert hash_ids(encode_ids(ids)).tolist() == [hash_id(track_id) for track_id in ids]
+
+
+def test_find_many_matches_a_dict():
+    rng = np.random.default_rng(0)
+    keys = np.unique(rng.integers(0, 2 ** 63, 5_000).astype(np.uint64))
+    rows = rng.permutation(len(keys))
+    index = HashIndex.build(keys, rows)
+    assert len(index.rows) >= 2 * len(keys)
+
+    queries = np.r_[keys, rng.integers(0, 2 ** 63, 1_000).astype(np.uint64)]
+    expected = dict(zip(keys.tolist(), rows.tolist()))
+    found = index.find_many(queries, lambda rows, positions: np.ones(len(rows), dtype=bool))
+    assert found.tolist() == [expected.get(key, -1) for key in queries.tolist()]
+    assert [index.find(int(key), lambda row: True) for key in queries[::97]] == found[::97].tolist()
+
+
+def test_find_many_confirms_colliding_hashes():
+    # Three keys with the same hash: only the row holding the key is returned
+    names = np.array(["x", "y", "z"])
+    index = HashIndex.build(np.array([7, 7, 7], dtype=np.uint64))
+    queries = np.array(["z", "x", "w"])
+    found = index.find_many(np.full(3, 7, dtype=np.uint64),
+                            lambda rows, positions: names[rows] == queries[positions])
+    assert found.tolist() == [2, 0, -1]
+    assert index.find(7, lambda row: names[row] == "y") == 1
+    empty = HashIndex.build(np.empty(0, dtype=np.uint64))
+    assert empty.find_many(np.array([1], dtype=np.uint64), lambda rows, positions: rows >= 0).tolist() == [-1]
+
+
+@pytest.fixture
+def store_inputs(tmp_path, raw_csv):
+    df = clean_dataframe(load_dataset(raw_csv)).reset_index(drop=True)
+    preprocessor = SongPreprocessor().fit(df)
+    joblib.dump(preprocessor, tmp_path / "preprocessor.joblib")
+    # Pinned feature order, different from the default one
+    with open(tmp_path / "metadata.yaml", "w") as f:
+        yaml.dump({"feature_names": preprocessor.feature_names_[::-1]}, f)
+
+    raw = pd.read_csv(raw_csv)
+    # The same track listed under another genre, after its first row
+    other_genre = raw.iloc[[5, 6]].assign(track_genre="rock")
+    path = tmp_path / "dataset.csv"
+    pd.concat([raw, other_genre], ignore_index=True).to_csv(path, index=False)
+    return str(path), str(tmp_path / "preprocessor.joblib"), preprocessor
+
+
+def expected_vectors(path, preprocessor):
+    columns = ["track_id"] + preprocessor.input_columns_
+    df = compact(read_csv(path, columns=columns, categories=False).dropna().drop_duplicates(subset="track_id"))
+    preprocessor.set_feature_order(preprocessor.feature_names_[::-1])
+    return df["track_id"].astype(str).tolist(), preprocessor.transform(df, dtype=np.float32)
+
+
+@pytest.mark.parametrize("chunksize", [50, 10_000])
+def test_build_store_matches_the_preprocessor(tmp_path, store_inputs, chunksize):
+    path, preprocessor_path, preprocessor = store_inputs
+    header = build_store(path, str(tmp_path / "store"), preprocessor_path, chunksize)
+    ids, vectors = expected_vectors(path, preprocessor)
+
+    store = FeatureStore.load(str(tmp_path / "store"))
+    assert header["tracks"] == len(store) == len(ids)
+    # Repeated rows of the raw file and the second genre of two tracks
+    assert header["repeated_ids"] == 6
+    assert store.feature_names == preprocessor.feature_names_
+    np.testing.assert_array_equal(store.vectors, vectors)
+
+    rows = store.rows(ids[::-1] + ["unknown"])
+    assert rows.tolist() == list(range(len(ids)))[::-1] + [-1]
+    assert [store.row(track_id) for track_id in ids[:20]] == list(range(20))
+    found, known = store.get(["unknown", ids[3], ids[0]])
+    assert known.tolist() == [False, True, True]
+    np.testing.assert_array_equal(found, vectors[[3, 0]])
+
+
+def test_build_store_reads_every_format(tmp_path, store_inputs):
+    path, preprocessor_path, _ = store_inputs
+    build_store(path, str(tmp_path / "store_csv"), preprocessor_path, 100)
+    parquet = str(tmp_path / "dataset.parquet")
+    read_csv(path, categories=False).to_parquet(parquet)
+    header = build_store(parquet, str(tmp_path / "store_parquet"), preprocessor_path, 100)
+
+    from_csv = FeatureStore.load(str(tmp_path / "store_csv"))
+    from_parquet = FeatureStore.load(str(tmp_path / "store_parquet"))
+    np.testing.assert_array_equal(from_csv.vectors, from_parquet.vectors)
+    np.testing.assert_array_equal(from_csv.ids, from_parquet.ids)
+    assert header["store_version"] == from_csv.version
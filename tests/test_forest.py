@@ -0,0 +1,114 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.ensemble import AdaBoostClassifier, ExtraTreesClassifier, RandomForestClassifier, RandomForestRegressor
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from forest import CompiledForest, compile_model
+
+# float32 accumulation of the leaf outputs against the float64 of the estimators
+TOLERANCE = 1e-5
+
+
+def make_data(n_classes=2, missing=0.0, n_rows=600, n_features=6, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features)).astype(np.float32)
+    # Features with repeated values, as the one-hot and label encoded columns
+    X[:, 0] = rng.integers(0, 5, n_rows)
+    score = X[:, 0] + X[:, 1] - X[:, 2] * X[:, 3]
+    y = np.digitize(score, np.quantile(score, np.linspace(0, 1, n_classes + 1)[1:-1]))
+    if missing:
+        X[rng.random(X.shape) < missing] = np.nan
+        # Rows with a missing value in feature 4 lean to one class, so the trees split on missing vs. present
+        y[np.isnan(X[:, 4])] = n_classes - 1
+    return X, y, score
+
+
+def assert_same(model, X):
+    compiled = compile_model(model)
+    if hasattr(model, "predict_proba"):
+        np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), atol=TOLERANCE)
+    np.testing.assert_allclose(compiled.predict(X), model.predict(X), rtol=TOLERANCE, atol=TOLERANCE)
+
+
+SKLEARN_CLASSIFIERS = [
+    lambda: DecisionTreeClassifier(random_state=0),
+    lambda: RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0),
+    lambda: ExtraTreesClassifier(n_estimators=20, max_depth=8, random_state=0),
+]
+
+
+@pytest.mark.parametrize("n_classes", [2, 3])
+@pytest.mark.parametrize("make_model", SKLEARN_CLASSIFIERS)
+def test_sklearn_classifiers(make_model, n_classes):
+    X, y, _ = make_data(n_classes)
+    assert_same(make_model().fit(X, y), X)
+
+
+@pytest.mark.parametrize("make_model", [
+    lambda: DecisionTreeClassifier(random_state=0),
+    lambda: RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0),
+])
+def test_sklearn_missing_values(make_model):
+    # scikit-learn learns splits with threshold +inf that only separate the missing values
+    X, y, _ = make_data(missing=0.1)
+    model = make_model().fit(X, y)
+    thresholds = np.concatenate([tree.tree_.threshold for tree in getattr(model, "estimators_", [model])])
+    assert np.isinf(thresholds).any()
+    assert_same(model, X)
+
+
+@pytest.mark.parametrize("make_model", [
+    lambda: DecisionTreeRegressor(max_depth=10, random_state=0),
+    lambda: RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0),
+])
+def test_sklearn_regressors(make_model):
+    X, _, score = make_data()
+    assert_same(make_model().fit(X, score), X)
+
+
+@pytest.mark.parametrize("n_classes", [2, 3])
+def test_adaboost_samme(n_classes):
+    X, y, _ = make_data(n_classes)
+    # SAMME is the only algorithm of recent scikit-learn versions
+    model = AdaBoostClassifier(DecisionTreeClassifier(max_depth=3), n_estimators=30, random_state=0).fit(X, y)
+    assert_same(model, X)
+
+
+@pytest.mark.parametrize("missing", [0.0, 0.1])
+@pytest.mark.parametrize("n_classes", [2, 3])
+def test_xgboost_classifiers(n_classes, missing):
+    xgb = pytest.importorskip("xgboost")
+    X, y, _ = make_data(n_classes, missing)
+    model = xgb.XGBClassifier(n_estimators=30, max_depth=5, tree_method="hist", random_state=0).fit(X, y)
+    assert_same(model, X)
+
+
+@pytest.mark.parametrize("missing", [0.0, 0.1])
+def test_xgboost_regressor(missing):
+    xgb = pytest.importorskip("xgboost")
+    X, _, score = make_data(missing=missing)
+    model = xgb.XGBRegressor(n_estimators=30, max_depth=5, tree_method="hist", random_state=0).fit(X, score)
+    assert_same(model, X)
+
+
+def test_single_row_and_reload(tmp_path):
+    X, y, _ = make_data(missing=0.1)
+    model = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0).fit(X, y)
+    compiled = compile_model(model)
+    compiled.save(str(tmp_path))
+    loaded = CompiledForest.load(str(tmp_path))
+    for row in X[:20]:
+        np.testing.assert_allclose(loaded.predict_proba(row[None]), model.predict_proba(row[None]), atol=TOLERANCE)
+
+
+def test_unsupported_model():
+    from sklearn.linear_model import LogisticRegression
+
+    X, y, _ = make_data()
+    with pytest.raises(TypeError):
+        compile_model(LogisticRegression().fit(X, y))
@@ -0,0 +1,172 @@
+import os
+
+import joblib
+import pandas as pd
+import pytest
+import yaml
+
+from cleaning import COLUMNS_TO_REMOVE, cleaning_settings
+from conftest import ROOT, make_tracks
+from incremental import clean_new_rows, load_cleaning_state, prepare_new_rows, save_cleaning_state
+from prepare import run
+from schema import load_table
+from splitting import split_in_chunks
+from storage import read_sparse, read_table
+from streaming import RowHashSet, clean_in_chunks
+
+
+@pytest.fixture
+def params(tmp_path, monkeypatch):
+    # The stages write their profiles to metrics/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    with open(os.path.join(ROOT, "params.yaml")) as f:
+        params = yaml.safe_load(f)
+    params["data"]["format"] = "parquet"
+    params["cleaning"].update(input_path=str(tmp_path / "dataset.csv"), output_path=str(tmp_path / "prep"),
+                              incremental=True, chunksize=50)
+    params["prepare"].update(input_path=str(tmp_path / "prep" / "dataset_cleaned"),
+                             output_path_train=str(tmp_path / "train"), output_path_test=str(tmp_path / "test"),
+                             split_method="hash", split_key=["track_id"], high_cardinality_encoding="onehot",
+                             incremental=True, chunksize=50)
+    return params
+
+
+def write_raw(params, df):
+    df.to_csv(params["cleaning"]["input_path"], index=False)
+
+
+def full_clean(params):
+    config = params["cleaning"]
+    seen = RowHashSet()
+    summary = clean_in_chunks(config["input_path"], os.path.join(config["output_path"], "dataset_cleaned"),
+                              "parquet", config["chunksize"], COLUMNS_TO_REMOVE, seen=seen)
+    save_cleaning_state(config["output_path"], seen, summary["rows_saved"], cleaning_settings(params))
+    return summary
+
+
+def new_rows(params):
+    config = params["cleaning"]
+    return clean_new_rows(config["input_path"], config["output_path"], config["chunksize"], COLUMNS_TO_REMOVE,
+                          cleaning_settings(params))
+
+
+def prepare_new(params, **overrides):
+    config = params["prepare"]
+    kwargs = dict(seed=config["seed"], test_size=config["split"], chunksize=config["chunksize"],
+                  key_columns=config["split_key"], stratify_bins=config["stratify_bins"],
+                  high_cardinality_encoding=config["high_cardinality_encoding"],
+                  columns_to_normalize=config["columns_to_normalize"])
+    kwargs.update(overrides)
+    return prepare_new_rows(config["input_path"] + ".parquet", config["output_path_train"],
+                            config["output_path_test"], "parquet", **kwargs)
+
+
+def test_clean_new_rows_matches_a_full_cleaning(tmp_path, params):
+    tracks = make_tracks(500)
+    write_raw(params, tracks.iloc[:300])
+    full_clean(params)
+    build = load_cleaning_state(params["cleaning"]["output_path"])["build"]
+
+    # New rows, repeats of an old and a new row, and a row with a missing value
+    added = pd.concat([tracks.iloc[:300], tracks.iloc[300:], tracks.iloc[[7, 350]],
+                       tracks.iloc[[420]].assign(tempo=float("nan"))])
+    write_raw(params, added)
+    summary = new_rows(params)
+    assert summary["new_rows"] == 202
+    assert (summary["duplicates_removed"], summary["missing_removed"]) == (1, 1)
+    assert summary["rows_total"] == 500
+
+    result = load_table(str(tmp_path / "prep" / "dataset_cleaned.parquet"))
+    reference = clean_in_chunks(params["cleaning"]["input_path"], str(tmp_path / "reference"), "parquet", 50,
+                                COLUMNS_TO_REMOVE)
+    pd.testing.assert_frame_equal(result, load_table(reference["output_path"]))
+    state = load_cleaning_state(params["cleaning"]["output_path"])
+    assert (state["build"], state["rows"]) == (build, 500)
+
+
+def test_clean_new_rows_requires_a_full_cleaning(params):
+    tracks = make_tracks(300)
+    write_raw(params, tracks)
+    assert new_rows(params) is None
+
+    full_clean(params)
+    other = dict(params, cleaning=dict(params["cleaning"], remove_na=False))
+    assert new_rows(other) is None
+    # Raw rows modified or removed
+    write_raw(params, tracks.iloc[1:])
+    assert new_rows(params) is None
+
+
+def test_prepare_new_rows_matches_a_split_with_the_same_preprocessor(tmp_path, params):
+    tracks = make_tracks(500)
+    write_raw(params, tracks.iloc[:300])
+    full_clean(params)
+    run(params)
+    write_raw(params, tracks)
+    new_rows(params)
+
+    summary = prepare_new(params)
+    assert summary["new_rows"] == 200
+    assert summary["train_rows"] + summary["test_rows"] == 200
+
+    config = params["prepare"]
+    preprocessor = joblib.load(str(tmp_path / "train" / "preprocessor.joblib"))
+    split_in_chunks(config["input_path"] + ".parquet", preprocessor, str(tmp_path / "ref_train"),
+                    str(tmp_path / "ref_test"), "parquet", config["seed"], config["split"], 64,
+                    key_columns=["track_id"])
+    for name in ["train", "test"]:
+        for table in ["X", "y"]:
+            result = read_table(str(tmp_path / name / "{}_{}.parquet".format(table, name)))
+            expected = read_table(str(tmp_path / "ref_{}".format(name) / "{}_{}.parquet".format(table, name)))
+            pd.testing.assert_frame_equal(result, expected)
+        result = read_sparse(str(tmp_path / name / "X_{}_onehot.npz".format(name)))
+        expected = read_sparse(str(tmp_path / "ref_{}".format(name) / "X_{}_onehot.npz".format(name)))
+        assert (result != expected).nnz == 0
+
+    with open(tmp_path / "train" / "metadata.yaml") as f:
+        metadata = yaml.safe_load(f)
+    assert metadata["source_rows"] == 500
+    assert metadata["train_size"] + metadata["test_size"] == 500
+    assert prepare_new(params) == {"new_rows": 0, "train_rows": 0, "test_rows": 0}
+
+
+@pytest.mark.parametrize("change", [
+    {"seed": 1},
+    {"key_columns": None},
+    {"high_cardinality_encoding": "label"},
+    {"columns_to_normalize": ["tempo"]},
+])
+def test_prepare_new_rows_requires_a_full_preparation(params, change):
+    tracks = make_tracks(500)
+    write_raw(params, tracks.iloc[:300])
+    full_clean(params)
+    assert prepare_new(params) is None
+
+    run(params)
+    write_raw(params, tracks)
+    new_rows(params)
+    assert prepare_new(params, **change) is None
+
+
+def test_prepare_new_rows_falls_back_on_unknown_categories_and_features(tmp_path, params):
+    tracks = make_tracks(500)
+    write_raw(params, tracks.iloc[:300])
+    full_clean(params)
+    run(params)
+    write_raw(params, pd.concat([tracks.iloc[:300], tracks.iloc[300:].assign(track_genre="k-pop")]))
+    new_rows(params)
+    assert prepare_new(params) is None
+
+    write_raw(params, tracks.iloc[:300])
+    full_clean(params)
+    run(params)
+    write_raw(params, tracks)
+    new_rows(params)
+    # Features pinned in metadata.yaml that the preprocessor does not produce
+    metadata_path = tmp_path / "train" / "metadata.yaml"
+    with open(metadata_path) as f:
+        metadata = yaml.safe_load(f)
+    metadata["feature_names"][0] = "unknown"
+    with open(metadata_path, "w") as f:
+        yaml.dump(metadata, f)
+    assert prepare_new(params) is None
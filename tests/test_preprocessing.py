@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import LabelEncoder, OneHotEncoder
+
+from cleaning import clean_dataframe, load_dataset
+from preprocessing import SongPreprocessor
+from stats import column_stats
+
+
+@pytest.fixture
+def df(raw_csv):
+    return clean_dataframe(load_dataset(raw_csv)).reset_index(drop=True)
+
+
+def sklearn_encoding(df, preprocessor):
+    """Encoding of prepare.py with the scikit-learn scalers and encoders, column by column."""
+    X = df.drop(columns=["popularity", "track_id"]).copy()
+    for col in preprocessor.columns_to_normalize:
+        X[col] = preprocessor.scalers_[f"{col}_scaler"].transform(X[[col]].to_numpy(np.float64)).ravel()
+    for col in preprocessor.high_cardinality_:
+        if col not in preprocessor.sparse_columns_:
+            X[col] = LabelEncoder().fit(X[col].astype(str)).transform(X[col].astype(str))
+    blocks = []
+    for col in preprocessor.low_cardinality_ + preprocessor.sparse_columns_:
+        encoder = OneHotEncoder(drop="first", sparse_output=False).fit(X[[col]].astype(object))
+        names = [f"{col}_{cat}" for cat in encoder.categories_[0][1:]]
+        blocks.append(pd.DataFrame(encoder.transform(X[[col]].astype(object)), columns=names))
+    X = X.drop(columns=preprocessor.low_cardinality_ + preprocessor.sparse_columns_)
+    return pd.concat([X.astype(np.float64)] + blocks, axis=1)
+
+
+@pytest.mark.parametrize("encoding", ["label", "onehot"])
+def test_transform_matches_sklearn_encoders(df, encoding):
+    preprocessor = SongPreprocessor(high_cardinality_encoding=encoding).fit(df)
+    expected = sklearn_encoding(df, preprocessor)
+    assert sorted(expected.columns) == sorted(preprocessor.feature_names_)
+    expected = expected[preprocessor.feature_names_].to_numpy()
+
+    np.testing.assert_allclose(preprocessor.transform(df), expected, rtol=1e-12)
+    np.testing.assert_allclose(preprocessor.transform_sparse(df).toarray(), expected, rtol=1e-12)
+    dense = [preprocessor.feature_names_.index(name) for name in preprocessor.dense_feature_names_]
+    np.testing.assert_allclose(preprocessor.transform_frame(df).to_numpy(np.float64), expected[:, dense], rtol=1e-12)
+    if encoding == "onehot":
+        sparse_columns = [preprocessor.feature_names_.index(name) for name in preprocessor.sparse_feature_names_]
+        block = preprocessor.transform_sparse(df, block="sparse")
+        np.testing.assert_array_equal(block.toarray(), expected[:, sparse_columns])
+
+
+def test_transform_matches_get_dummies(df):
+    preprocessor = SongPreprocessor().fit(df)
+    dummies = pd.get_dummies(df[preprocessor.low_cardinality_].astype(object), drop_first=True)
+    X = preprocessor.transform_frame(df)
+    assert X.columns[-dummies.shape[1]:].tolist() == dummies.columns.tolist()
+    pd.testing.assert_frame_equal(X[dummies.columns], dummies, check_dtype=False)
+
+
+def test_set_feature_order_pins_the_columns(df):
+    preprocessor = SongPreprocessor(high_cardinality_encoding="onehot").fit(df)
+    default = preprocessor.transform(df)
+    order = preprocessor.feature_names_[::-1]
+    position = [preprocessor.feature_names_.index(name) for name in order]
+
+    preprocessor.set_feature_order(order)
+    assert preprocessor.feature_names_ == order
+    np.testing.assert_array_equal(preprocessor.transform(df), default[:, position])
+    np.testing.assert_array_equal(preprocessor.transform_sparse(df).toarray(), default[:, position])
+    assert preprocessor.transform_frame(df).columns.tolist() == preprocessor.dense_feature_names_
+
+    with pytest.raises(ValueError):
+        preprocessor.set_feature_order(order[1:])
+    with pytest.raises(ValueError):
+        preprocessor.set_feature_order(order[:-1] + ["unknown"])
+
+
+def test_unknown_values(df):
+    preprocessor = SongPreprocessor().fit(df)
+    rows = df.head(3).copy()
+    rows["track_genre"] = rows["track_genre"].astype(object)
+    rows.loc[1, "track_genre"] = "k-pop"
+    assert preprocessor.unknown_rows(rows).tolist() == [False, True, False]
+    with pytest.raises(ValueError):
+        preprocessor.transform(rows)
+
+
+def test_fit_on_counts_matches_fit_on_the_dataset(df):
+    full = SongPreprocessor(high_cardinality_encoding="onehot").fit(df)
+    categories = {col: pd.unique(df[col].to_numpy()) for col in full.categorical_columns(df)}
+    stats = column_stats(df[full.columns_to_normalize], full.columns_to_normalize)
+    head = SongPreprocessor(high_cardinality_encoding="onehot").fit(df.head(), stats=stats, categories=categories)
+    assert head.feature_names_ == full.feature_names_
+    np.testing.assert_array_equal(head.transform(df), full.transform(df))
@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quality import QualityReport, scan_columns
+from schema import read_csv
+from streaming import RowHashSet
+
+
+@pytest.fixture
+def raw(raw_csv):
+    return read_csv(raw_csv, categories=False)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 3, 8, -1])
+def test_scan_columns_matches_pandas(raw, n_jobs):
+    hashes, missing_by_column, missing_by_row = scan_columns(raw, n_jobs)
+    np.testing.assert_array_equal(hashes, pd.util.hash_pandas_object(raw, index=False).to_numpy())
+    pd.testing.assert_series_equal(missing_by_column, raw.isna().sum(), check_names=False)
+    np.testing.assert_array_equal(missing_by_row, raw.isna().sum(axis=1).to_numpy())
+
+
+def test_scan_columns_single_column_and_no_rows(raw):
+    for df in [raw[["tempo"]], raw.iloc[:0]]:
+        hashes, _, _ = scan_columns(df)
+        np.testing.assert_array_equal(hashes, pd.util.hash_pandas_object(df, index=False).to_numpy())
+
+
+def test_report_matches_pandas_counts(tmp_path, raw):
+    report, seen = QualityReport(), RowHashSet()
+    for chunk in np.array_split(np.arange(len(raw)), 5):
+        report.update(raw.iloc[chunk], seen)
+    stats = report.stats
+
+    deduplicated = raw.drop_duplicates()
+    cleaned = deduplicated.dropna()
+    assert stats["rows_read"] == len(raw)
+    assert stats["missing_values"] == raw.isna().sum().sum()
+    assert stats["rows_with_missing"] == raw.isna().any(axis=1).sum()
+    assert stats["missing_by_column"] == {col: int(n) for col, n in raw.isna().sum().items()}
+    assert stats["duplicate_rows"] == stats["duplicates_removed"] == raw.duplicated().sum()
+    assert stats["missing_removed"] == len(deduplicated) - len(cleaned)
+    assert stats["rows_saved"] == len(cleaned)
+    assert stats["remaining_duplicates"] == stats["remaining_missing"] == 0
+
+    saved = report.save(str(tmp_path / "metrics" / "quality.json"), mode="streaming")
+    with open(tmp_path / "metrics" / "quality.json") as f:
+        assert json.load(f) == saved
+    assert saved["mode"] == "streaming"
+
+
+def test_report_keeps_rows_when_disabled(raw):
+    report = QualityReport()
+    _, is_new, keep = report.update(raw, RowHashSet(), remove_duplicates=False, remove_na=False)
+    assert keep.all()
+    assert (~is_new).sum() == raw.duplicated().sum()
+    assert report.stats["remaining_duplicates"] == raw.duplicated().sum()
+    assert report.stats["remaining_rows_with_missing"] == raw.isna().any(axis=1).sum()
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import registry
+from registry import ValidationError, validate
+
+
+class Regressor:
+    def predict(self, X):
+        return X[:, 0]
+
+
+class Shifted:
+    def predict(self, X):
+        return X[:, 0] + 1
+
+
+class Classifier:
+    def predict_proba(self, X):
+        return np.column_stack([1 - X[:, 0], X[:, 0]])
+
+
+class Candidate:
+    """Model scoring every row as a fixed array, with the header fields read by validate."""
+
+    def __init__(self, scores, estimator=None, preprocessor="p1"):
+        self.scores = np.asarray(scores, dtype=float)
+        self.model = estimator if estimator is not None else Regressor()
+        self.compiled = None
+        self.preprocessor = preprocessor
+        self.header = {"sha256": {"preprocessor": preprocessor}, "train_params": {"threshold": 50}}
+
+    def predict_vectors(self, X):
+        return self.scores
+
+
+@pytest.fixture
+def sample(monkeypatch):
+    y = np.array([10.0, 20.0, 60.0, 80.0])
+    monkeypatch.setattr(registry, "load_sample", lambda preprocessor, test_path, rows: (np.zeros((4, 1)), y))
+    return y
+
+
+def test_accepts_a_model_better_than_the_served_one(sample):
+    result = validate(Candidate(sample + 1), Candidate(sample + 10))
+    assert result["rows"] == 4
+    assert result["metric"] > result["current_metric"] > result["baseline"]
+
+
+def test_skips_the_comparison_with_another_preprocessor(sample):
+    result = validate(Candidate(sample + 5), Candidate(sample, preprocessor="p0"))
+    assert result["current_metric"] is None
+
+
+@pytest.mark.parametrize("scores", [
+    [10.0, 20.0, np.nan, 80.0],
+    # Not better than the mean
+    [42.5, 42.5, 42.5, 42.5],
+])
+def test_rejects_bad_regressors(sample, scores):
+    with pytest.raises(ValidationError):
+        validate(Candidate(scores), None)
+
+
+def test_rejects_a_drop_against_the_served_model(sample):
+    with pytest.raises(ValidationError):
+        validate(Candidate(sample + 15), Candidate(sample), max_drop=0.02)
+
+
+def test_rejects_probabilities_outside_unit_interval(sample):
+    with pytest.raises(ValidationError):
+        validate(Candidate([0.1, 0.2, 0.9, 1.5], Classifier()), None)
+    result = validate(Candidate([0.1, 0.2, 0.9, 0.8], Classifier()), None)
+    assert result["metric"] == 1.0 and result["baseline"] == 0.5
+
+
+def test_rejects_a_compiled_forest_that_disagrees(sample):
+    candidate = Candidate(sample)
+    candidate.compiled = Shifted()
+    with pytest.raises(ValidationError):
+        validate(candidate, None)
+
+
+def test_missing_split_is_a_validation_error(tmp_path):
+    with pytest.raises(ValidationError):
+        registry.load_sample(None, str(tmp_path))
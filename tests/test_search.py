@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.model_selection import ParameterGrid
+
+import search
+from search import SEARCH_SPACES, evaluate, sample_candidates
+
+
+def test_sample_candidates_caps_the_grid():
+    grid = SEARCH_SPACES["sgdregressor"]["grid"]
+    full = list(ParameterGrid(grid))
+    sample = sample_candidates(grid, 243, np.random.default_rng(0))
+    assert len(sample) == 243
+    positions = [full.index(params) for params in sample]
+    assert positions == sorted(set(positions))
+    assert sample == sample_candidates(grid, 243, np.random.default_rng(0))
+
+    small = SEARCH_SPACES["linearsvr"]["grid"]
+    assert sample_candidates(small, None, np.random.default_rng(0)) == list(ParameterGrid(small))
+    assert sample_candidates(small, 10_000, np.random.default_rng(0)) == list(ParameterGrid(small))
+
+
+@pytest.fixture
+def shared(tmp_path):
+    rng = np.random.default_rng(0)
+    dense = rng.random((300, 4)).astype(np.float32)
+    onehot = sparse.random(300, 20, density=0.05, format="csr", random_state=0, dtype=np.float32)
+    X = sparse.hstack([sparse.csr_matrix(dense), onehot], format="csr")
+    y = rng.integers(0, 101, 300)
+    np.save(tmp_path / "y.npy", y)
+    np.save(tmp_path / "order.npy", rng.permutation(300))
+    return X, str(tmp_path)
+
+
+def test_csr_matrix_is_shared_without_densifying(shared):
+    X, directory = shared
+    paths = search._share_matrix(X, directory)
+    loaded = search._load_matrix(paths)
+    assert sparse.issparse(loaded)
+    assert (loaded != X).nnz == 0
+    dense = search._load_matrix(search._share_matrix(X.toarray(), directory))
+    np.testing.assert_array_equal(dense, X.toarray())
+
+
+@pytest.mark.parametrize("family, params", [
+    ("linearsvr", {"C": 1, "epsilon": 0.1, "loss": "epsilon_insensitive", "max_iter": 1000}),
+    ("sgdregressor", {"sgd__alpha": 0.01, "sgd__max_iter": 1000}),
+])
+def test_evaluate_on_a_sparse_matrix(shared, family, params):
+    X, directory = shared
+    search._init_worker(search._share_matrix(X, directory), directory + "/y.npy", directory + "/order.npy")
+    from_sparse = evaluate(family, params, 200, 30, 3, 0)
+    search._init_worker(search._share_matrix(X.toarray(), directory), directory + "/y.npy",
+                        directory + "/order.npy")
+    from_dense = evaluate(family, params, 200, 30, 3, 0)
+    assert from_sparse["error"] == from_dense["error"] == ""
+    np.testing.assert_allclose(from_sparse["score"], from_dense["score"], rtol=1e-4)
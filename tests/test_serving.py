@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from registry import ValidationError
+
+
+class FakeModel:
+    def __init__(self, version="v1"):
+        self.version = version
+
+
+@pytest.fixture
+def served(monkeypatch):
+    model = FakeModel("v1")
+    monkeypatch.setitem(main.state, "model", model)
+    monkeypatch.setattr(main, "registry", {"swaps": 0, "rejected": {}, "failures": {}, "validation": None})
+    return model
+
+
+def test_scoring_error_status(served):
+    assert main.scoring_error(served, ValueError("bad genre")).status_code == 422
+    assert main.scoring_error(served, RuntimeError("boom")).status_code == 500
+    swapped = main.scoring_error(FakeModel("v0"), RuntimeError("boom"))
+    assert swapped.status_code == 503 and swapped.headers == {"Retry-After": "1"}
+
+
+def test_predict_batch_maps_errors(served):
+    def prepare(columns):
+        raise KeyError("danceability")
+
+    served.prepare = prepare
+    with pytest.raises(HTTPException) as error:
+        main.predict_batch(main.SongFeaturesBatch(**{name: [] for name in main.SongFeaturesBatch.model_fields}))
+    assert error.value.status_code == 500
+
+
+def check_model(monkeypatch, version, error):
+    def load_candidate(path, current):
+        if error is not None:
+            raise error
+        return FakeModel(version), {"rows": 10}
+
+    monkeypatch.setattr(main, "read_version", lambda path: version)
+    monkeypatch.setattr(main, "load_candidate", load_candidate)
+    monkeypatch.setattr(main, "load_tables", lambda model: (None, None))
+    asyncio.run(main.check_model())
+
+
+def test_check_model_rejects_a_failed_validation_at_once(served, monkeypatch):
+    check_model(monkeypatch, "v2", ValidationError("below the baseline"))
+    assert main.registry["rejected"] == {"v2": "ValidationError: below the baseline"}
+    assert main.state["model"] is served
+
+
+def test_check_model_retries_other_errors(served, monkeypatch):
+    monkeypatch.setattr(main, "MODEL_RELOAD_ATTEMPTS", 3)
+    for attempt in range(1, 3):
+        check_model(monkeypatch, "v2", OSError("bundle being copied"))
+        assert main.registry["failures"] == {"v2": attempt}
+        assert not main.registry["rejected"]
+
+    check_model(monkeypatch, "v2", None)
+    assert main.state["model"].version == "v2"
+    assert main.registry["swaps"] == 1 and not main.registry["failures"]
+
+    for _ in range(3):
+        check_model(monkeypatch, "v3", RuntimeError("corrupt pickle"))
+    assert main.registry["rejected"] == {"v3": "RuntimeError: corrupt pickle (after 3 attempts)"}
+    assert main.state["model"].version == "v2"
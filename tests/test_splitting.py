@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+
+from cleaning import clean_dataframe, load_dataset
+from preprocessing import SongPreprocessor
+from schema import load_table
+from splitting import (hash_split, popularity_strata, split_buckets, split_in_chunks, strata_thresholds,
+                       stratified_hash_split)
+from storage import SparseWriter, read_sparse, read_table, write_table
+
+SEED = 20250901
+
+
+@pytest.fixture
+def cleaned(tmp_path, raw_csv):
+    path = write_table(clean_dataframe(load_dataset(raw_csv)).reset_index(drop=True),
+                       str(tmp_path / "dataset_cleaned"), "parquet")
+    return path, load_table(path)
+
+
+def test_cleaning_keeps_the_split_key(cleaned):
+    _, df = cleaned
+    assert "track_id" in df.columns
+    preprocessor = SongPreprocessor().fit(df)
+    assert "track_id" not in preprocessor.input_columns_
+    assert "track_id" not in preprocessor.feature_names_
+
+
+def test_hash_split_is_stable_and_ignores_the_label(cleaned):
+    _, df = cleaned
+    test = hash_split(df[["track_id"]], SEED, 0.2)
+    assert abs(test.mean() - 0.2) < 0.06
+    # Same partition for a row whatever the other rows or its popularity
+    np.testing.assert_array_equal(hash_split(df[["track_id"]].iloc[::-1], SEED, 0.2), test[::-1])
+    relabeled = df.assign(popularity=100 - df["popularity"])
+    np.testing.assert_array_equal(hash_split(relabeled[["track_id"]], SEED, 0.2), test)
+    assert not np.array_equal(hash_split(df[["track_id"]], SEED + 1, 0.2), test)
+
+
+def test_stratified_hash_split_matches_the_fraction_per_stratum(cleaned):
+    _, df = cleaned
+    keys, popularity = df[["track_id"]], df["popularity"]
+    strata = popularity_strata(popularity, 4)
+    thresholds = strata_thresholds(split_buckets(keys, SEED), strata, 4, 0.25)
+    test = stratified_hash_split(keys, popularity, SEED, thresholds)
+    for stratum in range(4):
+        in_stratum = strata == stratum
+        assert abs(test[in_stratum].sum() - round(0.25 * in_stratum.sum())) <= 1
+
+
+@pytest.mark.parametrize("key_columns", [["track_id"], None])
+@pytest.mark.parametrize("stratify_bins", [None, 4])
+def test_split_in_chunks_matches_in_memory_split(tmp_path, cleaned, key_columns, stratify_bins):
+    path, df = cleaned
+    preprocessor = SongPreprocessor(high_cardinality_encoding="onehot").fit(df)
+    assert preprocessor.sparse_columns_
+    train_dir, test_dir = str(tmp_path / "train"), str(tmp_path / "test")
+    split = split_in_chunks(path, preprocessor, train_dir, test_dir, "parquet", SEED, 0.2, chunksize=37,
+                            key_columns=key_columns, stratify_bins=stratify_bins)
+
+    keys = df.drop(columns=["popularity"]) if key_columns is None else df[key_columns]
+    if stratify_bins:
+        test = stratified_hash_split(keys, df["popularity"], SEED, split["thresholds"])
+    else:
+        test = hash_split(keys, SEED, 0.2)
+    assert (split["train_rows"], split["test_rows"]) == ((~test).sum(), test.sum())
+
+    X = preprocessor.transform_frame(df)
+    X_sparse = preprocessor.transform_sparse(df, block="sparse")
+    for name, directory, rows in [("train", train_dir, ~test), ("test", test_dir, test)]:
+        result = read_table("{}/X_{}.parquet".format(directory, name))
+        pd.testing.assert_frame_equal(result, X[rows].reset_index(drop=True), check_dtype=False)
+        y = read_table("{}/y_{}.parquet".format(directory, name))["popularity"]
+        np.testing.assert_array_equal(y.to_numpy(), df["popularity"][rows].to_numpy())
+        onehot = read_sparse("{}/X_{}_onehot.npz".format(directory, name))
+        assert onehot.shape == (rows.sum(), len(preprocessor.sparse_feature_names_))
+        assert (onehot != X_sparse[rows]).nnz == 0
+
+
+def test_sparse_writer_matches_save_npz(tmp_path):
+    rng = np.random.default_rng(0)
+    blocks = [sparse.random(n, 30, density=0.1, format="csr", random_state=rng, dtype=np.float32)
+              for n in [5, 0, 17, 1]]
+    with SparseWriter(str(tmp_path / "onehot"), 30) as writer:
+        for block in blocks:
+            writer.write(block)
+    assert writer.rows == 23
+
+    result = read_sparse(str(tmp_path / "onehot.npz"))
+    expected = sparse.vstack(blocks, format="csr")
+    assert result.dtype == np.float32
+    assert result.shape == expected.shape
+    assert (result != expected).nnz == 0
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["onehot.npz"]
+    with pytest.raises(ValueError):
+        SparseWriter(str(tmp_path / "other"), 30).write(sparse.csr_matrix((2, 3)))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from stats import QUANTILES, SCALERS, StreamingStats, _quartiles, column_stats, fit_scaler
+
+COLUMNS = ["duration_ms", "loudness", "tempo"]
+
+
+def make_values(n_rows=5_000, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(30_000, 600_000, n_rows),
+        # Heavy left tail, as the loudness of the dataset
+        -rng.lognormal(1.5, 0.8, n_rows),
+        # Repeated values
+        rng.choice([90.0, 120.0, 128.0, 140.5], n_rows),
+    ]).astype(np.float64)
+
+
+@pytest.mark.parametrize("n_rows", [1, 2, 3, 4, 7, 1_000, 5_001])
+def test_quartiles_match_numpy_bit_for_bit(n_rows):
+    X = np.asfortranarray(make_values(n_rows, seed=n_rows))
+    np.testing.assert_array_equal(_quartiles(X), np.quantile(X, QUANTILES, axis=0))
+
+
+def test_column_stats_match_numpy():
+    X = make_values()
+    stats = column_stats(X, COLUMNS)
+    q1, median, q3 = np.quantile(X, QUANTILES, axis=0)
+    iqr = q3 - q1
+    outliers = ((X < q1 - 1.5 * iqr) | (X > q3 + 1.5 * iqr)).mean(axis=0) * 100
+    for i, col in enumerate(COLUMNS):
+        assert stats[col]["count"] == len(X)
+        assert (stats[col]["min"], stats[col]["max"]) == (X[:, i].min(), X[:, i].max())
+        assert (stats[col]["q1"], stats[col]["median"], stats[col]["q3"]) == (q1[i], median[i], q3[i])
+        np.testing.assert_allclose(stats[col]["mean"], X[:, i].mean(), rtol=1e-14)
+        np.testing.assert_allclose(stats[col]["var"], X[:, i].var(), rtol=1e-12)
+        np.testing.assert_allclose(stats[col]["outlier_pct"], outliers[i])
+
+
+def test_streaming_stats_match_column_stats():
+    X = make_values(20_000)
+    exact = column_stats(X, COLUMNS)
+    streaming = StreamingStats(COLUMNS)
+    for chunk in np.array_split(X, 13):
+        streaming.update(chunk)
+    result = streaming.result()
+    for i, col in enumerate(COLUMNS):
+        assert result[col]["count"] == exact[col]["count"]
+        assert (result[col]["min"], result[col]["max"]) == (exact[col]["min"], exact[col]["max"])
+        np.testing.assert_allclose(result[col]["mean"], exact[col]["mean"], rtol=1e-12)
+        np.testing.assert_allclose(result[col]["var"], exact[col]["var"], rtol=1e-10)
+        # The digest quartiles fall within a fraction of a percent of the rank of the exact ones
+        for name, q in zip(["q1", "median", "q3"], QUANTILES):
+            rank = np.mean(X[:, i] <= result[col][name])
+            assert abs(rank - q) < 0.005 or np.isin(result[col][name], X[:, i])
+        assert abs(result[col]["outlier_pct"] - exact[col]["outlier_pct"]) < 0.5
+
+
+def test_streaming_stats_without_rows():
+    with pytest.raises(ValueError):
+        StreamingStats(COLUMNS).result()
+
+
+@pytest.mark.parametrize("method", sorted(SCALERS))
+@pytest.mark.parametrize("constant", [False, True])
+def test_fit_scaler_transforms_like_a_fitted_scaler(method, constant):
+    X = make_values()[:, :1]
+    if constant:
+        X = np.full_like(X, 0.1)
+    scaler = fit_scaler(method, column_stats(X, ["x"])["x"])
+    fitted = SCALERS[method]().fit(X)
+
+    for attribute in ["scale_", "min_", "data_min_", "data_max_", "data_range_", "mean_", "var_", "center_"]:
+        if hasattr(fitted, attribute):
+            np.testing.assert_allclose(getattr(scaler, attribute), getattr(fitted, attribute), rtol=1e-12)
+    np.testing.assert_allclose(scaler.transform(X), fitted.transform(X), rtol=1e-12, atol=1e-12)
+    Z = fitted.transform(X)
+    np.testing.assert_allclose(scaler.inverse_transform(Z), X, rtol=1e-12)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cleaning import COLUMNS_TO_REMOVE, clean_dataframe, load_dataset
+from schema import load_table
+from streaming import RowHashSet, clean_in_chunks
+
+
+def test_row_hash_set_reports_first_occurrences():
+    rng = np.random.default_rng(0)
+    seen, reference = RowHashSet(), set()
+    for _ in range(20):
+        hashes = rng.integers(0, 2_000, 300).astype(np.uint64)
+        expected = []
+        for value in hashes.tolist():
+            expected.append(value not in reference)
+            reference.add(value)
+        assert seen.add(hashes).tolist() == expected
+    assert len(seen) == len(reference)
+    assert seen._hashes.tolist() == sorted(reference)
+
+
+def test_row_hash_set_find_and_persistence(tmp_path):
+    seen = RowHashSet()
+    seen.add(np.array([5, 1, 9], dtype=np.uint64))
+    path = str(tmp_path / "hashes.npy")
+    seen.save(path)
+
+    loaded = RowHashSet.load(path)
+    _, present = loaded.find(np.array([1, 2, 9, 10], dtype=np.uint64))
+    assert present.tolist() == [True, False, True, False]
+    assert loaded.add(np.array([9, 3, 3], dtype=np.uint64)).tolist() == [False, True, False]
+    assert len(loaded) == 4
+
+
+@pytest.mark.parametrize("chunksize", [7, 64, 10_000])
+def test_clean_in_chunks_matches_in_memory_cleaning(tmp_path, raw_csv, chunksize):
+    expected = clean_dataframe(load_dataset(raw_csv)).reset_index(drop=True)
+    summary = clean_in_chunks(raw_csv, str(tmp_path / "out" / "cleaned"), "parquet", chunksize, COLUMNS_TO_REMOVE)
+
+    result = load_table(summary["output_path"])
+    pd.testing.assert_frame_equal(result, expected)
+    assert summary["rows_saved"] == len(expected)
+    assert summary["duplicates_removed"] == 4
+    assert summary["missing_removed"] == 3
+
+
+def test_in_memory_cleaning_matches_pandas(raw_csv):
+    raw = pd.read_csv(raw_csv)
+    expected = raw.drop_duplicates().dropna().drop(columns=COLUMNS_TO_REMOVE)
+    result = clean_dataframe(load_dataset(raw_csv))
+    assert len(result) == len(expected)
+    np.testing.assert_allclose(result["tempo"].to_numpy(), expected["tempo"].to_numpy(), rtol=1e-6)
+    assert result["track_genre"].astype(str).tolist() == expected["track_genre"].tolist()